@@ -0,0 +1,96 @@
+"""Measures the memory held per queued song by Audio's records
+
+Compares the old QueuedSong/Song classes with the slotted ones.
+Needs Red's requirements (discord.py) installed.
+Usage: python benchmarks/audio_queue_memory.py [entries]
+"""
+import os
+import sys
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# cogs.audio imports these from __main__, i.e. red.py
+settings = SimpleNamespace(owner="0")
+
+
+async def send_cmd_help(ctx):
+    pass
+
+
+from cogs.audio import QueuedSong, Song  # noqa: E402
+
+
+class OldSong:
+    def __init__(self, **kwargs):
+        self.__dict__ = kwargs
+        self.title = kwargs.pop('title', None)
+        self.id = kwargs.pop('id', None)
+        self.url = kwargs.pop('url', None)
+        self.webpage_url = kwargs.pop('webpage_url', "")
+        self.duration = kwargs.pop('duration', 60)
+        self.start_time = kwargs.pop('start_time', None)
+        self.end_time = kwargs.pop('end_time', None)
+
+
+class OldQueuedSong:
+    def __init__(self, url, channel):
+        self.url = url
+        self.channel = channel
+
+
+def info_dict(i):
+    """Roughly what extract_info(url, process=False) gives for a video"""
+    video_id = "{:011d}".format(i)
+    return {
+        "id": video_id,
+        "title": "Some song number {}".format(i),
+        "url": "https://www.youtube.com/watch?v=" + video_id,
+        "webpage_url": "https://www.youtube.com/watch?v=" + video_id,
+        "duration": 200 + i % 100,
+        "uploader": "Uploader",
+        "view_count": 1000 + i,
+        "description": "A description. " * 40,
+        "tags": ["tag{}".format(t) for t in range(15)],
+        "thumbnails": [{"url": "https://i.ytimg.com/{}/{}.jpg".format(
+            video_id, t), "id": str(t)} for t in range(5)],
+        "formats": [{"format_id": str(f), "ext": "webm", "abr": 160,
+                     "url": "https://r1.googlevideo.com/videoplayback?id={}"
+                            "&itag={}&".format(video_id, f) + "x" * 400}
+                    for f in range(20)],
+    }
+
+
+def measure(make, n):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    records = [make(i) for i in range(n)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(s.size_diff for s in after.compare_to(before, "filename"))
+    del records
+    return size / n
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    channel = SimpleNamespace(id="123456789012345678", name="music")
+    urls = ["https://www.youtube.com/watch?v={:011d}".format(i)
+            for i in range(n)]
+
+    results = [
+        ("QueuedSong, old", measure(lambda i: OldQueuedSong(urls[i], channel),
+                                    n)),
+        ("QueuedSong, new", measure(lambda i: QueuedSong(urls[i], channel),
+                                    n)),
+        ("Song, old", measure(lambda i: OldSong(**info_dict(i)), n)),
+        ("Song, new", measure(lambda i: Song(**info_dict(i)), n)),
+    ]
+    print("{} entries (URL strings shared, not counted)".format(n))
+    for name, size in results:
+        print("{:16} {:10.0f} bytes/entry".format(name, size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Compares DataIO codecs on a synthetic bank and modlog
+
+Usage: python benchmarks/dataio_codecs.py [members] [rounds]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from cogs.utils.dataIO import DataIO, CODECS
+
+
+def make_bank(members, servers=10):
+    bank = {}
+    for i in range(members):
+        server = str(100000000000000000 + i % servers)
+        user = str(200000000000000000 + i)
+        bank.setdefault(server, {})[user] = {
+            "name": "user{}".format(i),
+            "balance": random.randint(0, 10**6),
+            "created_at": "2017-05-04 12:34:56"}
+    return bank
+
+
+def make_modlog(cases, servers=10):
+    modlog = {}
+    for i in range(cases):
+        server = str(100000000000000000 + i % servers)
+        n = str(len(modlog.get(server, {})) + 1)
+        modlog.setdefault(server, {})[n] = {
+            "case": int(n), "created": 1500000000.0 + i, "modified": None,
+            "action": random.choice(("Ban", "Kick", "Softban", "Unban")),
+            "channel": None, "user": "user{}#0001".format(i),
+            "user_id": str(200000000000000000 + i), "reason": "spam",
+            "moderator": "mod#0001", "moderator_id": "300000000000000000",
+            "amended_by": None, "amended_id": None,
+            "message": str(400000000000000000 + i), "until": None}
+    return modlog
+
+
+def bench(io, path, data, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        io.save_json(path, data)
+    save = (time.perf_counter() - start) / rounds
+    start = time.perf_counter()
+    for _ in range(rounds):
+        io.load_json(path)
+    load = (time.perf_counter() - start) / rounds
+    return save, load, os.path.getsize(path)
+
+
+def main():
+    members = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    documents = (("bank", make_bank(members)),
+                 ("modlog", make_modlog(members)))
+    io = DataIO()
+    print("{:<8} {:<8} {:>10} {:>10} {:>12}".format(
+        "doc", "codec", "save ms", "load ms", "bytes"))
+    with tempfile.TemporaryDirectory() as tmp:
+        for doc, data in documents:
+            path = os.path.join(tmp, doc + ".json")
+            for name in sorted(CODECS):
+                io.set_codec(name)
+                save, load, size = bench(io, path, data, rounds)
+                print("{:<8} {:<8} {:>10.1f} {:>10.1f} {:>12}".format(
+                    doc, name, save * 1000, load * 1000, size))
+
+
+if __name__ == "__main__":
+    main()
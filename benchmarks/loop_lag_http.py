@@ -0,0 +1,184 @@
+"""Measures event loop lag while cogs make HTTP requests
+
+Runs the same mix of requests two ways against a local server that
+answers after a delay: blocking (urllib and parsing on the loop, like
+economy, garpr, strawpoll and weebsh used to) and through the shared
+HTTPClient with parsing in an executor (what they do now). A
+LoopMonitor records the lag and every callback blocking the loop
+for 50ms or more.
+
+Usage: python benchmarks/loop_lag_http.py [rounds] [delay ms]
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.request
+from html.parser import HTMLParser
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from cogs.utils.async_ import Route, request
+from cogs.utils.httpclient import HTTPClient
+from cogs.utils.looplag import LoopMonitor
+
+PLAYERS = 3000  # Entries on the fake leaderboard page
+
+
+class LeaderboardParser(HTMLParser):
+    """Collects the text of <h3> tags, like economy's leaderboard"""
+
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+        self._in_h3 = False
+
+    def handle_starttag(self, tag, attrs):
+        self._in_h3 = tag == "h3"
+
+    def handle_endtag(self, tag):
+        self._in_h3 = False
+
+    def handle_data(self, data):
+        if self._in_h3:
+            self.lines.append(data)
+
+
+def leaderboard_text(html):
+    parser = LeaderboardParser()
+    parser.feed(html)
+    return "\n".join(parser.lines)
+
+
+def make_app(delay):
+    page = "<div class='list-group'>{}</div>".format("".join(
+        "<div><h3>#{}</h3><h3>user{}#0001</h3><h3>Level {}</h3></div>"
+        "".format(i, i, PLAYERS - i) for i in range(1, PLAYERS + 1)))
+
+    async def api(req):
+        await asyncio.sleep(delay)
+        return web.json_response({"id": 1, "type": "awoo", "nsfw": False,
+                                  "path": "/i/awoo.png"})
+
+    async def leaderboard(req):
+        await asyncio.sleep(delay)
+        return web.Response(text=page, content_type="text/html")
+
+    async def polls(req):
+        await req.read()
+        await asyncio.sleep(delay)
+        return web.json_response({"id": 42})
+
+    app = web.Application()
+    app.router.add_get("/api", api)
+    app.router.add_get("/leaderboard", leaderboard)
+    app.router.add_post("/polls", polls)
+    return app
+
+
+def serve(delay):
+    """Runs the server on its own thread and loop, returns its base URL"""
+    started = threading.Event()
+    address = []
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(make_app(delay))
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        loop.run_until_complete(site.start())
+        address.append(runner.addresses[0])
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    started.wait()
+    return "http://{}:{}/".format(*address[0])
+
+
+async def blocking_round(base):
+    async def api():
+        with urllib.request.urlopen(base + "api") as r:
+            return json.loads(r.read().decode("utf-8"))
+
+    async def leaderboard():
+        with urllib.request.urlopen(base + "leaderboard") as r:
+            return leaderboard_text(r.read().decode("utf-8"))
+
+    async def poll():
+        req = urllib.request.Request(
+            base + "polls", data=json.dumps({"title": "?"}).encode("utf-8"),
+            headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req) as r:
+            return json.loads(r.read().decode("utf-8"))
+
+    await asyncio.gather(api(), leaderboard(), poll())
+
+
+async def async_round(base, client, loop):
+    async def leaderboard():
+        html = await Route(base + "leaderboard", "").async_query(
+            client=client, read="text")
+        return await loop.run_in_executor(None, leaderboard_text, html)
+
+    await asyncio.gather(
+        Route(base + "api", "").async_query(client=client),
+        leaderboard(),
+        request(client, "POST", base + "polls", json={"title": "?"},
+                retries=0))
+
+
+def run(name, rounds, round_factory):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    monitor = LoopMonitor(loop, interval=0.01, threshold=0.05,
+                          log_interval=3600)
+    client = HTTPClient(loop)
+
+    async def main():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            await round_factory(client, loop)
+        elapsed = time.perf_counter() - start
+        await asyncio.sleep(0.05)
+        monitor.stop()
+        await client.close()
+        return elapsed
+
+    try:
+        elapsed = loop.run_until_complete(main())
+    finally:
+        loop.close()
+    lags = sorted(monitor.lags)
+    p95 = lags[min(len(lags) - 1, int(len(lags) * 0.95))] if lags else 0.0
+    worst = max((seconds for when, seconds, where
+                 in monitor.slow_callbacks), default=0.0)
+    print("{:<9} {:>7.0f} {:>8.1f} {:>8.1f} {:>6} {:>11.1f}".format(
+        name, elapsed * 1000, p95 * 1000, monitor.max_lag * 1000,
+        monitor.stats["slow_callbacks"], worst * 1000))
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    delay = (int(sys.argv[2]) if len(sys.argv) > 2 else 100) / 1000
+    logging.getLogger("red.metrics").setLevel(logging.ERROR)
+    base = serve(delay)
+    print("{} rounds of 3 requests, server delay {:.0f}ms"
+          "".format(rounds, delay * 1000))
+    print("{:<9} {:>7} {:>8} {:>8} {:>6} {:>11}".format(
+        "mode", "wall ms", "p95 lag", "max lag", "slow", "worst cb ms"))
+    run("blocking", rounds, lambda client, loop: blocking_round(base))
+    run("async", rounds,
+        lambda client, loop: async_round(base, client, loop))
+
+
+if __name__ == "__main__":
+    main()
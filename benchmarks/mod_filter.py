@@ -0,0 +1,54 @@
+"""Compares Mod's old per-word filter loop with the compiled WordFilter
+
+Usage: python benchmarks/mod_filter.py [words] [messages]
+"""
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from cogs.utils.wordfilter import WordFilter
+
+
+def random_word(min_len=3, max_len=10):
+    return "".join(random.choice(string.ascii_lowercase)
+                   for _ in range(random.randint(min_len, max_len)))
+
+
+def old_check(words, content):
+    for w in words:
+        if w in content.lower():
+            return w
+    return None
+
+
+def main():
+    n_words = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    n_messages = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    random.seed(26)
+    words = list({random_word() for _ in range(n_words)})
+    messages = [" ".join(random_word(1, 8) for _ in range(random.randint(3, 30)))
+                for _ in range(n_messages)]
+    filters = {"1": words}
+    word_filter = WordFilter(filters)
+
+    start = time.perf_counter()
+    old = [old_check(words, m) is not None for m in messages]
+    old_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    new = [word_filter.search("1", m) is not None for m in messages]
+    new_time = time.perf_counter() - start
+
+    assert old == new, "Results differ"
+    print("{} words, {} messages, {} matches".format(
+        len(words), n_messages, sum(new)))
+    print("loop:       {:8.2f} us/message".format(old_time / n_messages * 1e6))
+    print("WordFilter: {:8.2f} us/message".format(new_time / n_messages * 1e6))
+
+
+if __name__ == "__main__":
+    main()
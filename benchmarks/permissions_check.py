@@ -0,0 +1,73 @@
+"""Measures Permissions.resolve_permission per-check latency
+
+Needs Red's requirements (discord.py, tabulate) installed.
+Usage: python benchmarks/permissions_check.py [roles] [checks]
+"""
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# cogs.permissions imports these from __main__, i.e. red.py
+settings = SimpleNamespace(owner="0")
+
+
+async def send_cmd_help(ctx):
+    pass
+
+
+from cogs.permissions import Permissions  # noqa: E402
+
+
+def make_ctx(n_roles):
+    server = SimpleNamespace(id="1")
+    roles = [SimpleNamespace(id=str(100 + i), position=i, server=server,
+                             name="role{}".format(i))
+             for i in range(n_roles)]
+    server.roles = roles
+    author = SimpleNamespace(id="2", name="user", roles=roles[::2])
+    channel = SimpleNamespace(id="3", is_private=False, server=server)
+    message = SimpleNamespace(server=server, channel=channel, author=author)
+    command = SimpleNamespace(qualified_name="audio play", cog_name="Audio")
+    return SimpleNamespace(message=message, command=command)
+
+
+def make_cog(ctx):
+    cog = Permissions.__new__(Permissions)
+    cog._decisions = {}
+    roles = ctx.message.server.roles
+    cog.perms_we_want = {
+        "audio.play": {
+            "LOCKS": {"GLOBAL": False, "COGS": [], "SERVERS": {},
+                      "CHANNELS": {}},
+            "1": {"CHANNELS": {"3": "+audio.play"},
+                  "ROLES": {r.id: "-audio.play" for r in roles[:5]}}}}
+    cog._get_command = lambda cmd: ctx.command
+    return cog
+
+
+def main():
+    n_roles = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    n_checks = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    ctx = make_ctx(n_roles)
+    cog = make_cog(ctx)
+
+    start = time.perf_counter()
+    for _ in range(n_checks):
+        cog._resolve_permission(ctx, "audio.play")
+    uncached = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(n_checks):
+        cog.resolve_permission(ctx)
+    cached = time.perf_counter() - start
+
+    print("{} server roles, {} checks".format(n_roles, n_checks))
+    print("uncached: {:8.2f} us/check".format(uncached / n_checks * 1e6))
+    print("cached:   {:8.2f} us/check".format(cached / n_checks * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,27 @@ from discord.ext import commands
 from .utils.chat_formatting import box
 from .utils.dataIO import dataIO
 from .utils import checks
-from __main__ import user_allowed, send_cmd_help
-from copy import deepcopy
+from __main__ import send_cmd_help
 import os
 import discord
 
 
+class AliasedMessage:
+    """A message with its content replaced
+
+    Everything but content is read from the original message, so the
+    alias can be dispatched without copying the message"""
+
+    __slots__ = ("_message", "content")
+
+    def __init__(self, message, content):
+        self._message = message
+        self.content = content
+
+    def __getattr__(self, name):
+        return getattr(self._message, name)
+
+
 class Alias:
     def __init__(self, bot):
         self.bot = bot
@@ -114,28 +129,31 @@ class Alias:
         if len(message.content) < 2 or message.channel.is_private:
             return
 
-        msg = message.content
         server = message.server
-        prefix = self.get_prefix(server, msg)
+        if server.id not in self.aliases:
+            return
+
+        parsed = self.bot.parse_message(message)
+        prefix = parsed.prefix
 
         if not prefix:
             return
 
-        if server.id in self.aliases and user_allowed(message):
-            alias = self.first_word(msg[len(prefix):]).lower()
-            if alias in self.aliases[server.id]:
-                new_command = self.aliases[server.id][alias]
-                args = message.content[len(prefix + alias):]
-                new_message = deepcopy(message)
-                new_message.content = prefix + new_command + args
-                await self.bot.process_commands(new_message)
+        alias = parsed.invoked_with.lower()
+        if alias in self.aliases[server.id] and parsed.allowed:
+            new_command = self.aliases[server.id][alias]
+            args = message.content[len(prefix + alias):]
+            new_message = AliasedMessage(message,
+                                         prefix + new_command + args)
+            await self.bot.process_commands(new_message)
 
     def part_of_existing_command(self, alias, server):
         '''Command or alias'''
-        for command in self.bot.commands:
-            if alias.lower() == command.lower():
-                return True
-        return False
+        alias = alias.lower()
+        if alias in self.bot.commands:
+            return True
+        # Only needed for commands registered with uppercase letters
+        return any(alias == command.lower() for command in self.bot.commands)
 
     def remove_old(self):
         for sid in self.aliases:
@@ -163,11 +181,7 @@ class Alias:
         return msg.split(" ")[0]
 
     def get_prefix(self, server, msg):
-        prefixes = self.bot.settings.get_prefixes(server)
-        for p in prefixes:
-            if msg.startswith(p):
-                return p
-        return None
+        return self.bot.settings.match_prefix(server, msg)
 
 
 def check_folder():
@@ -1,9 +1,10 @@
 import discord
 from discord.ext import commands
+from discord.voice_client import StreamPlayer
 import threading
 import os
 from random import shuffle, choice
-from cogs.utils.dataIO import dataIO
+from cogs.utils.dataIO import dataIO, writebehind
 from cogs.utils import checks
 from cogs.utils.chat_formatting import pagify, escape
 from urllib.parse import urlparse
@@ -12,13 +13,18 @@ from json import JSONDecodeError
 import re
 import logging
 import collections
-import copy
 import asyncio
+import audioop
+import functools
+import json
+import itertools
 import math
+import stat
 import time
 import inspect
 import subprocess
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 
 __author__ = "tekulvw"
@@ -120,14 +126,10 @@ class deque(collections.deque):
         super().__init__(*args, **kwargs)
 
     def peek(self):
-        ret = self.pop()
-        self.append(ret)
-        return copy.deepcopy(ret)
+        return self[-1]
 
     def peekleft(self):
-        ret = self.popleft()
-        self.appendleft(ret)
-        return copy.deepcopy(ret)
+        return self[0]
 
 class QueueKey(Enum):
 	REPEAT = 1
@@ -139,20 +141,32 @@ class QueueKey(Enum):
 	NOW_PLAYING_CHANNEL = 7
 
 class Song:
+    """The fields of a youtube_dl info dict the cog uses, the rest of
+        the dict (formats, thumbnails...) isn't kept"""
+    __slots__ = ("title", "id", "url", "webpage_url", "duration",
+                 "start_time", "end_time", "creator", "uploader",
+                 "view_count", "is_playlist")
+
     def __init__(self, **kwargs):
-        self.__dict__ = kwargs
-        self.title = kwargs.pop('title', None)
-        self.id = kwargs.pop('id', None)
-        self.url = kwargs.pop('url', None)
-        self.webpage_url = kwargs.pop('webpage_url', "")
-        self.duration = kwargs.pop('duration', 60)
-        self.start_time = kwargs.pop('start_time', None)
-        self.end_time = kwargs.pop('end_time', None)
+        self.title = kwargs.get('title')
+        self.id = kwargs.get('id')
+        self.url = kwargs.get('url')
+        self.webpage_url = kwargs.get('webpage_url', "")
+        self.duration = kwargs.get('duration', 60)
+        self.start_time = kwargs.get('start_time')
+        self.end_time = kwargs.get('end_time')
+        self.creator = kwargs.get('creator')
+        self.uploader = kwargs.get('uploader')
+        self.view_count = kwargs.get('view_count')
+        self.is_playlist = 'entries' in kwargs
 
 class QueuedSong:
+    """A queue entry. The channel is kept by id, not as an object"""
+    __slots__ = ("url", "channel_id")
+
     def __init__(self, url, channel):
         self.url = url
-        self.channel = channel
+        self.channel_id = getattr(channel, "id", channel)
 
 class Playlist:
     def __init__(self, server=None, sid=None, name=None, author=None, url=None,
@@ -242,23 +256,671 @@ class Playlist:
             return None
 
 
-class Downloader(threading.Thread):
-    def __init__(self, url, max_duration=None, download=False,
-                 cache_path="data/audio/cache", *args, **kwargs):
-        super().__init__(*args, **kwargs)
+class CacheEntry:
+    __slots__ = ("size", "last_play", "plays")
+
+    def __init__(self, size, last_play, plays=0):
+        self.size = size
+        self.last_play = last_play
+        self.plays = plays
+
+
+class CacheIndex:
+    """Size and last play of every file in the audio cache
+
+    The cache folder is scanned once, then the index is kept up to date as
+    songs get downloaded, played and evicted, so checking the cache size
+    doesn't hit the disk."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}  # song id: CacheEntry
+        self.size = 0  # bytes
+        self.evictions = 0
+        self.scan()
+
+    def scan(self):
+        self.entries = {}
+        self.size = 0
+        names = set(os.listdir(self.path))
+        for name in names:
+            if name.endswith(OPUS_EXT):
+                if name[:-len(OPUS_EXT)] not in names:
+                    self._remove_file(name)  # Its song is gone
+                continue
+            self.add(name)
+
+    def add(self, song_id):
+        """Adds or refreshes the size of a file that's in the cache.
+            Its Opus artifact, if any, counts as part of it"""
+        try:
+            st = os.stat(os.path.join(self.path, song_id))
+        except OSError:
+            self.discard(song_id)
+            return
+        if not stat.S_ISREG(st.st_mode):
+            return
+        size = st.st_size
+        try:
+            size += os.path.getsize(self.artifact(song_id))
+        except OSError:
+            pass
+        entry = self.entries.get(song_id)
+        if entry is None:
+            # Never played since we know of it: as old as the file
+            self.entries[song_id] = CacheEntry(size, st.st_mtime)
+        else:
+            self.size -= entry.size
+            entry.size = size
+        self.size += size
+
+    def artifact(self, song_id):
+        return os.path.join(self.path, song_id + OPUS_EXT)
+
+    def _remove_file(self, name):
+        try:
+            os.remove(os.path.join(self.path, name))
+        except FileNotFoundError:
+            pass
+
+    def touch(self, song_id):
+        """Marks song_id as just played"""
+        if song_id not in self.entries:
+            self.add(song_id)
+        entry = self.entries.get(song_id)
+        if entry is not None:
+            entry.last_play = time.time()
+            entry.plays += 1
+
+    def discard(self, song_id):
+        entry = self.entries.pop(song_id, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def remove(self, song_id):
+        """Deletes song_id from the cache, returns the bytes freed"""
+        entry = self.entries.get(song_id)
+        if entry is None:
+            return 0
+        try:
+            self._remove_file(song_id)
+            self._remove_file(song_id + OPUS_EXT)
+        except OSError:
+            # In use (Windows) or not a file anymore, leave it be
+            return 0
+        self.discard(song_id)
+        self.evictions += 1
+        return entry.size
+
+    def evict(self, max_size, pinned=()):
+        """Removes the least recently played files until the cache fits
+            in max_size bytes. Files in pinned are never touched.
+            Returns the bytes freed"""
+        if self.size <= max_size:
+            return 0
+        candidates = [k for k in self.entries if k not in pinned]
+        # Least recently played first, least played first among equals
+        candidates.sort(key=lambda k: (self.entries[k].last_play,
+                                       self.entries[k].plays))
+        freed = 0
+        for song_id in candidates:
+            if self.size <= max_size:
+                break
+            freed += self.remove(song_id)
+        return freed
+
+
+class ExtractorPool:
+    """Bounded set of threads running every youtube_dl job of the cog
+
+    Each worker keeps its own YoutubeDL instance around. Jobs are queued
+    per server and workers take them round robin across servers, so a
+    server loading a 500 songs playlist doesn't starve the others."""
+
+    def __init__(self, workers=4):
+        self.workers = workers
+        self.stats = collections.Counter()
+        self.active = 0
+        self.total_wait = 0.0  # seconds jobs spent queued
+        self._queues = collections.OrderedDict()  # key: deque of jobs
+        self._cond = threading.Condition()
+        self._threads = []
+        self._local = threading.local()
+        self._closed = False
+
+    @property
+    def pending(self):
+        """Number of jobs waiting for a worker"""
+        with self._cond:
+            return sum(len(q) for q in self._queues.values())
+
+    def pending_by_key(self):
+        with self._cond:
+            return {k: len(q) for k, q in self._queues.items()}
+
+    def submit(self, key, fn, *args):
+        """Runs fn(*args) on a worker, returns an asyncio future of its
+            result. Must be called from the event loop"""
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        job = (fn, args, future, loop, time.perf_counter())
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("The extractor pool has been shut down")
+            self._queues.setdefault(key, collections.deque()).append(job)
+            self.stats["submitted"] += 1
+            if len(self._threads) < self.workers:
+                t = threading.Thread(target=self._worker, daemon=True,
+                                     name="audio-extractor-{}"
+                                     "".format(len(self._threads)))
+                self._threads.append(t)
+                t.start()
+            self._cond.notify()
+        return future
+
+    def youtube_dl(self, ratelimit=None):
+        """The calling worker's YoutubeDL instance
+
+        Each ratelimit (bytes/s) gets an instance of its own, built from
+        a copy of the options, so a limit never sticks to other jobs"""
+        instances = getattr(self._local, "yt", None)
+        if instances is None:
+            instances = self._local.yt = {}
+        yt = instances.get(ratelimit)
+        if yt is None:
+            options = dict(youtube_dl_options, ratelimit=ratelimit)
+            yt = instances[ratelimit] = youtube_dl.YoutubeDL(options)
+        return yt
+
+    def _next_job(self):
+        # Called with the lock held. The server served goes to the back
+        key, queue = next(iter(self._queues.items()))
+        job = queue.popleft()
+        if queue:
+            self._queues.move_to_end(key)
+        else:
+            del self._queues[key]
+        return job
+
+    def shutdown(self):
+        """Stops the workers once they're done with their current job
+
+        Queued jobs are cancelled. Must be called from the event loop"""
+        with self._cond:
+            self._closed = True
+            queues, self._queues = self._queues, collections.OrderedDict()
+            self._cond.notify_all()
+        for queue in queues.values():
+            for fn, args, future, loop, queued in queue:
+                future.cancel()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queues and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                fn, args, future, loop, queued = self._next_job()
+                self.total_wait += time.perf_counter() - queued
+                self.active += 1
+            result = exc = None
+            if not future.cancelled():
+                try:
+                    result = fn(*args)
+                except Exception as e:
+                    exc = e
+            with self._cond:
+                self.active -= 1
+                self.stats["completed"] += 1
+            loop.call_soon_threadsafe(self._resolve, future, result, exc)
+
+    @staticmethod
+    def _resolve(future, result, exc):
+        if future.done():
+            return
+        if exc is not None:
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
+
+    def get_metrics(self):
+        completed = self.stats["completed"]
+        return {"workers": len(self._threads),
+                "active": self.active,
+                "pending": self.pending,
+                "submitted": self.stats["submitted"],
+                "completed": completed,
+                "avg_wait": self.total_wait / completed if completed else 0.0}
+
+
+
+class FirstAudioTimer:
+    """Wraps a player's input to tell when the first audio comes out"""
+    __slots__ = ("stream", "callback")
+
+    def __init__(self, stream, callback):
+        self.stream = stream
+        self.callback = callback
+
+    def read(self, size):
+        data = self.stream.read(size)
+        if data and self.callback is not None:
+            callback, self.callback = self.callback, None
+            callback()
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+OPUS_EXT = ".opus"
+
+
+def read_ogg_opus(f):
+    """Yields the Opus packets of an Ogg Opus file, headers excluded"""
+    packet = b""
+    skip = 2  # OpusHead and OpusTags
+    while True:
+        header = f.read(27)
+        if len(header) < 27 or header[:4] != b"OggS":
+            return
+        segments = f.read(header[26])
+        for length in segments:
+            packet += f.read(length)
+            if length < 255:  # Last segment of the packet
+                if skip:
+                    skip -= 1
+                elif packet:
+                    yield packet
+                packet = b""
+
+
+def normalize_song(path, artifact, loudness=-16.0, bitrate="96k"):
+    """Measures path's loudness (EBU R128) and encodes it to an Ogg Opus
+        artifact at the target loudness, in the frames discord wants.
+        Runs ffmpeg twice, returns the measured integrated loudness"""
+    target = "loudnorm=I={}:TP=-1.5:LRA=11".format(loudness)
+    measure = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-nostats", "-i", path,
+         "-af", target + ":print_format=json", "-f", "null", "-"],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE, timeout=600)
+    stderr = measure.stderr.decode("utf-8", "replace")
+    try:
+        stats = json.loads(stderr[stderr.rindex("{"):stderr.rindex("}") + 1])
+    except ValueError:
+        raise RuntimeError("ffmpeg couldn't measure the loudness of "
+                           "{}".format(path))
+    measured = ("{}:measured_I={input_i}:measured_TP={input_tp}"
+                ":measured_LRA={input_lra}:measured_thresh={input_thresh}"
+                ":offset={target_offset}:linear=true".format(target, **stats))
+    tmp = artifact + ".tmp"
+    subprocess.run(
+        ["ffmpeg", "-hide_banner", "-nostats", "-y", "-i", path, "-vn",
+         "-af", measured, "-ar", "48000", "-ac", "2", "-c:a", "libopus",
+         "-b:a", bitrate, "-frame_duration", "20", "-f", "ogg", tmp],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL, timeout=600, check=True)
+    os.replace(tmp, artifact)
+    return float(stats["input_i"])
+
+
+class OpusPacketPlayer(StreamPlayer):
+    """Sends the packets of a pre-encoded Opus artifact as they are
+
+    No ffmpeg and no encoding. The volume can't be changed on encoded
+    audio, so this is only used at 100% volume"""
+
+    def __init__(self, path, client, after=None, **kwargs):
+        self.file = open(path, "rb")
+        packets = read_ogg_opus(self.file)
+        super().__init__(_PacketStream(packets), client.encoder,
+                         client._connected,
+                         functools.partial(client.play_audio, encode=False),
+                         after, **kwargs)
+
+    def _do_run(self):
+        self.loops = 0
+        self._start = time.time()
+        while not self._end.is_set():
+            if not self._resumed.is_set():
+                self._resumed.wait()
+
+            if not self._connected.is_set():
+                self.stop()
+                break
+
+            self.loops += 1
+            data = self.buff.read(self.frame_size)
+            if not data:
+                self.stop()
+                break
+
+            self.player(data)
+            next_time = self._start + self.delay * self.loops
+            delay = max(0, self.delay + (next_time - time.time()))
+            time.sleep(delay)
+
+    def stop(self):
+        super().stop()
+        self.file.close()
+
+
+class _PacketStream:
+    """read() hands out one packet, whatever the size asked"""
+    __slots__ = ("packets",)
+
+    def __init__(self, packets):
+        self.packets = packets
+
+    def read(self, size=None):
+        try:
+            return next(self.packets)
+        except (StopIteration, ValueError):  # ValueError: file closed
+            return b""
+
+
+class Broadcast(threading.Thread):
+    """One decoder playing a song to every server listening to it
+
+    ffmpeg decodes the song once and each frame is sent to all the
+    listeners. The volume is applied on the shared frame and listeners at
+    the same volume share the Opus encoding as well."""
+
+    def __init__(self, path, use_avconv=False, on_end=None):
+        super().__init__(daemon=True)
+        self.path = path
+        self.use_avconv = use_avconv
+        self.on_end = on_end
+        self.process = None
+        self.listeners = []
+        self._encoders = {}  # volume: Encoder, each one is a stream
+        self._lock = threading.Lock()
+        self._end = threading.Event()
+
+    def add(self, listener):
+        with self._lock:
+            if self._end.is_set():
+                return False
+            self.listeners.append(listener)
+            if not self.is_alive() and self.process is None:
+                self._start_process()
+                self.start()
+        return True
+
+    def remove(self, listener):
+        with self._lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+            if not self.listeners:
+                self._end.set()
+
+    def is_done(self):
+        return self._end.is_set()
+
+    def _start_process(self):
+        player = "avconv" if self.use_avconv else "ffmpeg"
+        self.process = subprocess.Popen(
+            [player, "-i", self.path, "-f", "s16le", "-ar", "48000",
+             "-ac", "2", "-loglevel", "warning", "pipe:1"],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE)
+
+    def _encoder(self, volume):
+        encoder = self._encoders.get(volume)
+        if encoder is None:
+            encoder = self._encoders[volume] = discord.opus.Encoder(48000, 2)
+        return encoder
+
+    def run(self):
+        frame_size = 3840  # 20 ms of 48 kHz stereo 16 bit audio
+        delay = 0.02
+        loops = 0
+        start = time.time()
+        try:
+            while not self._end.is_set():
+                data = self.process.stdout.read(frame_size)
+                if len(data) != frame_size:
+                    break
+                loops += 1
+
+                with self._lock:
+                    listeners = list(self.listeners)
+                groups = {}
+                for listener in listeners:
+                    if not listener.client._connected.is_set():
+                        listener.stop()
+                    elif listener.is_playing():
+                        volume = round(min(listener.volume, 2.0), 2)
+                        groups.setdefault(volume, []).append(listener)
+
+                for volume, group in groups.items():
+                    pcm = data
+                    if volume != 1.0:
+                        pcm = audioop.mul(data, 2, volume)
+                    encoder = self._encoder(volume)
+                    packet = encoder.encode(pcm, encoder.samples_per_frame)
+                    for listener in group:
+                        listener.send(packet)
+
+                next_time = start + delay * loops
+                time.sleep(max(0, delay + (next_time - time.time())))
+        finally:
+            with self._lock:
+                self._end.set()
+                listeners, self.listeners = self.listeners, []
+            try:
+                self.process.kill()
+            except ProcessLookupError:
+                pass
+            for listener in listeners:
+                listener.finish()
+            if self.on_end is not None:
+                self.on_end(self)
+
+
+class BroadcastPlayer:
+    """A voice client's end of a Broadcast, used like discord's players"""
+
+    def __init__(self, broadcast, client, after=None):
+        self.broadcast = broadcast
+        self.client = client
+        self.after = after
+        self.volume = 1.0
+        self._started = False
+        self._paused = False
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._started = True
+        if not self.broadcast.add(self):
+            self.finish()  # It ended in the meantime
+
+    def send(self, packet):
+        self.client.play_audio(packet, encode=False)
+
+    def pause(self):
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    def stop(self):
+        self.broadcast.remove(self)
+        self.finish()
+
+    def finish(self):
+        with self._lock:
+            if self._done.is_set():
+                return
+            self._done.set()
+        if self.after is not None:
+            self.after(self)
+
+    def is_playing(self):
+        return self._started and not self._paused and not self.is_done()
+
+    def is_done(self):
+        return self._done.is_set() or not self.client._connected.is_set()
+
+
+class MetadataCache:
+    """What youtube_dl told us about URLs and searches, kept on disk
+
+    Entries expire after ttl seconds (search_ttl for searches, as their
+    results change more often) and the oldest ones are dropped past
+    max_entries. Only used from the event loop."""
+
+    # Not "url": that's the media URL, which expires long before ttl
+    FIELDS = ("id", "title", "duration", "webpage_url", "start_time",
+              "end_time", "creator", "uploader", "view_count")
+
+    def __init__(self, path="data/audio/metadata.json", ttl=86400,
+                 search_ttl=3600, max_entries=10000):
+        self.path = path
+        self.ttl = ttl
+        self.search_ttl = search_ttl
+        self.max_entries = max_entries
+        self.stats = collections.Counter()
+        self._entries = None  # key: {"time": ..., "song": {...}}
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            if dataIO.is_valid_json(self.path):
+                entries = dataIO.load_json(self.path)
+            else:
+                entries = {}
+            # The file's keys are sorted, eviction needs them oldest first
+            self._entries = collections.OrderedDict(
+                sorted(entries.items(), key=lambda kv: kv[1]["time"]))
+        return self._entries
+
+    @staticmethod
+    def key(url):
+        if "[SEARCH:]" in url:
+            terms = url.replace("[SEARCH:]", "")
+            return "search:" + " ".join(terms.lower().split())
+        parts = urllib.parse.urlsplit(url.strip())
+        netloc = parts.netloc.lower()
+        for prefix in ("www.", "m."):
+            if netloc.startswith(prefix):
+                netloc = netloc[len(prefix):]
+        query = "&".join(sorted(parts.query.split("&"))) if parts.query \
+            else ""
+        return urllib.parse.urlunsplit(("https", netloc, parts.path,
+                                        query, ""))
+
+    def get(self, url):
+        """Returns a Song built from the cached metadata, or None"""
+        key = self.key(url)
+        entry = self.entries.get(key)
+        if entry is not None:
+            ttl = self.search_ttl if key.startswith("search:") else self.ttl
+            if time.time() - entry["time"] < ttl:
+                self.stats["hits"] += 1
+                return Song(**entry["song"])
+            del self._entries[key]
+            self._save()
+        self.stats["misses"] += 1
+        return None
+
+    def set(self, url, song):
+        if song.is_playlist:
+            return  # Not a song, and its entries would take way too much
+        if not getattr(song, "webpage_url", None):
+            return
+        fields = {}
+        for f in self.FIELDS:
+            value = getattr(song, f, None)
+            if value is not None:
+                fields[f] = value
+        key = self.key(url)
+        entries = self.entries
+        entries.pop(key, None)  # Reinserted last, as the newest
+        entries[key] = {"time": time.time(), "song": fields}
+        while len(entries) > self.max_entries:
+            del entries[next(iter(entries))]
+            self.stats["evicted"] += 1
+        self.stats["stored"] += 1
+        self._save()
+
+    def __contains__(self, url):
+        return self.key(url) in self.entries
+
+    def _save(self):
+        writebehind.mark_dirty(self.path, self.entries)
+
+
+metadata_cache = MetadataCache()
+
+
+class Downloader:
+    """Gets a song's info, and downloads it if asked to, on the
+        extractor pool. key is what the job is queued under, the server
+        id usually"""
+
+    def __init__(self, url, max_duration=None, download=False, key=None,
+                 cache_path="data/audio/cache", ratelimit=None,
+                 resolve=False, *, pool):
         self.url = url
+        self.pool = pool
+        self.query = url  # url gets replaced when a search is resolved
         self.max_duration = max_duration
+        self.key = key
+        self.cache_path = cache_path
+        self.ratelimit = ratelimit  # bytes/s, None is unlimited
+        self._resolve = resolve
+        self.stream_url = None
+        self.stream_headers = None
         self.done = threading.Event()
         self.song = None
         self._download = download
         self.hit_max_length = threading.Event()
         self._yt = None
         self.error = None
+        self.future = None
+
+    def start(self):
+        """Queues the job and returns a future resolving to self once
+            it's done. Info already in the metadata cache isn't fetched
+            again"""
+        if self.future is not None:
+            raise RuntimeError("Downloader already started")
+        song = metadata_cache.get(self.url)
+        if song is not None:
+            self.url = song.webpage_url or self.url
+            self.song = song
+            if not self._download and not self._resolve:
+                self.done.set()
+                self.future = asyncio.get_event_loop().create_future()
+                self.future.set_result(self)
+                return self.future
+        query = self.url
+        self.future = self.pool.submit(self.key, self.run)
+        if song is None:
+            self.future.add_done_callback(
+                lambda f: self._remember(f, query))
+        return self.future
+
+    def _remember(self, future, query):
+        if future.cancelled() or future.exception() is not None:
+            return
+        if self.song is not None and self.error is None:
+            metadata_cache.set(query, self.song)
+
+    def is_alive(self):
+        return self.future is not None and not self.done.is_set()
 
     def run(self):
+        self._yt = self.pool.youtube_dl()
         try:
-            self.get_info()
-            if self._download:
+            if self.song is None:
+                self.get_info()
+            if self._resolve:
+                self.resolve()
+            elif self._download:
                 self.download()
         except youtube_dl.utils.DownloadError as e:
             self.error = str(e)
@@ -266,15 +928,31 @@ class Downloader(threading.Thread):
             self.hit_max_length.set()
         except OSError as e:
             log.warning("An operating system error occurred while downloading URL '{}':\n'{}'".format(self.url, str(e)))
-        self.done.set()
+        finally:
+            self.done.set()
+        return self
 
     def download(self):
         self.duration_check()
 
-        if not os.path.isfile('data/audio/cache' + self.song.id):
-            video = self._yt.extract_info(self.url)
+        if not os.path.isfile(os.path.join(self.cache_path, self.song.id)):
+            yt = self.pool.youtube_dl(self.ratelimit)
+            video = yt.extract_info(self.url)
             self.song = Song(**video)
 
+    def resolve(self):
+        """Gets the URL of the media itself for ffmpeg to stream from,
+            unless the song is in the cache already"""
+        self.duration_check()
+
+        if os.path.isfile(os.path.join(self.cache_path, self.song.id)):
+            return
+        info = self._yt.extract_info(self.url, download=False)
+        if info.get("url") and info.get("protocol", "https") in ("http",
+                                                                  "https"):
+            self.stream_url = info["url"]
+            self.stream_headers = info.get("http_headers")
+
     def duration_check(self):
         log.debug("duration {} for songid {}".format(self.song.duration,
                                                      self.song.id))
@@ -285,7 +963,7 @@ class Downloader(threading.Thread):
 
     def get_info(self):
         if self._yt is None:
-            self._yt = youtube_dl.YoutubeDL(youtube_dl_options)
+            self._yt = self.pool.youtube_dl()
         if "[SEARCH:]" not in self.url:
             video = self._yt.extract_info(self.url, download=False,
                                           process=False)
@@ -311,15 +989,45 @@ class Audio:
         self.downloaders = {}  # sid: object
         self.settings = dataIO.load_json("data/audio/settings.json")
         self.server_specific_setting_keys = ["VOLUME", "VOTE_ENABLED",
-                                             "VOTE_THRESHOLD", "NOPPL_DISCONNECT"]
+                                             "VOTE_THRESHOLD", "NOPPL_DISCONNECT",
+                                             "PREFETCH", "STREAM", "BROADCAST"]
         self.cache_path = "data/audio/cache"
         self.local_playlist_path = "data/audio/localtracks"
+        self.cache_index = CacheIndex(self.cache_path)
+        self.extractor_pool = ExtractorPool()
         self._old_game = False
 
         self.skip_votes = {}
 
         self.connect_timers = {}
 
+        # Every server with a queue gets its own scheduler task, sleeping
+        # until something is enqueued or its player/downloader finishes
+        self._queue_events = {}  # sid: asyncio.Event
+        self._schedulers = {}  # sid: Task
+        self._player_finished = {}  # sid: perf_counter() of the last song end
+        self.song_gaps = collections.deque(maxlen=200)  # seconds
+
+        self._prefetches = {}  # sid: OrderedDict of url: Downloader
+        self._prefetch_deferred = set()  # sids held back by the budget
+        self.prefetch_stats = collections.Counter()
+        self.prefetch_wait_time = 0.0
+
+        self._streaming = {}  # sid: (player, url, channel) when streaming
+        self._stream_failed = set()  # urls to download instead
+        self.stream_stats = collections.Counter()
+        # Seconds from a song's turn to its first audio, by how it's played
+        self.first_audio = {mode: collections.deque(maxlen=200)
+                            for mode in ("stream", "cache", "opus", "local")}
+
+        self._normalizing = set()  # song ids
+        # One ffmpeg encode at a time, off the extractor pool
+        self._normalize_executor = ThreadPoolExecutor(max_workers=1)
+
+        self._broadcasts = {}  # cache filename: Broadcast
+        self.broadcast_stats = collections.Counter()
+        self.normalize_stats = collections.Counter()
+
         if player == "ffmpeg":
             self.settings["AVCONV"] = False
         elif player == "avconv":
@@ -339,29 +1047,36 @@ class Audio:
             self._setup_queue(server)
         queued_song = QueuedSong(url, channel)
         self.queue[server.id][QueueKey.QUEUE].append(queued_song)
+        self._wake_scheduler(server.id)
 
     def _add_to_temp_queue(self, server, url, channel):
         if server.id not in self.queue:
             self._setup_queue(server)
         queued_song = QueuedSong(url, channel)
         self.queue[server.id][QueueKey.TEMP_QUEUE].append(queued_song)
+        self._wake_scheduler(server.id)
 
     def _addleft_to_queue(self, server, url, channel):
         if server.id not in self.queue:
-            self._setup_queue()
+            self._setup_queue(server)
         queued_song = QueuedSong(url, channel)
         self.queue[server.id][QueueKey.QUEUE].appendleft(queued_song)
+        self._wake_scheduler(server.id)
 
-    def _cache_desired_files(self):
-        filelist = []
-        for server in self.downloaders:
-            song = self.downloaders[server].song
-            try:
-                filelist.append(song.id)
-            except AttributeError:
-                pass
-        shuffle(filelist)
-        return filelist
+    def _downloader(self, url, *args, **kwargs):
+        """A Downloader running its jobs on this cog's extractor pool"""
+        return Downloader(url, *args, pool=self.extractor_pool, **kwargs)
+
+    def _cache_downloaded(self, future):
+        """Adds what a download got to the cache index"""
+        if future.cancelled() or future.exception() is not None:
+            return
+        downloader = future.result()
+        if downloader.song is None or downloader.error is not None:
+            return
+        self.cache_index.add(downloader.song.id)
+        if self._cache_too_large():
+            self._dump_cache()
 
     def _cache_max(self):
         setting_max = self.settings["MAX_CACHE"]
@@ -371,22 +1086,31 @@ class Audio:
         x = self._server_count()
         return max([60, 48 * math.log(x) * x**0.3])  # log is not log10
 
-    def _cache_required_files(self):
-        queue = copy.deepcopy(self.queue)
-        filelist = []
-        for server in queue:
-            now_playing = queue[server].get(QueueKey.NOW_PLAYING)
+    def _cache_pinned(self):
+        """Song ids that can't be evicted: what's playing and what's
+            being downloaded to be played next"""
+        pinned = set()
+        for queue in self.queue.values():
+            now_playing = queue.get(QueueKey.NOW_PLAYING)
             try:
-                filelist.append(now_playing.id)
+                pinned.add(now_playing.id)
             except AttributeError:
                 pass
-        return filelist
+        for downloader in self.downloaders.values():
+            try:
+                pinned.add(downloader.song.id)
+            except AttributeError:
+                pass
+        for prefetches in self._prefetches.values():
+            for downloader in prefetches.values():
+                try:
+                    pinned.add(downloader.song.id)
+                except AttributeError:
+                    pass
+        return pinned
 
     def _cache_size(self):
-        songs = os.listdir(self.cache_path)
-        size = sum(map(lambda s: os.path.getsize(
-            os.path.join(self.cache_path, s)) / 10**6, songs))
-        return size
+        return self.cache_index.size / 10**6
 
     def _cache_too_large(self):
         if self._cache_size() > self._cache_max():
@@ -399,33 +1123,15 @@ class Audio:
         self.queue[server.id][QueueKey.QUEUE] = deque()
         self.queue[server.id][QueueKey.TEMP_QUEUE] = deque()
 
-    async def _create_ffmpeg_player(self, server, filename, local=False, start_time=None, end_time=None):
+    async def _create_ffmpeg_player(self, server, filename, local=False, start_time=None, end_time=None,
+                                    stream=False, headers=None):
         """This function will guarantee we have a valid voice client,
             even if one doesn't exist previously."""
-        voice_channel_id = self.queue[server.id][QueueKey.VOICE_CHANNEL_ID]
-        voice_client = self.voice_client(server)
+        voice_client = await self._guarantee_voice_client(server)
 
-        if voice_client is None:
-            log.debug("not connected when we should be in sid {}".format(
-                server.id))
-            to_connect = self.bot.get_channel(voice_channel_id)
-            if to_connect is None:
-                raise VoiceNotConnected("Okay somehow we're not connected and"
-                                        " we have no valid channel to"
-                                        " reconnect to. In other words...LOL"
-                                        " REKT.")
-            log.debug("valid reconnect channel for sid"
-                      " {}, reconnecting...".format(server.id))
-            await self._join_voice_channel(to_connect)  # SHIT
-        elif voice_client.channel.id != voice_channel_id:
-            # This was decided at 3:45 EST in #advanced-testing by 26
-            self.queue[server.id][QueueKey.VOICE_CHANNEL_ID] = voice_client.channel.id
-            log.debug("reconnect chan id for sid {} is wrong, fixing".format(
-                server.id))
-
-        # Okay if we reach here we definitively have a working voice_client
-
-        if local:
+        if stream:
+            song_filename = filename  # The media URL, ffmpeg reads it itself
+        elif local:
             song_filename = os.path.join(self.local_playlist_path, filename)
         else:
             song_filename = os.path.join(self.cache_path, filename)
@@ -439,23 +1145,22 @@ class Audio:
         print("using: "+options)
         before_options = ''
 
+        if stream and not use_avconv:
+            before_options += ('-reconnect 1 -reconnect_streamed 1'
+                               ' -reconnect_delay_max 5 ')
         if start_time:
             before_options += '-ss {}'.format(start_time)
         if end_time:
             options += ' -to {} -copyts'.format(end_time)
 
-        try:
-            voice_client.audio_player.process.kill()
-            log.debug("killed old player")
-        except AttributeError:
-            pass
-        except ProcessLookupError:
-            pass
+        self._kill_player(voice_client)
 
         log.debug("making player on sid {}".format(server.id))
 
         voice_client.audio_player = voice_client.create_ffmpeg_player(
-            song_filename, use_avconv=use_avconv, options=options, before_options=before_options)
+            song_filename, use_avconv=use_avconv, options=options,
+            before_options=before_options, headers=headers,
+            after=self._player_after(server.id))
 
         # Set initial volume
         vol = self.get_server_settings(server)['VOLUME'] / 100
@@ -463,6 +1168,89 @@ class Audio:
 
         return voice_client  # Just for ease of use, it's modified in-place
 
+    async def _create_opus_player(self, server, song_id):
+        """Same as _create_ffmpeg_player, for the song's Opus artifact"""
+        voice_client = await self._guarantee_voice_client(server)
+        self._kill_player(voice_client)
+
+        log.debug("making opus player on sid {}".format(server.id))
+
+        voice_client.audio_player = OpusPacketPlayer(
+            self.cache_index.artifact(song_id), voice_client,
+            after=self._player_after(server.id))
+
+        return voice_client
+
+    async def _create_broadcast_player(self, server, filename):
+        """Makes a player listening to the server's song, joining the
+            broadcast of another server already playing it if any"""
+        voice_client = await self._guarantee_voice_client(server)
+        self._kill_player(voice_client)
+
+        broadcast = self._broadcasts.get(filename)
+        if broadcast is None or broadcast.is_done():
+            log.debug("new broadcast of {} for sid {}".format(filename,
+                                                              server.id))
+            loop = self.bot.loop
+            broadcast = Broadcast(
+                os.path.join(self.cache_path, filename),
+                use_avconv=self.settings["AVCONV"],
+                on_end=lambda b: loop.call_soon_threadsafe(
+                    self._broadcast_ended, filename, b))
+            self._broadcasts[filename] = broadcast
+            self.broadcast_stats["decoders"] += 1
+        else:
+            log.debug("sid {} joins the broadcast of {}".format(server.id,
+                                                                filename))
+            self.broadcast_stats["joined"] += 1
+
+        player = BroadcastPlayer(broadcast, voice_client,
+                                 after=self._player_after(server.id))
+        player.volume = self.get_server_settings(server)['VOLUME'] / 100
+        voice_client.audio_player = player
+
+        return voice_client
+
+    def _broadcast_ended(self, filename, broadcast):
+        if self._broadcasts.get(filename) is broadcast:
+            del self._broadcasts[filename]
+
+    def _kill_player(self, voice_client):
+        try:
+            voice_client.audio_player.process.kill()
+            log.debug("killed old player")
+        except AttributeError:
+            # No player, or one without a process
+            if hasattr(voice_client, 'audio_player'):
+                voice_client.audio_player.stop()
+        except ProcessLookupError:
+            pass
+
+    async def _guarantee_voice_client(self, server):
+        voice_channel_id = self.queue[server.id][QueueKey.VOICE_CHANNEL_ID]
+        voice_client = self.voice_client(server)
+
+        if voice_client is None:
+            log.debug("not connected when we should be in sid {}".format(
+                server.id))
+            to_connect = self.bot.get_channel(voice_channel_id)
+            if to_connect is None:
+                raise VoiceNotConnected("Okay somehow we're not connected and"
+                                        " we have no valid channel to"
+                                        " reconnect to. In other words...LOL"
+                                        " REKT.")
+            log.debug("valid reconnect channel for sid"
+                      " {}, reconnecting...".format(server.id))
+            await self._join_voice_channel(to_connect)  # SHIT
+        elif voice_client.channel.id != voice_channel_id:
+            # This was decided at 3:45 EST in #advanced-testing by 26
+            self.queue[server.id][QueueKey.VOICE_CHANNEL_ID] = voice_client.channel.id
+            log.debug("reconnect chan id for sid {} is wrong, fixing".format(
+                server.id))
+
+        # Okay if we reach here we definitively have a working voice_client
+        return self.voice_client(server)
+
     # TODO: _current_playlist
 
     # TODO: _current_song
@@ -487,18 +1275,21 @@ class Audio:
 
         await voice_client.disconnect()
 
-    async def _download_all(self, queued_song_list, channel):
+    async def _download_all(self, queued_song_list, channel, max_jobs=2):
         """
         Doesn't actually download, just get's info for uses like queue_list
+        No more than max_jobs are on the extractor pool at once
         """
-        downloaders = []
-        for queued_song in queued_song_list:
-            d = Downloader(queued_song.url)
+        downloaders = [self._downloader(queued_song.url,
+                                        key=channel.server.id)
+                       for queued_song in queued_song_list]
+        for i, d in enumerate(downloaders):
+            if i >= max_jobs:
+                await self._wait_downloader(downloaders[i - max_jobs])
             d.start()
-            downloaders.append(d)
 
-        while any([d.is_alive() for d in downloaders]):
-            await asyncio.sleep(0.1)
+        for d in downloaders[-max_jobs:]:
+            await self._wait_downloader(d)
             
         songs = [d.song for d in downloaders if d.song is not None and d.error is None]
            
@@ -510,63 +1301,15 @@ class Audio:
 
         return songs
 
-    async def _download_next(self, server, curr_dl, next_dl):
-        """Checks to see if we need to download the next, and does.
-
-        Both curr_dl and next_dl should already be started."""
-        if curr_dl.song is None:
-            # Only happens when the downloader thread hasn't initialized fully
-            #   There's no reason to wait if we can't compare
-            return
-
-        max_length = self.settings["MAX_LENGTH"]
-
-        while next_dl.is_alive():
-            await asyncio.sleep(0.5)
-            
-        error = next_dl.error
-        if(error is not None):
-            raise YouTubeDlError(error)
-
-        if curr_dl.song.id != next_dl.song.id:
-            log.debug("downloader ID's mismatch on sid {}".format(server.id) +
-                      " gonna start dl-ing the next thing on the queue"
-                      " id {}".format(next_dl.song.id))
-            try:
-                next_dl.duration_check()
-            except MaximumLength:
-                return
-            self.downloaders[server.id] = Downloader(next_dl.url, max_length,
-                                                     download=True)
-            self.downloaders[server.id].start()
-
-    def _dump_cache(self, ignore_desired=False):
-        reqd = self._cache_required_files()
-        log.debug("required cache files:\n\t{}".format(reqd))
+    def _dump_cache(self, everything=False):
+        """Evicts the least recently played songs until the cache is back
+            under its maximum size, or every song that isn't pinned if
+            everything is True. Returns the MB freed"""
+        pinned = self._cache_pinned()
+        log.debug("pinned cache files:\n\t{}".format(pinned))
 
-        opt = self._cache_desired_files()
-        log.debug("desired cache files:\n\t{}".format(opt))
-
-        prev_size = self._cache_size()
-
-        for file in os.listdir(self.cache_path):
-            if file not in reqd:
-                if ignore_desired or file not in opt:
-                    try:
-                        os.remove(os.path.join(self.cache_path, file))
-                    except OSError:
-                        # A directory got in the cache?
-                        pass
-                    except WindowsError:
-                        # Removing a file in use, reqd failed
-                        pass
-
-        post_size = self._cache_size()
-        dumped = prev_size - post_size
-
-        if not ignore_desired and self._cache_too_large():
-            log.debug("must dump desired files")
-            return dumped + self._dump_cache(ignore_desired=True)
+        max_size = 0 if everything else self._cache_max() * 10**6
+        dumped = self.cache_index.evict(max_size, pinned) / 10**6
 
         log.debug("dumped {} MB of audio files".format(dumped))
 
@@ -635,16 +1378,26 @@ class Audio:
 
     async def _guarantee_downloaded(self, server, url):
         max_length = self.settings["MAX_LENGTH"]
+        started = time.perf_counter()
+        prefetched = self._prefetches.get(server.id, {}).pop(url, None)
+        if prefetched is not None:
+            log.debug("sid {} prefetched {}".format(server.id, url))
+            self.downloaders[server.id] = prefetched
+        # Whether playback is held up by a download
+        waited = prefetched is not None and not prefetched.done.is_set()
+
         if server.id not in self.downloaders:  # We don't have a downloader
             log.debug("sid {} not in downloaders, making one".format(
                 server.id))
-            self.downloaders[server.id] = Downloader(url, max_length)
+            self.downloaders[server.id] = self._downloader(url, max_length,
+                                                           key=server.id)
 
-        if self.downloaders[server.id].url != url:  # Our downloader is old
+        if self.downloaders[server.id].query != url:  # Our downloader is old
             # I'm praying to Jeezus that we don't accidentally lose a running
             #   Downloader
             log.debug("sid {} in downloaders but wrong url".format(server.id))
-            self.downloaders[server.id] = Downloader(url, max_length)
+            self.downloaders[server.id] = self._downloader(url, max_length,
+                                                           key=server.id)
 
         try:
             # We're assuming we have the right thing in our downloader object
@@ -655,8 +1408,8 @@ class Audio:
             pass
 
         # Getting info w/o download
-        self.downloaders[server.id].done.wait()
-        
+        await self._wait_downloader(self.downloaders[server.id])
+
         # Youtube-DL threw an exception.
         error = self.downloaders[server.id].error
         if(error is not None):
@@ -672,17 +1425,21 @@ class Audio:
         cache_location = os.path.join(self.cache_path, song.id)
         if not os.path.exists(cache_location):
             log.debug("cache miss on song id {}".format(song.id))
-            self.downloaders[server.id] = Downloader(url, max_length,
-                                                     download=True)
-            self.downloaders[server.id].start()
+            waited = True
+            self._start_download(server, url, max_length)
 
-            while self.downloaders[server.id].is_alive():
-                await asyncio.sleep(0.5)
+            await self._wait_downloader(self.downloaders[server.id])
 
             song = self.downloaders[server.id].song
         else:
             log.debug("cache hit on song id {}".format(song.id))
 
+        if waited:
+            self.prefetch_stats["waited"] += 1
+            self.prefetch_wait_time += time.perf_counter() - started
+        else:
+            self.prefetch_stats["ready"] += 1
+
         return song
 
     def _is_queue_playlist(self, server):
@@ -761,7 +1518,7 @@ class Audio:
     def _make_local_song(self, filename):
         # filename should be playlist_folder/file_name
         folder, song = os.path.split(filename)
-        return Song(name=song, id=filename, title=song, url=filename,
+        return Song(id=filename, title=song, url=filename,
                     webpage_url=filename)
 
     def _make_playlist(self, author, url, songlist):
@@ -786,6 +1543,16 @@ class Audio:
             return True
         return False
 
+    def _is_playlist_url(self, url):
+        """Whether url is a playlist itself, not a song that happens to
+            be in one"""
+        parsed = urlparse(url)
+        if self._match_yt_url(url):
+            return parsed.path.rstrip("/") == "/playlist"
+        if self._match_sc_url(url):
+            return "/sets/" in parsed.path
+        return False
+
     def _match_sc_url(self, url):
         sc_url = re.compile(
             r'^(https?\:\/\/)?(www\.)?(soundcloud\.com\/)')
@@ -808,60 +1575,139 @@ class Audio:
 
     # TODO: _next_songs_in_queue
 
-    async def _parse_playlist(self, url):
+    async def _parse_playlist(self, url, server=None, on_batch=None,
+                              progress=None):
+        """Returns the URLs of a playlist's songs
+
+        youtube_dl pages through the playlist on the extractor pool and
+        the URLs come back in batches as they're found, the first one
+        being small. on_batch, if passed, is awaited with every batch and
+        can return False to stop the enumeration. progress is a message
+        that gets edited with the count every few seconds."""
         if self._match_sc_playlist(url):
-            return await self._parse_sc_playlist(url)
+            entry_url = self._sc_entry_url
         elif self._match_yt_playlist(url):
-            return await self._parse_yt_playlist(url)
-        raise InvalidPlaylist("The given URL is neither a Soundcloud or"
-                              " YouTube playlist.")
-
-    async def _parse_sc_playlist(self, url):
+            entry_url = self._yt_entry_url
+        else:
+            raise InvalidPlaylist("The given URL is neither a Soundcloud or"
+                                  " YouTube playlist.")
+
+        batches = asyncio.Queue()
+        stop = threading.Event()
+        job = self.extractor_pool.submit(getattr(server, "id", None),
+                                         self._read_playlist, url, entry_url,
+                                         self.bot.loop, batches, stop)
         playlist = []
-        d = Downloader(url)
-        d.start()
-
-        while d.is_alive():
-            await asyncio.sleep(0.5)
-
-        error = d.error
-        if(error is not None):
-            raise YouTubeDlError(error)
-
-        for entry in d.song.entries:
-            if entry["url"][4] != "s":
-                song_url = "https{}".format(entry["url"][4:])
-                playlist.append(song_url)
-            else:
-                playlist.append(entry.url)
+        last_edit = time.perf_counter()
+        try:
+            while True:
+                batch = await batches.get()
+                if batch is None:
+                    break
+                playlist.extend(batch)
+                if on_batch is not None and await on_batch(batch) is False:
+                    break
+                now = time.perf_counter()
+                if progress is not None and now - last_edit > 3:
+                    last_edit = now
+                    await self.bot.edit_message(
+                        progress, "Enumerating song list... {} songs so far."
+                                  "".format(len(playlist)))
+        finally:
+            stop.set()
+        await job  # Raises whatever went wrong in there
+
+        log.debug("song list has {} songs".format(len(playlist)))
 
         return playlist
 
-    async def _parse_yt_playlist(self, url):
-        d = Downloader(url)
-        d.start()
-        playlist = []
+    def _read_playlist(self, url, entry_url, loop, batches, stop,
+                       first_batch=5, batch_size=100):
+        # Runs on the extractor pool. With process=False youtube_dl hands
+        # entries out lazily, fetching the pages as they're needed
+        yt = self.extractor_pool.youtube_dl()
+        batch = []
+        size = first_batch
+        try:
+            info = yt.extract_info(url, download=False, process=False)
+            for entry in info.get("entries") or ():
+                if stop.is_set():
+                    break
+                song_url = entry_url(entry)
+                if song_url is None:
+                    continue
+                batch.append(song_url)
+                if len(batch) >= size:
+                    loop.call_soon_threadsafe(batches.put_nowait, batch)
+                    batch = []
+                    size = batch_size
+        except youtube_dl.utils.DownloadError as e:
+            raise YouTubeDlError(str(e))
+        finally:
+            if batch:
+                loop.call_soon_threadsafe(batches.put_nowait, batch)
+            loop.call_soon_threadsafe(batches.put_nowait, None)
+
+    @staticmethod
+    def _sc_entry_url(entry):
+        try:
+            entry_url = entry["url"]
+        except (KeyError, TypeError):
+            return None
+        if entry_url[4] != "s":
+            return "https{}".format(entry_url[4:])
+        return entry_url
 
-        while d.is_alive():
-            await asyncio.sleep(0.5)
+    @staticmethod
+    def _yt_entry_url(entry):
+        try:
+            return "https://www.youtube.com/watch?v={}".format(entry["id"])
+        except (KeyError, TypeError):
+            return None
 
-        error = d.error
-        if(error is not None):
-            raise YouTubeDlError(error)
+    async def _stream_playlist(self, server, url, channel):
+        """Queues a playlist's songs while it's being enumerated, so the
+            first ones start playing right away"""
+        if server.id not in self.queue:
+            self._setup_queue(server)
+        queue = self.queue[server.id][QueueKey.QUEUE]
+        progress = await self.bot.send_message(channel, "Enumerating song"
+                                                        " list...")
 
-        for entry in d.song.entries:
-            try:
-                song_url = "https://www.youtube.com/watch?v={}".format(
-                    entry['id'])
-                playlist.append(song_url)
-            except AttributeError:
-                pass
-            except TypeError:
-                pass
+        queued = 0
+        stopped = False
 
-        log.debug("song list:\n\t{}".format(playlist))
+        async def on_batch(batch):
+            nonlocal queued, stopped
+            if self.queue.get(server.id, {}).get(QueueKey.QUEUE) is not queue:
+                stopped = True
+                return False  # Stopped or replaced in the meantime
+            self._extend_queue(server, batch, channel)
+            queued += len(batch)
 
-        return playlist
+        try:
+            await self._parse_playlist(url, server, on_batch, progress)
+        except YouTubeDlError as e:
+            await self.bot.edit_message(
+                progress, "An error occurred while enumerating the "
+                          "playlist:\n'{}'".format(str(e)))
+            return
+        except Exception:
+            # Songs queued so far stay queued
+            log.exception("Enumerating playlist {} failed".format(url))
+            await self.bot.edit_message(
+                progress, "An error occurred while enumerating the "
+                          "playlist, {} songs were queued."
+                          "".format(queued))
+            return
+        # The playlist's songs aren't all queued if it stopped early
+        if stopped:
+            await self.bot.edit_message(
+                progress, "The queue was stopped while enumerating the "
+                          "playlist, {} songs were queued.".format(queued))
+        else:
+            await self.bot.edit_message(progress, "Queued {} songs."
+                                                  "".format(queued))
 
     async def _play(self, sid, url, channel):
         """Returns the song object of what's playing"""
@@ -873,23 +1719,38 @@ class Audio:
         assert type(server) is discord.Server
         log.debug('starting to play on "{}"'.format(server.name))
 
+        started = time.perf_counter()
+        stream_url = headers = None
         if self._valid_playable_url(url) or "[SEARCH:]" in url:
             clean_url = self._clean_url(url)
             try:
-                song = await self._guarantee_downloaded(server, url)
+                resolved = None
+                if self.get_server_settings(server)["STREAM"] and \
+                        url not in self._stream_failed:
+                    resolved = await self._resolve_stream(server, url)
+                if resolved is not None:
+                    song = resolved.song
+                    stream_url = resolved.stream_url
+                    headers = resolved.stream_headers
+                else:
+                    song = await self._guarantee_downloaded(server, url)
             except YouTubeDlError as e:
                 message = ("I'm unable to play '{}' because of an error:\n"
                           "'{}'".format(clean_url, str(e)))
                 message = escape(message, mass_mentions=True)
-                await self.bot.send_message(channel, message)
+                if channel is not None:
+                    await self.bot.send_message(channel, message)
                 return
             except MaximumLength:
                 message = ("I'm unable to play '{}' because it exceeds the "
                           "maximum audio length.".format(clean_url))
                 message = escape(message, mass_mentions=True)
-                await self.bot.send_message(channel, message)
+                if channel is not None:
+                    await self.bot.send_message(channel, message)
                 return
             local = False
+            if stream_url is None:
+                self.cache_index.touch(song.id)
         else:  # Assume local
             try:
                 song = self._make_local_song(url)
@@ -897,15 +1758,53 @@ class Audio:
             except FileNotFoundError:
                 raise
 
-        voice_client = await self._create_ffmpeg_player(server, song.id,
-                                                        local=local,
-                                                        start_time=song.start_time,
-                                                        end_time=song.end_time)
+        artifact = None
+        if not local and stream_url is None:
+            artifact = self._normalized_artifact(server, song)
+        broadcast = (not local and stream_url is None and
+                     self.get_server_settings(server)["BROADCAST"] and
+                     not song.start_time and not song.end_time)
+
+        if broadcast:
+            filename = song.id + OPUS_EXT if artifact else song.id
+            voice_client = await self._create_broadcast_player(server,
+                                                               filename)
+        elif artifact == "opus":
+            voice_client = await self._create_opus_player(server, song.id)
+        else:
+            filename = stream_url or song.id
+            if artifact == "ffmpeg":
+                filename += OPUS_EXT  # Still loudness normalized
+            voice_client = await self._create_ffmpeg_player(server, filename,
+                                                            local=local,
+                                                            start_time=song.start_time,
+                                                            end_time=song.end_time,
+                                                            stream=stream_url is not None,
+                                                            headers=headers)
         # That ^ creates the audio_player property
 
-        voice_client.audio_player.start()
+        player = voice_client.audio_player
+        if stream_url is not None:
+            self._streaming[server.id] = (player, url, channel)
+            mode = "stream"
+        else:
+            self._streaming.pop(server.id, None)
+            mode = "local" if local else "cache"
+            if artifact == "opus":
+                mode = "opus"
+        if hasattr(player, "buff"):  # Broadcasts have their own
+            loop = self.bot.loop
+            player.buff = FirstAudioTimer(
+                player.buff, lambda: loop.call_soon_threadsafe(
+                    self._first_audio, mode, started))
+
+        player.start()
         log.debug("starting player on sid {}".format(server.id))
 
+        finished = self._player_finished.pop(server.id, None)
+        if finished is not None:
+            self.song_gaps.append(time.perf_counter() - finished)
+
         return song
 
     def _play_playlist(self, server, playlist, channel):
@@ -951,8 +1850,7 @@ class Audio:
 
     def _player_count(self):
         count = 0
-        queue = copy.deepcopy(self.queue)
-        for sid in queue:
+        for sid in list(self.queue):
             server = self.bot.get_server(sid)
             try:
                 vc = self.voice_client(server)
@@ -1023,12 +1921,20 @@ class Audio:
     def _server_count(self):
         return max([1, len(self.bot.servers)])
 
+    def _extend_queue(self, server, urls, channel):
+        if server.id not in self.queue:
+            self._setup_queue(server)
+        self.queue[server.id][QueueKey.QUEUE].extend(
+            QueuedSong(url, channel) for url in urls)
+        self._wake_scheduler(server.id)
+
     def _set_queue(self, server, songlist):
         if server.id in self.queue:
             self._clear_queue(server)
         else:
             self._setup_queue(server)
         self.queue[server.id][QueueKey.QUEUE].extend(songlist)
+        self._wake_scheduler(server.id)
 
     def _set_queue_channel(self, server, channel):
         if server.id not in self.queue:
@@ -1066,10 +1972,186 @@ class Audio:
                                  QueueKey.QUEUE: deque(), QueueKey.TEMP_QUEUE: deque(),
                                  QueueKey.NOW_PLAYING: None, QueueKey.NOW_PLAYING_CHANNEL: None}
 
+    def _prefetch(self, server):
+        """Starts downloading the next songs in the queue, up to the
+            server's prefetch depth and within the global budget"""
+        server_settings = self.get_server_settings(server)
+        if server_settings["STREAM"]:
+            return  # Media URLs expire, nothing worth getting ahead
+        depth = server_settings["PREFETCH"]
+        queue = self.queue[server.id]
+        upcoming = [q.url for q in itertools.islice(
+            itertools.chain(queue[QueueKey.TEMP_QUEUE], queue[QueueKey.QUEUE]),
+            depth)]
+        prefetches = self._prefetches.setdefault(server.id,
+                                                 collections.OrderedDict())
+
+        # Songs that aren't coming up anymore
+        for url in [u for u in prefetches if u not in upcoming]:
+            prefetches.pop(url).future.cancel()
+
+        self._prefetch_deferred.discard(server.id)
+        max_length = self.settings["MAX_LENGTH"]
+        for url in upcoming:
+            if url in prefetches or not self._valid_prefetch_url(url):
+                continue
+            if self._prefetch_running() >= self.settings["PREFETCH_MAX"]:
+                self.prefetch_stats["deferred"] += 1
+                self._prefetch_deferred.add(server.id)
+                break
+            downloader = self._downloader(
+                url, max_length, download=True, key=server.id,
+                ratelimit=self._prefetch_ratelimit())
+            prefetches[url] = downloader
+            future = downloader.start()
+            future.add_done_callback(self._cache_downloaded)
+            future.add_done_callback(
+                functools.partial(self._prefetch_done, server.id, url))
+            self.prefetch_stats["started"] += 1
+
+    def _prefetch_done(self, sid, url, future):
+        # A slot in the budget is free, servers that were held back can go
+        for deferred in list(self._prefetch_deferred):
+            self._wake_scheduler(deferred)
+        if future.cancelled():
+            return
+        exc = future.exception()
+        if exc is not None:
+            log.error("Prefetching {} on sid {} failed".format(url, sid),
+                      exc_info=(type(exc), exc, exc.__traceback__))
+            error = str(exc)
+        else:
+            error = future.result().error
+        if error is not None:
+            self.prefetch_stats["failed"] += 1
+            self.bot.loop.create_task(
+                self._prefetch_failed(sid, url, error))
+
+    async def _prefetch_failed(self, sid, url, error):
+        """Takes a song that can't be downloaded out of the queue"""
+        queue = self.queue.get(sid)
+        if queue is None:
+            return
+        for key in (QueueKey.TEMP_QUEUE, QueueKey.QUEUE):
+            queued_song = next((q for q in queue[key] if q.url == url), None)
+            if queued_song is not None:
+                queue[key].remove(queued_song)
+                break
+        else:
+            return  # Not coming up anymore
+        self._prefetches.get(sid, {}).pop(url, None)
+        channel = self.bot.get_channel(queued_song.channel_id)
+        if channel is None:
+            return
+        message = ("I'm unable to play '{}' because of an error:\n"
+                   "'{}'".format(self._clean_url(url), error))
+        message = escape(message, mass_mentions=True)
+        await self.bot.send_message(channel, message)
+
+    def _prefetch_ratelimit(self):
+        total = self.settings["PREFETCH_RATELIMIT"]  # KB/s, 0 is unlimited
+        if not total:
+            return None
+        return total * 1000 // max(1, self.settings["PREFETCH_MAX"])
+
+    def _prefetch_running(self):
+        return sum(1 for prefetches in self._prefetches.values()
+                   for d in prefetches.values() if d.is_alive())
+
+    def _valid_prefetch_url(self, url):
+        return self._valid_playable_url(url) or "[SEARCH:]" in url
+
+    def _stream_fallback(self, sid, url, channel):
+        """Plays url again, from the cache this time"""
+        log.warning("streaming {} failed on sid {}, falling back to"
+                    " downloading it".format(url, sid))
+        self.stream_stats["fallbacks"] += 1
+        if len(self._stream_failed) > 1000:
+            self._stream_failed.clear()
+        self._stream_failed.add(url)
+        queue = self.queue.get(sid)
+        if queue is not None:
+            queue[QueueKey.TEMP_QUEUE].appendleft(QueuedSong(url, channel))
+
+    def _normalized_artifact(self, server, song):
+        """How song's Opus artifact can be played: "opus" to send its
+            packets as they are, "ffmpeg" when the volume has to be
+            applied, None if there's none to use (it gets made then)"""
+        if not self.settings["NORMALIZE"] or self.settings["AVCONV"]:
+            return None
+        if song.start_time or song.end_time:
+            return None  # Seeking is ffmpeg's job, on the original
+        if not os.path.exists(self.cache_index.artifact(song.id)):
+            self._schedule_normalize(song.id)
+            return None
+        if self.get_server_settings(server)["VOLUME"] == 100:
+            return "opus"
+        return "ffmpeg"
+
+    def _schedule_normalize(self, song_id):
+        if song_id in self._normalizing:
+            return
+        self._normalizing.add(song_id)
+        future = self.bot.loop.run_in_executor(
+            self._normalize_executor, normalize_song,
+            os.path.join(self.cache_path, song_id),
+            self.cache_index.artifact(song_id))
+        future.add_done_callback(
+            lambda f: self._normalize_done(song_id, f))
+
+    def _normalize_done(self, song_id, future):
+        self._normalizing.discard(song_id)
+        if future.cancelled():
+            return
+        exc = future.exception()
+        if exc is not None:
+            log.warning("couldn't normalize song id {}: {}".format(song_id,
+                                                                  exc))
+            self.normalize_stats["failed"] += 1
+            return
+        log.debug("song id {} was at {} LUFS".format(song_id,
+                                                     future.result()))
+        self.normalize_stats["done"] += 1
+        self.cache_index.add(song_id)  # Its size grew
+
+    def _first_audio(self, mode, started):
+        self.first_audio[mode].append(time.perf_counter() - started)
+
+    async def _resolve_stream(self, server, url):
+        """Returns a done Downloader with the URL to stream url from, or
+            with the song already in the cache. None if streaming isn't an
+            option, downloading it is"""
+        downloader = self._downloader(url, self.settings["MAX_LENGTH"],
+                                      key=server.id, resolve=True)
+        downloader.start()
+        try:
+            await self._wait_downloader(downloader)
+        except Exception:
+            log.exception("couldn't resolve a stream for {}".format(url))
+            return None
+        if downloader.song is None or downloader.error is not None:
+            return None
+        # This will throw a maxlength exception if required
+        downloader.duration_check()
+        cached = os.path.exists(os.path.join(self.cache_path,
+                                             downloader.song.id))
+        if downloader.stream_url is None and not cached:
+            return None
+        return downloader
+
+    def _start_download(self, server, url, max_length):
+        downloader = self._downloader(url, max_length, download=True,
+                                      key=server.id)
+        self.downloaders[server.id] = downloader
+        downloader.start().add_done_callback(self._cache_downloaded)
+        return downloader
+
     def _stop(self, server):
         self._setup_queue(server)
         self._stop_player(server)
         self._stop_downloader(server)
+        self._stop_prefetches(server)
+        self._player_finished.pop(server.id, None)
         self.bot.loop.create_task(self._update_bot_status())
 
     async def _stop_and_disconnect(self, server):
@@ -1082,6 +2164,12 @@ class Audio:
 
         del self.downloaders[server.id]
 
+    def _stop_prefetches(self, server):
+        for downloader in self._prefetches.pop(server.id, {}).values():
+            # Only does something if it hasn't started yet
+            downloader.future.cancel()
+        self._prefetch_deferred.discard(server.id)
+
     def _stop_player(self, server):
         if not self.voice_connected(server):
             return
@@ -1130,6 +2218,57 @@ class Audio:
         
         return url.replace("[SEARCH:]", "")
 
+    async def _wait_downloader(self, downloader):
+        """Waits for a started Downloader to be done"""
+        # Shielded: whoever else waits on it still gets it done
+        await asyncio.shield(downloader.future)
+
+    def _wake_scheduler(self, sid):
+        """Tells sid's scheduler that there's something to look at,
+            starting it if needed"""
+        event = self._queue_events.get(sid)
+        if event is None:
+            event = self._queue_events[sid] = asyncio.Event()
+        task = self._schedulers.get(sid)
+        if task is None or task.done():
+            self._schedulers[sid] = self.bot.loop.create_task(
+                self.queue_scheduler(sid))
+        event.set()
+
+    def _player_after(self, sid):
+        """Makes the callback the player calls from its thread when it
+            ends, be it by itself or because it was stopped"""
+        def after(player=None):
+            failed = False
+            # The player thread calls this when ffmpeg's output ran out,
+            # anything else (skip, stop...) calls it from its own thread.
+            # Either way ffmpeg isn't killed until this returns, so only
+            # the first case has an exit code worth waiting for: ffmpeg
+            # exits with an error when it can't read the stream
+            if player is not None and sid in self._streaming and \
+                    threading.current_thread() is player:
+                try:
+                    failed = player.process.wait(timeout=2) > 0
+                except (AttributeError, subprocess.TimeoutExpired):
+                    pass
+            self.bot.loop.call_soon_threadsafe(self._player_finished_cb, sid,
+                                               player, failed)
+        return after
+
+    def _player_finished_cb(self, sid, player=None, failed=False):
+        streamed = self._streaming.get(sid)
+        if streamed is not None and streamed[0] is player:
+            del self._streaming[sid]
+            if failed:
+                self._stream_fallback(sid, *streamed[1:])
+        queue = self.queue.get(sid)
+        if queue is None:
+            return
+        if queue[QueueKey.QUEUE] or queue[QueueKey.TEMP_QUEUE]:
+            # Only a song with another one after it counts towards gaps
+            self._player_finished[sid] = time.perf_counter()
+        self._wake_scheduler(sid)
+
     @commands.group(pass_context=True)
     async def audioset(self, ctx):
         """Audio settings."""
@@ -1137,6 +2276,23 @@ class Audio:
             await send_cmd_help(ctx)
             return
 
+    @audioset.command(pass_context=True, name="broadcast", no_pm=True)
+    @checks.mod_or_permissions(manage_messages=True)
+    async def audioset_broadcast(self, ctx):
+        """Toggles radio mode
+
+        In radio mode, if another server in radio mode is already playing
+        the same song, this server joins it where it's at instead of
+        starting it over. Made for shared playlists."""
+        server = ctx.message.server
+        broadcast = not self.get_server_settings(server)["BROADCAST"]
+        self.set_server_setting(server, "BROADCAST", broadcast)
+        if broadcast:
+            await self.bot.say("Radio mode enabled.")
+        else:
+            await self.bot.say("Radio mode disabled.")
+        self.save_settings()
+
     @audioset.command(name="cachemax")
     @checks.is_owner()
     async def audioset_cachemax(self, size: int):
@@ -1182,6 +2338,25 @@ class Audio:
         await self.bot.say("Maximum length is now {} seconds.".format(length))
         self.save_settings()
 
+    @audioset.command(name="normalize")
+    @checks.is_owner()
+    async def audioset_normalize(self):
+        """Toggles playing loudness normalized, pre-encoded songs
+
+        After its first play, a cached song is measured and encoded once
+        to Opus at a common loudness. Later plays at 100% volume send it
+        as is, without running ffmpeg. At any other volume (the default
+        is 50%) ffmpeg still plays the normalized file, to apply the
+        volume. Needs ffmpeg with libopus."""
+        self.settings["NORMALIZE"] = not self.settings["NORMALIZE"]
+        if self.settings["NORMALIZE"]:
+            await self.bot.say("Songs will now be loudness normalized. "
+                               "They skip ffmpeg only on servers with "
+                               "the volume at 100%.")
+        else:
+            await self.bot.say("Songs will now be played as they are.")
+        self.save_settings()
+
     @audioset.command(name="player")
     @checks.is_owner()
     async def audioset_player(self):
@@ -1193,6 +2368,55 @@ class Audio:
             await self.bot.say("Player toggled. You're now using ffmpeg.")
         self.save_settings()
 
+    @audioset.command(pass_context=True, name="prefetch", no_pm=True)
+    @checks.mod_or_permissions(manage_messages=True)
+    async def audioset_prefetch(self, ctx, songs: int):
+        """How many of the next songs to download ahead (0 - 5)"""
+        server = ctx.message.server
+        if songs < 0 or songs > 5:
+            await self.bot.say("It must be between 0 and 5.")
+            return
+        self.set_server_setting(server, "PREFETCH", songs)
+        if songs:
+            await self.bot.say("The next {} songs will be downloaded ahead."
+                               "".format(songs))
+        else:
+            await self.bot.say("Songs will only be downloaded when it's"
+                               " their turn.")
+        self.save_settings()
+
+    @audioset.command(name="prefetchbudget")
+    @checks.is_owner()
+    async def audioset_prefetchbudget(self, downloads: int, kbps: int=0):
+        """Limits prefetching across all servers
+
+        downloads: how many songs can be prefetched at the same time
+        kbps: total download speed they share, in KB/s. 0 is unlimited"""
+        if downloads < 1 or kbps < 0:
+            await self.bot.say("Invalid budget.")
+            return
+        self.settings["PREFETCH_MAX"] = downloads
+        self.settings["PREFETCH_RATELIMIT"] = kbps
+        speed = "{} KB/s".format(kbps) if kbps else "no speed limit"
+        await self.bot.say("Up to {} songs will be prefetched at once, with"
+                           " {}.".format(downloads, speed))
+        self.save_settings()
+
+    @audioset.command(pass_context=True, name="stream", no_pm=True)
+    @checks.mod_or_permissions(manage_messages=True)
+    async def audioset_stream(self, ctx):
+        """Toggles streaming songs instead of downloading them first"""
+        server = ctx.message.server
+        stream = not self.get_server_settings(server)["STREAM"]
+        self.set_server_setting(server, "STREAM", stream)
+        if stream:
+            await self.bot.say("Songs will now be streamed. The ones that"
+                               " can't be will still be downloaded.")
+        else:
+            await self.bot.say("Songs will now be downloaded before being"
+                               " played.")
+        self.save_settings()
+
     @audioset.command(name="status")
     @checks.is_owner()  # cause effect is cross-server
     async def audioset_status(self):
@@ -1274,6 +2498,104 @@ class Audio:
         await self.bot.say("Currently playing music in {} servers.".format(
             count))
 
+    @audiostat.command(name="extractors")
+    async def audiostat_extractors(self):
+        """Load of the youtube_dl worker pool."""
+        metrics = self.extractor_pool.get_metrics()
+        busiest = sorted(self.extractor_pool.pending_by_key().items(),
+                         key=lambda kv: kv[1], reverse=True)[:3]
+        msg = ("Workers: {workers} ({active} busy)\n"
+               "Queued jobs: {pending}\n"
+               "Completed: {completed}/{submitted}\n"
+               "Average wait: {avg_wait:.2f}s".format(**metrics))
+        if busiest:
+            msg += "\nMost queued: " + ", ".join(
+                "{} ({})".format(self.bot.get_server(sid) or sid, n)
+                for sid, n in busiest)
+        await self.bot.say(msg)
+
+    @audiostat.command(name="metadata")
+    async def audiostat_metadata(self):
+        """Hit rate of the song info cache."""
+        stats = metadata_cache.stats
+        lookups = stats["hits"] + stats["misses"]
+        rate = stats["hits"] / lookups * 100 if lookups else 0
+        await self.bot.say("Song info cache:\n"
+                           "Entries: {}\n"
+                           "Hits: {} / Misses: {} ({:.1f}% hit rate)\n"
+                           "Evicted: {}".format(len(metadata_cache.entries),
+                                                stats["hits"],
+                                                stats["misses"], rate,
+                                                stats["evicted"]))
+
+    @audiostat.command(name="prefetch")
+    async def audiostat_prefetch(self):
+        """How often playback had to wait on a download."""
+        stats = self.prefetch_stats
+        plays = stats["ready"] + stats["waited"]
+        if not plays:
+            await self.bot.say("No songs played yet.")
+            return
+        avg_wait = self.prefetch_wait_time / stats["waited"] \
+            if stats["waited"] else 0
+        await self.bot.say("Songs ready when their turn came: {}/{}"
+                           " ({:.1f}%)\n"
+                           "Waited on a download: {} (average {:.1f}s)\n"
+                           "Prefetches started: {}, running: {}, held back"
+                           " by the budget: {}".format(
+                               stats["ready"], plays,
+                               stats["ready"] / plays * 100,
+                               stats["waited"], avg_wait, stats["started"],
+                               self._prefetch_running(), stats["deferred"]))
+
+    @audiostat.command(name="firstaudio")
+    async def audiostat_firstaudio(self):
+        """Time from a song's turn to its first audio, by play mode."""
+        lines = []
+        for mode, times in sorted(self.first_audio.items()):
+            if not times:
+                continue
+            avg = sum(times) / len(times)
+            lines.append("{}: {:.2f}s average, {:.2f}s max over {} songs"
+                         "".format(mode.capitalize(), avg, max(times),
+                                   len(times)))
+        if not lines:
+            await self.bot.say("No songs played yet.")
+            return
+        lines.append("Stream fallbacks to downloading: {}"
+                     "".format(self.stream_stats["fallbacks"]))
+        lines.append("Songs normalized: {} ({} failed)"
+                     "".format(self.normalize_stats["done"],
+                               self.normalize_stats["failed"]))
+        await self.bot.say("\n".join(lines))
+
+    @audiostat.command(name="broadcasts")
+    async def audiostat_broadcasts(self):
+        """Servers sharing a decoder in radio mode."""
+        live = [b for b in self._broadcasts.values() if not b.is_done()]
+        listeners = sum(len(b.listeners) for b in live)
+        await self.bot.say("Live broadcasts: {} with {} servers listening\n"
+                           "Decoders started: {}, joined instead: {}"
+                           "".format(len(live), listeners,
+                                     self.broadcast_stats["decoders"],
+                                     self.broadcast_stats["joined"]))
+
+    @audiostat.command(name="gaps")
+    async def audiostat_gaps(self):
+        """Time between the end of a song and the start of the next."""
+        gaps = sorted(self.song_gaps)
+        if not gaps:
+            await self.bot.say("No song changes recorded yet.")
+            return
+
+        avg = sum(gaps) / len(gaps)
+        p95 = gaps[min(len(gaps) - 1, int(len(gaps) * 0.95))]
+        await self.bot.say("Gap between songs over the last {} changes:\n"
+                           "Average: {:.2f}s\n"
+                           "95th percentile: {:.2f}s\n"
+                           "Maximum: {:.2f}s".format(len(gaps), avg, p95,
+                                                     gaps[-1]))
+
     @commands.group(pass_context=True)
     async def cache(self, ctx):
         """Cache management tools."""
@@ -1285,9 +2607,46 @@ class Audio:
     @checks.is_owner()
     async def cache_dump(self):
         """Dumps the cache."""
-        dumped = self._dump_cache()
+        dumped = self._dump_cache(everything=True)
         await self.bot.say("Dumped {:.3f} MB of audio files.".format(dumped))
 
+    @cache.command(name="warm", pass_context=True, no_pm=True)
+    @checks.is_owner()
+    async def cache_warm(self, ctx, playlist_name=None):
+        """Fetches the info of this server's saved playlists' songs.
+
+        Only the given playlist if a name is passed. Nothing is downloaded,
+        songs just start faster once queued."""
+        server = ctx.message.server
+        if playlist_name is None:
+            names = self._list_playlists(server)
+        elif self._playlist_exists(server, playlist_name):
+            names = [playlist_name]
+        else:
+            await self.bot.say("There's no playlist with that name.")
+            return
+
+        urls = set()
+        for name in names:
+            local = self._playlist_exists_local(server, name)
+            playlist = self._load_playlist(server, name, local=local)
+            urls.update(u for u in playlist.playlist or []
+                        if self._valid_playable_url(u))
+        urls = [u for u in urls if u not in metadata_cache]
+        if not urls:
+            await self.bot.say("Nothing to fetch, it's all cached already.")
+            return
+
+        await self.bot.say("Fetching info for {} songs...".format(len(urls)))
+        # Their own queue in the pool, so playback isn't held up by this
+        downloaders = [self._downloader(url, key="warm") for url in urls]
+        results = await asyncio.gather(*[d.start() for d in downloaders],
+                                       return_exceptions=True)
+        fetched = sum(1 for d in results
+                      if isinstance(d, Downloader) and d.error is None)
+        await self.bot.say("Cached the info of {}/{} songs."
+                           "".format(fetched, len(urls)))
+
     @cache.command(name='stats')
     async def cache_stats(self):
         """Reports info about the cache.
@@ -1298,9 +2657,13 @@ class Audio:
         await self.bot.say("Cache stats:\n"
                            "Current size: {:.2f} MB\n"
                            "Maximum: {:.1f} MB\n"
-                           "Minimum: {:.1f} MB".format(self._cache_size(),
-                                                       self._cache_max(),
-                                                       self._cache_min()))
+                           "Minimum: {:.1f} MB\n"
+                           "Files: {}\n"
+                           "Evicted: {}".format(self._cache_size(),
+                                                self._cache_max(),
+                                                self._cache_min(),
+                                                len(self.cache_index.entries),
+                                                self.cache_index.evictions))
 
     @commands.group(pass_context=True, hidden=True, no_pm=True)
     @checks.is_owner()
@@ -1481,6 +2844,12 @@ class Audio:
             url = url.replace("/", "&#47")
             url = "[SEARCH:]" + url
 
+        if "[SEARCH:]" not in url and self._is_playlist_url(url):
+            self._stop_player(server)
+            self._clear_queue(server)
+            await self._stream_playlist(server, url, channel)
+            return
+
         if "[SEARCH:]" not in url and "youtube" in url:
             parsed_url = urllib.parse.urlparse(url)
             query = urllib.parse.parse_qs(parsed_url.query)
@@ -1562,9 +2931,10 @@ class Audio:
 
         if self._valid_playable_url(url):
             try:
-                await self.bot.say("Enumerating song list... This could take"
-                                   " a few moments.")
-                songlist = await self._parse_playlist(url)
+                progress = await self.bot.say("Enumerating song list... This"
+                                              " could take a few moments.")
+                songlist = await self._parse_playlist(url, server,
+                                                      progress=progress)
             except InvalidPlaylist:
                 await self.bot.say("That playlist URL is invalid.")
                 return
@@ -1754,6 +3124,10 @@ class Audio:
         else:
             url = "[SEARCH:]" + url
 
+        if "[SEARCH:]" not in url and self._is_playlist_url(url):
+            await self._stream_playlist(server, url, channel)
+            return
+
         if "[SEARCH:]" not in url and "youtube" in url:
             parsed_url = urllib.parse.urlparse(url)
             query = urllib.parse.parse_qs(parsed_url.query)
@@ -2158,7 +3532,6 @@ class Audio:
         """This function assumes that there's something in the queue for us to
             play"""
         server = self.bot.get_server(sid)
-        max_length = self.settings["MAX_LENGTH"]
 
         # This is a reference, or should be at least
         temp_queue = self.queue[server.id][QueueKey.TEMP_QUEUE]
@@ -2183,14 +3556,14 @@ class Audio:
                 try:
                     queued_song = temp_queue.popleft()
                     url = queued_song.url
-                    channel = queued_song.channel
+                    channel = self._queued_song_channel(server, queued_song)
                     song = await self._play(sid, url, channel)
                 except MaximumLength:
                     return
             elif len(queue) > 0:  # We're in the normal queue
                 queued_song = queue.popleft()
                 url = queued_song.url
-                channel = queued_song.channel
+                channel = self._queued_song_channel(server, queued_song)
                 log.debug("calling _play on the normal queue")
                 try:
                     song = await self._play(sid, url, channel)
@@ -2205,55 +3578,50 @@ class Audio:
             log.debug("set now_playing for sid {}".format(server.id))
             self.bot.loop.create_task(self._update_bot_status())
 
-        elif server.id in self.downloaders:
-            # We're playing but we might be able to download a new song
-            curr_dl = self.downloaders.get(server.id)
-            if len(temp_queue) > 0:
-                queued_next_song = temp_queue.peekleft()
-                next_url = queued_next_song.url
-                next_channel = queued_next_song.channel
-                next_dl = Downloader(next_url, max_length)
-            elif len(queue) > 0:
-                queued_next_song = queue.peekleft()
-                next_url = queued_next_song.url
-                next_channel = queued_next_song.channel	
-                next_dl = Downloader(next_url, max_length)
-            else:
-                next_dl = None
+        else:
+            # We're playing, get the next songs ready
+            self._prefetch(server)
 
-            if next_dl is not None:
-                try:
-                    # Download next song
-                    next_dl.start()
-                    await self._download_next(server, curr_dl, next_dl)
-                except YouTubeDlError as e:
-                    if len(temp_queue) > 0:
-                        temp_queue.popleft()
-                    elif len(queue) > 0:
-                        queue.popleft()
-                    clean_url = self._clean_url(next_url)
-                    message = ("I'm unable to play '{}' because of an "
-                              "error:\n'{}'".format(clean_url, str(e)))
-                    message = escape(message, mass_mentions=True)
-                    await self.bot.send_message(next_channel, message)
-
-    async def queue_scheduler(self):
+    def _queued_song_channel(self, server, queued_song):
+        """Where to talk about a queued song: the channel it was queued
+            from, or the server's default one if that's gone. Can be None"""
+        channel = self.bot.get_channel(queued_song.channel_id)
+        if channel is None:
+            channel = server.default_channel
+        return channel
+
+    async def queue_scheduler(self, sid):
+        """Runs queue_manager for sid whenever it's woken up by
+            _wake_scheduler: something got enqueued, the player ended or
+            a download finished. Only one runs per server, so managers of
+            the same server never overlap."""
+        event = self._queue_events[sid]
         while self == self.bot.get_cog('Audio'):
-            tasks = []
-            queue = copy.deepcopy(self.queue)
-            for sid in queue:
-                if len(queue[sid][QueueKey.QUEUE]) == 0 and \
-                        len(queue[sid][QueueKey.TEMP_QUEUE]) == 0:
-                    continue
-                # log.debug("scheduler found a non-empty queue"
-                #           " for sid: {}".format(sid))
-                tasks.append(
-                    self.bot.loop.create_task(self.queue_manager(sid)))
-            completed = [t.done() for t in tasks]
-            while not all(completed):
-                completed = [t.done() for t in tasks]
-                await asyncio.sleep(0.5)
-            await asyncio.sleep(1)
+            try:
+                # The timeout is only a safety net for missed wake ups
+                await asyncio.wait_for(event.wait(), timeout=30)
+            except asyncio.TimeoutError:
+                pass
+            event.clear()
+
+            queue = self.queue.get(sid)
+            if queue is None or self.bot.get_server(sid) is None:
+                continue
+            if len(queue[QueueKey.QUEUE]) == 0 and \
+                    len(queue[QueueKey.TEMP_QUEUE]) == 0:
+                continue
+
+            was_playing = self.is_playing(self.bot.get_server(sid))
+            try:
+                await self.queue_manager(sid)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("queue manager failed on sid {}".format(sid))
+                continue
+            if not was_playing:
+                # A new song started, go get the next one ready
+                event.set()
 
     async def reload_monitor(self):
         while self == self.bot.get_cog('Audio'):
@@ -2314,6 +3682,10 @@ class Audio:
                 vc.audio_player.resume()
 
     def __unload(self):
+        for task in self._schedulers.values():
+            task.cancel()
+        self.extractor_pool.shutdown()
+        self._normalize_executor.shutdown(wait=False)
         for vc in self.bot.voice_clients:
             self.bot.loop.create_task(vc.disconnect())
 
@@ -2331,6 +3703,8 @@ def check_files():
     default = {"VOLUME": 50, "MAX_LENGTH": 3700, "VOTE_ENABLED": True,
                "MAX_CACHE": 0, "SOUNDCLOUD_CLIENT_ID": None,
                "TITLE_STATUS": True, "AVCONV": False, "VOTE_THRESHOLD": 50,
+               "PREFETCH": 1, "PREFETCH_MAX": 4, "PREFETCH_RATELIMIT": 0,
+               "STREAM": False, "NORMALIZE": False, "BROADCAST": False,
                "SERVERS": {}}
     settings_path = "data/audio/settings.json"
 
@@ -2401,7 +3775,6 @@ def setup(bot):
     n = Audio(bot, player=player)  # Praise 26
     bot.add_cog(n)
     bot.add_listener(n.voice_state_update, 'on_voice_state_update')
-    bot.loop.create_task(n.queue_scheduler())
     bot.loop.create_task(n.disconnect_timer())
     bot.loop.create_task(n.reload_monitor())
     bot.loop.create_task(n.cache_scheduler())
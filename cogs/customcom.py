@@ -6,6 +6,17 @@ import os
 import re
 
 
+PARAMETER_RE = re.compile(r"\{([^}]+)\}")
+
+
+def compile_cc(text):
+    """Splits a custom command's text into literal and parameter parts
+
+    Even indexes of the returned tuple are literal text, odd indexes are
+    parameter names, e.g. ("Hi ", "author.name", "!")"""
+    return tuple(PARAMETER_RE.split(text))
+
+
 class CustomCommands:
     """Custom commands
 
@@ -15,6 +26,7 @@ class CustomCommands:
         self.bot = bot
         self.file_path = "data/customcom/commands.json"
         self.c_commands = dataIO.load_json(self.file_path)
+        self._index = {}  # server id -> {command: compiled text}
 
     @commands.group(aliases=["cc"], pass_context=True, no_pm=True)
     async def customcom(self, ctx):
@@ -44,6 +56,7 @@ class CustomCommands:
         if command not in cmdlist:
             cmdlist[command] = text
             self.c_commands[server.id] = cmdlist
+            self._index.pop(server.id, None)
             dataIO.save_json(self.file_path, self.c_commands)
             await self.bot.say("Custom command successfully added.")
         else:
@@ -66,6 +79,7 @@ class CustomCommands:
             if command in cmdlist:
                 cmdlist[command] = text
                 self.c_commands[server.id] = cmdlist
+                self._index.pop(server.id, None)
                 dataIO.save_json(self.file_path, self.c_commands)
                 await self.bot.say("Custom command successfully edited.")
             else:
@@ -91,6 +105,7 @@ class CustomCommands:
             if command in cmdlist:
                 cmdlist.pop(command, None)
                 self.c_commands[server.id] = cmdlist
+                self._index.pop(server.id, None)
                 dataIO.save_json(self.file_path, self.c_commands)
                 await self.bot.say("Custom command successfully deleted.")
             else:
@@ -126,35 +141,48 @@ class CustomCommands:
             return
 
         server = message.server
-        prefix = self.get_prefix(message)
+        if server.id not in self.c_commands:
+            return
+
+        parsed = self.bot.parse_message(message)
+        prefix = parsed.prefix
 
         if not prefix:
             return
 
-        if server.id in self.c_commands and self.bot.user_allowed(message):
-            cmdlist = self.c_commands[server.id]
-            cmd = message.content[len(prefix):]
-            if cmd in cmdlist:
-                cmd = cmdlist[cmd]
-                cmd = self.format_cc(cmd, message)
-                await self.bot.send_message(message.channel, cmd)
-            elif cmd.lower() in cmdlist:
-                cmd = cmdlist[cmd.lower()]
-                cmd = self.format_cc(cmd, message)
-                await self.bot.send_message(message.channel, cmd)
+        index = self._get_index(server.id)
+        cmd = message.content[len(prefix):]
+        compiled = index.get(cmd.casefold())
+        if compiled is None:
+            return
+
+        if parsed.allowed:
+            cmd = self.render_cc(compiled, message)
+            await self.bot.send_message(message.channel, cmd)
+
+    def _get_index(self, server_id):
+        try:
+            return self._index[server_id]
+        except KeyError:
+            # Commands are matched case insensitively
+            index = {name.casefold(): compile_cc(text) for name, text
+                     in self.c_commands.get(server_id, {}).items()}
+            self._index[server_id] = index
+            return index
 
     def get_prefix(self, message):
-        for p in self.bot.settings.get_prefixes(message.server):
-            if message.content.startswith(p):
-                return p
-        return False
+        prefix = self.bot.settings.match_prefix(message.server,
+                                                message.content)
+        return prefix if prefix is not None else False
 
     def format_cc(self, command, message):
-        results = re.findall("\{([^}]+)\}", command)
-        for result in results:
-            param = self.transform_parameter(result, message)
-            command = command.replace("{" + result + "}", param)
-        return command
+        return self.render_cc(compile_cc(command), message)
+
+    def render_cc(self, compiled, message):
+        parts = list(compiled)
+        for i in range(1, len(parts), 2):
+            parts[i] = self.transform_parameter(parts[i], message)
+        return "".join(parts)
 
     def transform_parameter(self, result, message):
         """
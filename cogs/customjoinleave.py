@@ -3,7 +3,6 @@ from copy import deepcopy
 import os
 import os.path
 
-import aiohttp
 import discord
 from discord.ext import commands
 
@@ -215,7 +214,8 @@ class CustomJoinLeave:
 
             os.remove(path)
 
-        async with aiohttp.get(url) as nwsnd:
+        # No timeout, sound files can be large
+        async with self.bot.http_client.get(url, timeout=0) as nwsnd:
             f = open(path, "wb")
             f.write(await nwsnd.read())
             f.close
@@ -1,6 +1,7 @@
 import discord
 from discord.ext import commands
 from cogs.utils.dataIO import dataIO
+from cogs.utils.storage import Config, MEMBER
 from collections import namedtuple, defaultdict, deque
 from datetime import datetime
 from copy import deepcopy
@@ -8,16 +9,15 @@ from .utils import checks
 from cogs.utils.chat_formatting import pagify, box
 from enum import Enum
 from __main__ import send_cmd_help
-import sys
 import re
 import os
 import math
 import time
 import logging
 import random
-from urllib.request import Request, urlopen
-from urllib.error import URLError
 from bs4 import BeautifulSoup
+from .utils.async_ import Route
+from .utils.sync import ResponseError
 
 default_settings = {"PAYDAY_TIME": 300, "PAYDAY_CREDITS": 100,
                     "SLOT_MIN": 5, "SLOT_MAX": 100, "SLOT_TIME": 5,
@@ -134,17 +134,16 @@ SLOT_PAYOUTS_MSG = (
 
 class Bank:
 
-    def __init__(self, bot, file_path):
-        self.accounts = dataIO.load_json(file_path)
+    def __init__(self, bot):
+        self.accounts = Config("economy", "bank", MEMBER)
         self.bot = bot
 
     def create_account(self, user, *, initial_balance=0):
         server = user.server
         if not self.account_exists(user):
-            if server.id not in self.accounts:
-                self.accounts[server.id] = {}
-            if user.id in self.accounts:  # Legacy account
-                balance = self.accounts[user.id]["balance"]
+            legacy = self.accounts.all(user.id)
+            if "balance" in legacy:  # Legacy account
+                balance = legacy["balance"]
             else:
                 balance = initial_balance
             timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
@@ -152,8 +151,7 @@ class Bank:
                        "balance": balance,
                        "created_at": timestamp
                        }
-            self.accounts[server.id][user.id] = account
-            self._save_bank()
+            self.accounts.set(server.id, user.id, value=account)
             return self.get_account(user)
         else:
             raise AccountAlreadyExists()
@@ -174,8 +172,7 @@ class Bank:
         account = self._get_account(user)
         if account["balance"] >= amount:
             account["balance"] -= amount
-            self.accounts[server.id][user.id] = account
-            self._save_bank()
+            self.accounts.set(server.id, user.id, value=account)
         else:
             raise InsufficientBalance()
 
@@ -185,8 +182,7 @@ class Bank:
             raise NegativeValue()
         account = self._get_account(user)
         account["balance"] += amount
-        self.accounts[server.id][user.id] = account
-        self._save_bank()
+        self.accounts.set(server.id, user.id, value=account)
 
     def set_credits(self, user, amount):
         server = user.server
@@ -194,8 +190,7 @@ class Bank:
             raise NegativeValue()
         account = self._get_account(user)
         account["balance"] = amount
-        self.accounts[server.id][user.id] = account
-        self._save_bank()
+        self.accounts.set(server.id, user.id, value=account)
 
     def transfer_credits(self, sender, receiver, amount):
         if amount < 0:
@@ -206,8 +201,9 @@ class Bank:
             sender_acc = self._get_account(sender)
             if sender_acc["balance"] < amount:
                 raise InsufficientBalance()
-            self.withdraw_credits(sender, amount)
-            self.deposit_credits(receiver, amount)
+            with self.accounts.transaction():
+                self.withdraw_credits(sender, amount)
+                self.deposit_credits(receiver, amount)
         else:
             raise NoAccount()
 
@@ -219,12 +215,11 @@ class Bank:
             return False
 
     def wipe_bank(self, server):
-        self.accounts[server.id] = {}
-        self._save_bank()
+        self.accounts.clear(server.id)
 
     def get_server_accounts(self, server):
-        if server.id in self.accounts:
-            raw_server_accounts = deepcopy(self.accounts[server.id])
+        raw_server_accounts = self.accounts.all(server.id)
+        if raw_server_accounts:
             accounts = []
             for k, v in raw_server_accounts.items():
                 v["id"] = k
@@ -237,13 +232,12 @@ class Bank:
 
     def get_all_accounts(self):
         accounts = []
-        for server_id, v in self.accounts.items():
+        for server_id, raw_server_accounts in self.accounts.all().items():
             server = self.bot.get_server(server_id)
             if server is None:
                 # Servers that have since been left will be ignored
                 # Same for users_id from the old bank format
                 continue
-            raw_server_accounts = deepcopy(self.accounts[server.id])
             for k, v in raw_server_accounts.items():
                 v["id"] = k
                 v["server"] = server
@@ -269,15 +263,12 @@ class Bank:
                              "created_at server member")
         return Account(**account)
 
-    def _save_bank(self):
-        dataIO.save_json("data/economy/bank.json", self.accounts)
-
     def _get_account(self, user):
         server = user.server
-        try:
-            return deepcopy(self.accounts[server.id][user.id])
-        except KeyError:
+        account = self.accounts.get(server.id, user.id)
+        if account is None:
             raise NoAccount()
+        return account
 
 
 class SetParser:
@@ -314,26 +305,21 @@ class Experience:
     #TODO recreate the functionality of mee6's ranks plugin and
     #     demolish this horrible nonsense.
     async def update_leaderboard(self, server):
-        req = Request(LEADERBOARD_URL, headers={'User-Agent': 'Mozilla/5.0'})
+        route = Route(LEADERBOARD_URL, "", headers={'User-Agent': 'Mozilla/5.0'})
         try:
-            html = urlopen(req).read()
-        except URLError as e:
-            if hasattr(e, 'reason'):
-                print('We failed to reach a server.')
-                print('Reason: ', e.reason)
-                sys.exit(1)
-            elif hasattr(e, 'code'):
-                print('The server couldn\'t fulfill the request.')
-                print('Error code: ', e.code)
-                sys.exit(1)
-
-        soup = BeautifulSoup(html, 'html.parser')
-        table = soup.find("div", { "class" : "list-group" } )
-        plaintext = ""
+            html = await route.async_query(client=self.bot.http_client,
+                                           read="text")
+        except ResponseError as e:
+            print('We failed to reach the leaderboard.')
+            print('Reason: ', e)
+            await self.bot.say("Couldn't reach the leaderboard, try again "
+                               "later.")
+            return
+
+        # Parsing the whole page takes a while, keep it off the event loop
+        plaintext = await self.bot.loop.run_in_executor(
+            None, self._leaderboard_text, html)
 
-        for entry in table.find_all("h3"):
-           plaintext += entry.get_text()+"\n"
-        
         fixedtext = os.linesep.join([s for s in plaintext.splitlines() if s])
         fixedtext = re.sub(r'(\s)(#\d{4})', r'\2', fixedtext)
 
@@ -355,9 +341,19 @@ class Experience:
             self.leaderboard[user]["level"] = int(level)
             self.leaderboard[user]["rank"] = int(rank)
 
-        dataIO.save_json(self.file_path, self.leaderboard)
+        await dataIO.save_json_async(self.file_path, self.leaderboard)
         await self.bot.say("Internal leaderboards have been updated.")
 
+    @staticmethod
+    def _leaderboard_text(html):
+        soup = BeautifulSoup(html, 'html.parser')
+        table = soup.find("div", { "class" : "list-group" } )
+        plaintext = ""
+
+        for entry in table.find_all("h3"):
+           plaintext += entry.get_text()+"\n"
+        return plaintext
+
     def get_payday_multiplier(self, user):
         acc = self._get_user(user)
         if 1 <= acc["rank"] <= 10:
@@ -391,7 +387,7 @@ class Economy:
     def __init__(self, bot):
         global default_settings
         self.bot = bot
-        self.bank = Bank(bot, "data/economy/bank.json")
+        self.bank = Bank(bot)
         self.xp = Experience(bot, "data/economy/experience.json")
         self.file_path = "data/economy/settings.json"
         self.settings = dataIO.load_json(self.file_path)
@@ -5,16 +5,15 @@
 # Original GarPR at github.com/garsh0p/garpr
 # New GarPR at github.com/ripgarpr/garpr
 #
-# Route class based on martmists' work on the ram.moe wrapper
-#
 # Last updated Mar 28, 2018
 
 import discord
 import os
 import re
-import requests
 from discord.ext import commands
-from cogs.utils.dataIO import dataIO
+from cogs.utils.dataIO import dataIO, writebehind
+from .utils.async_ import Route
+from .utils.sync import ResponseError
 from copy import deepcopy
 from .utils import checks
 from __main__ import send_cmd_help
@@ -35,43 +34,45 @@ class GarPR:
         self.tournaments_uri = self.settings["region"]+"/tournaments"
         self.url = "https://www.notgarpr.com/#/"
         self.data_url = "https://www.notgarpr.com:3001/"
-        # Determine if rankings should be reloaded
-        if not self._checkgar():
-            # Load cached resources
-            self.rankings_cache = dataIO.load_json(self.resources+"garpr_rankings.json")
-            self.matchup_cache = dataIO.load_json(self.resources+"garpr_match_records.json")
-            self.players = dataIO.load_json(self.resources+"garpr_players.json")
+        # Load cached resources, _checkgar refreshes them in the background
+        self.rankings_cache = dataIO.load_json(self.resources+"garpr_rankings.json")
+        self.matchup_cache = dataIO.load_json(self.resources+"garpr_match_records.json")
+        self.players = dataIO.load_json(self.resources+"garpr_players.json")
         # Set default garpr rank emotes
         self.rank_emotes = self.settings["rank emotes"]
 
-    def _checkgar(self):
+    def _route(self, path):
+        return Route(base_url=self.data_url, path=path)
+
+    async def _checkgar(self):
         """Queries the regional garpr and checks if there have been any new tournaments logged 
         since the last time it checked.
 
         If so, it invalidates the cache and updates players/match records data."""
         try:
-            actualTournies = len(Route(base_url=self.data_url, path=self.tournaments_uri).sync_query()["tournaments"])
+            tournaments = await self._route(self.tournaments_uri).async_query(client=self.bot.http_client)
+            actualTournies = len(tournaments["tournaments"])
         except ResponseError as e:
             print("GarPR may be down. Try refreshing later.")
             print(e)
             return False 
         if ( actualTournies != self.settings["tournaments on record"] ):
             # Invalidate cached resources
-            self._refresh_cog()
+            await self._refresh_cog()
             self.matchup_cache = {}
             self.settings["tournaments on record"] = actualTournies
-            dataIO.save_json(self.resources+"garpr_settings.json", self.settings)
-            dataIO.save_json(self.resources+"garpr_match_records.json", self.matchup_cache)
+            await dataIO.save_json_async(self.resources+"garpr_settings.json", self.settings)
+            await dataIO.save_json_async(self.resources+"garpr_match_records.json", self.matchup_cache)
             return True
         return False
     
-    def _refresh_cog(self):
+    async def _refresh_cog(self):
         """Attempt to sync the bot with the actual GarPR."""
         try:
-            self.players = Route(base_url=self.data_url,path=self.players_uri).sync_query()
-            self.rankings_cache = Route(base_url=self.data_url,path=self.rankings_uri).sync_query()
-            dataIO.save_json(self.resources+"garpr_players.json", self.players)
-            dataIO.save_json(self.resources+"garpr_rankings.json", self.rankings_cache)
+            self.players = await self._route(self.players_uri).async_query(client=self.bot.http_client)
+            self.rankings_cache = await self._route(self.rankings_uri).async_query(client=self.bot.http_client)
+            await dataIO.save_json_async(self.resources+"garpr_players.json", self.players)
+            await dataIO.save_json_async(self.resources+"garpr_rankings.json", self.rankings_cache)
         except ResponseError as e:
             print("Couldn't properly refresh garpr. Some commands may not work as expected.")
             print(e)
@@ -90,9 +91,9 @@ class GarPR:
         if playerid in match_records:
             return match_records[playerid]
         # Otherwise, get it, store it in the cache, and return it
-        playerdata = Route(base_url=self.data_url,path=self.matches_uri+playerid).sync_query()
+        playerdata = await self._route(self.matches_uri+playerid).async_query(client=self.bot.http_client)
         self.matchup_cache[playerid] = playerdata
-        dataIO.save_json(self.resources+"garpr_match_records.json", self.matchup_cache)
+        writebehind.mark_dirty(self.resources+"garpr_match_records.json", self.matchup_cache)
         return playerdata
 
     def _get_playerid(self, player : str):
@@ -105,7 +106,7 @@ class GarPR:
     @commands.command(pass_context=False, no_pm=True)
     async def checkgar(self):
         """Attempts to synchronize the bot with the data in garpr."""
-        if self._checkgar():
+        if await self._checkgar():
             await self.bot.say("There were new tournaments... I just refreshed the cache. Data is synced now!")
         else:
             await self.bot.say("No new tournaments.")
@@ -324,27 +325,6 @@ class GarPR:
         dataIO.save_json(self.resources+"garpr_settings.json", self.settings)
         await self.bot.edit_message(prompt, "Ok, I've set the new color for "+coloredRoles[answer-1].mention)
 
-# Handles request routing
-class Route:
-    def __init__(self, base_url, path, headers=None, method="GET"):
-        self.base_url = base_url
-        self.path = path
-        self.headers = headers
-        self.method = method
-    def sync_query(self, url_params=None):
-        result = getattr( requests, self.method.lower() )(
-                self.base_url+self.path, headers=self.headers)
-        if 200 <= result.status_code < 300:
-            return result.json()
-        else:
-            raise ResponseError("Got an unsuccessful response code: {}, from {}".format(result.status_code, self.base_url+self.path))
-
-    def __call__(self, url_params=None):
-        return self.sync_query(url_params)
-
-class ResponseError(BaseException):
-    pass
-
 def check_folders(resources_folder):
     if not os.path.exists(resources_folder):
         print("Creating garpr data folder...")
@@ -386,4 +366,6 @@ def setup(bot):
     resources_folder = "data/garpr/"
     check_folders(resources_folder)
     check_files(resources_folder)
-    bot.add_cog(GarPR(bot, resources_folder))
+    n = GarPR(bot, resources_folder)
+    bot.loop.create_task(n._checkgar())
+    bot.add_cog(n)
@@ -7,7 +7,6 @@ from enum import Enum
 from urllib.parse import quote_plus
 import datetime
 import time
-import aiohttp
 import asyncio
 
 settings = {"POLL_DURATION" : 60}
@@ -319,7 +318,7 @@ class General:
         search_terms = "+".join([encode(s) for s in search_terms])
         url = "http://api.urbandictionary.com/v0/define?term=" + search_terms
         try:
-            async with aiohttp.get(url) as r:
+            async with self.bot.http_client.get(url) as r:
                 result = await r.json()
             if result["list"]:
                 definition = result['list'][pos]['definition']
@@ -1,6 +1,5 @@
 from discord.ext import commands
 from random import choice, shuffle
-import aiohttp
 import functools
 import asyncio
 
@@ -127,7 +126,7 @@ class Image:
         url = ("http://api.giphy.com/v1/gifs/search?&api_key={}&q={}&rating=pg"
                "".format(GIPHY_API_KEY, keywords))
 
-        async with aiohttp.get(url) as r:
+        async with self.bot.http_client.get(url) as r:
             result = await r.json()
             if r.status == 200:
                 if result["data"]:
@@ -149,7 +148,7 @@ class Image:
         url = ("http://api.giphy.com/v1/gifs/random?&api_key={}&tag={}"
                "".format(GIPHY_API_KEY, keywords))
 
-        async with aiohttp.get(url) as r:
+        async with self.bot.http_client.get(url) as r:
             result = await r.json()
             if r.status == 200:
                 if result["data"]:
@@ -1,7 +1,8 @@
 import discord
 from discord.ext import commands
-from .utils.dataIO import dataIO
+from .utils.dataIO import dataIO, writebehind
 from .utils import checks
+from .utils.wordfilter import WordFilter
 from __main__ import send_cmd_help, settings
 from datetime import datetime
 from collections import deque, defaultdict
@@ -37,7 +38,9 @@ default_settings = {
     "ban_mention_spam"  : False,
     "delete_repeats"    : False,
     "mod-log"           : None,
-    "respect_hierarchy" : False
+    "respect_hierarchy" : False,
+    "filter_word_boundary" : False,
+    "filter_leetspeak"  : False
 }
 
 
@@ -96,7 +99,10 @@ class Mod:
     def __init__(self, bot):
         self.bot = bot
         self.ignore_list = dataIO.load_json("data/mod/ignorelist.json")
+        self._ignored = set()
+        self._update_ignored()
         self.filter = dataIO.load_json("data/mod/filter.json")
+        self.word_filter = WordFilter(self.filter)
         self.past_names = dataIO.load_json("data/mod/past_names.json")
         self.past_nicknames = dataIO.load_json("data/mod/past_nicknames.json")
         settings = dataIO.load_json("data/mod/settings.json")
@@ -1091,14 +1097,14 @@ class Mod:
         if not channel:
             if current_ch.id not in self.ignore_list["CHANNELS"]:
                 self.ignore_list["CHANNELS"].append(current_ch.id)
-                dataIO.save_json("data/mod/ignorelist.json", self.ignore_list)
+                self._save_ignore_list()
                 await self.bot.say("Channel added to ignore list.")
             else:
                 await self.bot.say("Channel already in ignore list.")
         else:
             if channel.id not in self.ignore_list["CHANNELS"]:
                 self.ignore_list["CHANNELS"].append(channel.id)
-                dataIO.save_json("data/mod/ignorelist.json", self.ignore_list)
+                self._save_ignore_list()
                 await self.bot.say("Channel added to ignore list.")
             else:
                 await self.bot.say("Channel already in ignore list.")
@@ -1109,7 +1115,7 @@ class Mod:
         server = ctx.message.server
         if server.id not in self.ignore_list["SERVERS"]:
             self.ignore_list["SERVERS"].append(server.id)
-            dataIO.save_json("data/mod/ignorelist.json", self.ignore_list)
+            self._save_ignore_list()
             await self.bot.say("This server has been added to the ignore list.")
         else:
             await self.bot.say("This server is already being ignored.")
@@ -1131,14 +1137,14 @@ class Mod:
         if not channel:
             if current_ch.id in self.ignore_list["CHANNELS"]:
                 self.ignore_list["CHANNELS"].remove(current_ch.id)
-                dataIO.save_json("data/mod/ignorelist.json", self.ignore_list)
+                self._save_ignore_list()
                 await self.bot.say("This channel has been removed from the ignore list.")
             else:
                 await self.bot.say("This channel is not in the ignore list.")
         else:
             if channel.id in self.ignore_list["CHANNELS"]:
                 self.ignore_list["CHANNELS"].remove(channel.id)
-                dataIO.save_json("data/mod/ignorelist.json", self.ignore_list)
+                self._save_ignore_list()
                 await self.bot.say("Channel removed from ignore list.")
             else:
                 await self.bot.say("That channel is not in the ignore list.")
@@ -1149,7 +1155,7 @@ class Mod:
         server = ctx.message.server
         if server.id in self.ignore_list["SERVERS"]:
             self.ignore_list["SERVERS"].remove(server.id)
-            dataIO.save_json("data/mod/ignorelist.json", self.ignore_list)
+            self._save_ignore_list()
             await self.bot.say("This server has been removed from the ignore list.")
         else:
             await self.bot.say("This server is not in the ignore list.")
@@ -1160,6 +1166,21 @@ class Mod:
         msg += str(len(self.ignore_list["SERVERS"])) + " servers\n```\n"
         return msg
 
+    def _update_ignored(self):
+        self._ignored = set(self.ignore_list["SERVERS"])
+        self._ignored.update(self.ignore_list["CHANNELS"])
+
+    def _save_ignore_list(self):
+        self._update_ignored()
+        dataIO.save_json("data/mod/ignorelist.json", self.ignore_list)
+
+    def is_ignored(self, message):
+        """Whether the message's server or channel is ignored"""
+        if message.channel.is_private:
+            return False
+        return (message.server.id in self._ignored or
+                message.channel.id in self._ignored)
+
     @commands.group(name="filter", pass_context=True, no_pm=True)
     @checks.mod_or_permissions(manage_messages=True)
     async def _filter(self, ctx):
@@ -1202,6 +1223,7 @@ class Mod:
                 self.filter[server.id].append(w.lower())
                 added += 1
         if added:
+            self.word_filter.invalidate(server.id)
             dataIO.save_json("data/mod/filter.json", self.filter)
             await self.bot.say("Words added to filter.")
         else:
@@ -1228,11 +1250,41 @@ class Mod:
                 self.filter[server.id].remove(w.lower())
                 removed += 1
         if removed:
+            self.word_filter.invalidate(server.id)
             dataIO.save_json("data/mod/filter.json", self.filter)
             await self.bot.say("Words removed from filter.")
         else:
             await self.bot.say("Those words weren't in the filter.")
 
+    @_filter.command(name="wordboundary", pass_context=True)
+    async def filter_wordboundary(self, ctx):
+        """Toggles matching whole words only
+
+        When enabled, 'ass' no longer matches 'class'"""
+        server = ctx.message.server
+        toggled = not self.settings[server.id].get("filter_word_boundary",
+                                                   False)
+        self.settings[server.id]["filter_word_boundary"] = toggled
+        dataIO.save_json("data/mod/settings.json", self.settings)
+        if toggled:
+            await self.bot.say("The filter will now only match whole words.")
+        else:
+            await self.bot.say("The filter will now match inside words too.")
+
+    @_filter.command(name="leetspeak", pass_context=True)
+    async def filter_leetspeak(self, ctx):
+        """Toggles leetspeak normalization
+
+        When enabled, 'h3ll0' is matched by 'hello'"""
+        server = ctx.message.server
+        toggled = not self.settings[server.id].get("filter_leetspeak", False)
+        self.settings[server.id]["filter_leetspeak"] = toggled
+        dataIO.save_json("data/mod/settings.json", self.settings)
+        if toggled:
+            await self.bot.say("Leetspeak will now be normalized.")
+        else:
+            await self.bot.say("Leetspeak will no longer be normalized.")
+
     @commands.group(no_pm=True, pass_context=True)
     @checks.admin_or_permissions(manage_roles=True)
     async def editrole(self, ctx):
@@ -1432,7 +1484,7 @@ class Mod:
         if mod:
             self.last_case[server.id][mod.id] = case_n
 
-        dataIO.save_json("data/mod/modlog.json", self.cases)
+        await dataIO.save_json_async("data/mod/modlog.json", self.cases)
 
     async def update_case(self, server, *, case, mod=None, reason=None,
                           until=False):
@@ -1463,7 +1515,7 @@ class Mod:
 
         case_msg = self.format_case_msg(case)
 
-        dataIO.save_json("data/mod/modlog.json", self.cases)
+        await dataIO.save_json_async("data/mod/modlog.json", self.cases)
 
         if case["message"] is None:  # The case's message was never sent
             raise CaseMessageNotFound()
@@ -1527,17 +1579,20 @@ class Mod:
 
     async def check_filter(self, message):
         server = message.server
-        if server.id in self.filter.keys():
-            for w in self.filter[server.id]:
-                if w in message.content.lower():
-                    try:
-                        await self.bot.delete_message(message)
-                        logger.info("Message deleted in server {}."
-                                    "Filtered: {}"
-                                    "".format(server.id, w))
-                        return True
-                    except:
-                        pass
+        settings = self.settings[server.id]
+        w = self.word_filter.search(
+            server.id, message.content,
+            word_boundary=settings.get("filter_word_boundary", False),
+            leetspeak=settings.get("filter_leetspeak", False))
+        if w is not None:
+            try:
+                await self.bot.delete_message(message)
+                logger.info("Message deleted in server {}."
+                            "Filtered: {}"
+                            "".format(server.id, w))
+                return True
+            except:
+                pass
         return False
 
     async def check_duplicates(self, message):
@@ -1661,7 +1716,8 @@ class Mod:
                     names = deque(self.past_names[before.id], maxlen=20)
                     names.append(after.name)
                     self.past_names[before.id] = list(names)
-            dataIO.save_json("data/mod/past_names.json", self.past_names)
+            writebehind.mark_dirty("data/mod/past_names.json",
+                                   self.past_names)
 
         if before.nick != after.nick and after.nick is not None:
             server = before.server
@@ -1675,8 +1731,8 @@ class Mod:
             if after.nick not in nicks:
                 nicks.append(after.nick)
                 self.past_nicknames[server.id][before.id] = list(nicks)
-                dataIO.save_json("data/mod/past_nicknames.json",
-                                 self.past_nicknames)
+                writebehind.mark_dirty("data/mod/past_nicknames.json",
+                                       self.past_nicknames)
 
     def are_overwrites_empty(self, overwrites):
         """There is currently no cleaner way to check if a
@@ -1685,6 +1741,11 @@ class Mod:
         empty = [p for p in iter(discord.PermissionOverwrite())]
         return original == empty
 
+    def __unload(self):
+        # A reloaded Mod reads these from disk, pending changes go first
+        writebehind.flush("data/mod/past_names.json")
+        writebehind.flush("data/mod/past_nicknames.json")
+
 
 def strfdelta(delta):
     s = []
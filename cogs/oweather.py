@@ -2,7 +2,6 @@ from cogs.utils.dataIO import dataIO
 from discord.ext import commands
 from .utils import checks
 import collections
-import aiohttp
 import discord
 import os
 
@@ -283,11 +282,8 @@ class Weather:
     async def _api_request(self, location):
         payload = {'q': location, 'appid': self.settings['WEATHER_API_KEY']}
         url = 'http://api.openweathermap.org/data/2.5/weather?'
-        conn = aiohttp.TCPConnector()
-        session = aiohttp.ClientSession(connector=conn)
-        async with session.get(url, params=payload) as r:
+        async with self.bot.http_client.get(url, params=payload) as r:
             data = await r.json()
-        session.close()
         return data
 
     @commands.command(pass_context=True, name='temperature', aliases=['temp'])
@@ -2,8 +2,9 @@ import discord
 from discord.ext import commands
 from cogs.utils import checks
 from __main__ import set_cog
-from .utils.dataIO import dataIO
+from .utils.dataIO import dataIO, CODECS, UnavailableCodec
 from .utils.chat_formatting import pagify, box
+from .utils.metrics import BUCKETS
 
 import importlib
 import traceback
@@ -13,7 +14,7 @@ import threading
 import datetime
 import glob
 import os
-import aiohttp
+from collections import Counter
 
 log = logging.getLogger("red.owner")
 
@@ -46,10 +47,6 @@ class Owner:
         self.setowner_lock = False
         self.disabled_commands = dataIO.load_json("data/red/disabled_commands.json")
         self.global_ignores = dataIO.load_json("data/red/global_ignores.json")
-        self.session = aiohttp.ClientSession(loop=self.bot.loop)
-
-    def __unload(self):
-        self.session.close()
 
     @commands.command()
     @checks.is_owner()
@@ -482,7 +479,8 @@ class Owner:
     async def avatar(self, url):
         """Sets Red's avatar"""
         try:
-            async with self.session.get(url) as r:
+            # Big images can take longer than the default timeout
+            async with self.bot.http_client.get(url, timeout=0) as r:
                 data = await r.read()
             await self.bot.edit_profile(self.bot.settings.password, avatar=data)
             await self.bot.say("Done.")
@@ -505,6 +503,73 @@ class Owner:
             await self.bot.say("Token set. Restart me.")
             log.debug("Token changed.")
 
+    @_set.command(name="storage")
+    @checks.is_owner()
+    async def _storage(self, driver: str):
+        """Sets the storage driver used by cogs (json or sqlite)
+
+        Existing JSON data is imported the first time the SQLite
+        driver is used. Going back to JSON overwrites the JSON files
+        with what SQLite holds. Takes effect on restart."""
+        driver = driver.lower()
+        if driver not in ("json", "sqlite"):
+            await self.bot.say("Available drivers: json, sqlite")
+            return
+        previous = self.bot.settings.storage_driver
+        self.bot.settings.storage_driver = driver
+        self.bot.settings.save_settings()
+        msg = "Storage driver set to {}. Restart me.".format(driver)
+        if previous == "sqlite" and driver == "json":
+            msg += ("\nThe JSON files haven't been updated since switching "
+                    "to SQLite: on restart they will be overwritten with "
+                    "SQLite's data.")
+        await self.bot.say(msg)
+
+    @_set.command(name="dataformat")
+    @checks.is_owner()
+    async def _dataformat(self, codec: str):
+        """Sets the format data files are saved in
+
+        json is Red's usual indented format. compact, orjson and msgpack
+        are smaller and faster to save; orjson and msgpack need their
+        module installed. Files are converted as they get saved and
+        are readable in any format."""
+        codec = codec.lower()
+        try:
+            dataIO.set_codec(codec)
+        except UnavailableCodec:
+            await self.bot.say("Available formats: {}"
+                               "".format(", ".join(sorted(CODECS))))
+            return
+        self.bot.settings.data_format = codec
+        self.bot.settings.save_settings()
+        await self.bot.say("Data format set to {}.".format(codec))
+
+    @_set.command(name="metricsport")
+    @checks.is_owner()
+    async def _metricsport(self, port: int):
+        """Serves Prometheus metrics on a local port
+
+        They're available at http://127.0.0.1:<port>/metrics
+        0 disables it. The metrics are also written to
+        data/red/metrics.prom every minute either way."""
+        metrics = self.bot.metrics
+        if port <= 0:
+            await metrics.stop_server()
+            self.bot.settings.metrics_port = None
+            self.bot.settings.save_settings()
+            await self.bot.say("Metrics won't be served anymore.")
+            return
+        try:
+            await metrics.start_server(port)
+        except OSError as e:
+            await self.bot.say("Couldn't listen on that port: {}".format(e))
+            return
+        self.bot.settings.metrics_port = port
+        self.bot.settings.save_settings()
+        await self.bot.say("Metrics are served at "
+                           "http://127.0.0.1:{}/metrics".format(port))
+
     @_set.command(name="adminrole", pass_context=True, no_pm=True)
     @checks.serverowner()
     async def _server_adminrole(self, ctx, *, role: discord.Role):
@@ -652,6 +717,77 @@ class Owner:
             pass
         await self.bot.shutdown(restart=True)
 
+    @commands.command()
+    @checks.is_owner()
+    async def looplag(self):
+        """Shows how late the event loop runs and what blocks it
+
+        Callbacks running longer than the threshold are attributed to
+        the cog and command they belong to. Everything shown here is
+        also logged to data/red/metrics.log"""
+        monitor = self.bot.loop_monitor
+        metrics = monitor.get_metrics()
+        msg = ("Loop lag over the last minute:\n"
+               "Average: {lag_avg_ms:.1f}ms\n"
+               "95th percentile: {lag_p95_ms:.1f}ms\n"
+               "Maximum: {lag_max_ms:.1f}ms\n"
+               "Maximum since start: {lag_max_ever_ms:.0f}ms\n\n"
+               "Callbacks over {threshold:.0f}ms: {slow_callbacks}"
+               "".format(threshold=monitor.threshold * 1000, **metrics))
+        if monitor.blocked_time:
+            msg += "\n\nMost time blocking the loop:\n"
+            for where, seconds in monitor.blocked_time.most_common(5):
+                msg += "{:.2f}s in {} calls: {}\n".format(
+                    seconds, monitor.blocked_calls[where], where)
+        if monitor.slow_callbacks:
+            msg += "\nLatest:\n"
+            for when, seconds, where in reversed(monitor.slow_callbacks):
+                when = datetime.datetime.fromtimestamp(when)
+                msg += "{:%H:%M:%S} {:.0f}ms: {}\n".format(when,
+                                                          seconds * 1000,
+                                                          where)
+        for page in pagify(msg, ["\n"], shorten_by=16):
+            await self.bot.say(box(page))
+
+    @commands.command()
+    @checks.is_owner()
+    async def commandstats(self, top: int=10):
+        """Shows the commands and listeners taking the most time
+
+        Latencies are bucketed, the 95th percentile shown is the upper
+        bound of its bucket"""
+        metrics = self.bot.metrics
+        errors = Counter()
+        for (cog, command, kind), n in metrics.command_errors.items():
+            errors[(cog, command)] += n
+
+        def by_total(item):
+            return item[1].sum
+
+        msg = "Commands (uses, errors, average, 95th percentile, total):\n"
+        commands_used = sorted(metrics.commands.items(), key=by_total,
+                               reverse=True)[:top]
+        for (cog, command), h in commands_used:
+            p95 = h.quantile(0.95)
+            p95 = "{:.0f}".format(p95 * 1000) if p95 != float("inf") \
+                else ">{:.0f}".format(BUCKETS[-1] * 1000)
+            msg += "{}: {}, {}, {:.0f}ms, {}ms, {:.1f}s\n".format(
+                command, h.count, errors[(cog, command)],
+                h.sum / h.count * 1000, p95, h.sum)
+        if not commands_used:
+            msg += "None used yet.\n"
+
+        msg += "\nListeners (runs, average, total):\n"
+        listeners = sorted(metrics.listeners.items(), key=by_total,
+                           reverse=True)[:top]
+        for (cog, event), h in listeners:
+            msg += "{}.on_{}: {}, {:.1f}ms, {:.1f}s\n".format(
+                cog, event, h.count, h.sum / h.count * 1000, h.sum)
+        if not listeners:
+            msg += "None run yet.\n"
+        for page in pagify(msg, ["\n"], shorten_by=16):
+            await self.bot.say(box(page))
+
     @commands.group(name="command", pass_context=True)
     @checks.is_owner()
     async def command_disabler(self, ctx):
@@ -68,14 +68,10 @@ class Check:
 
         has_perm = perm_cog.resolve_permission(ctx)
 
-        if has_perm:
-            log.debug("user {} allowed to execute {}"
-                      " chid {}".format(ctx.message.author.name,
-                                        ctx.command.qualified_name,
-                                        ctx.message.channel.id))
-        else:
-            log.debug("user {} not allowed to execute {}"
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("user {} {}allowed to execute {}"
                       " chid {}".format(ctx.message.author.name,
+                                        "" if has_perm else "not ",
                                         ctx.command.qualified_name,
                                         ctx.message.channel.id))
 
@@ -102,6 +98,10 @@ class Permissions:
         self.perms_we_want = self._load_perms()
         self.perm_lock = asyncio.Lock()
 
+        # Resolved decisions per server, keyed by
+        # (command, channel id, frozenset of the author's role ids)
+        self._decisions = {}
+
         self.check_adder = bot.loop.create_task(self.add_checks_to_all())
 
     def __unload(self):
@@ -222,10 +222,11 @@ class Permissions:
 
         ordered_roles = sorted(roles, key=lambda r: r.position)
 
-        log.debug("Ordered roles for sid {}:\n\t{}".format(server.id,
-                                                           ordered_roles))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Ordered roles for sid {}:\n\t{}".format(
+                server.id, ordered_roles))
 
-        return sorted(roles, key=lambda r: r.position)
+        return ordered_roles
 
     def _get_role(self, roles, role_string):
         if role_string.lower() == "everyone":
@@ -425,8 +426,35 @@ class Permissions:
 
         self._save_perms()
 
+    def _invalidate(self, server=None):
+        """Drops cached decisions, of a single server if given"""
+        if server is None:
+            self._decisions.clear()
+        else:
+            self._decisions.pop(server.id, None)
+
     def resolve_permission(self, ctx):
         command = ctx.command.qualified_name.replace(' ', '.')
+        if command not in self.perms_we_want:
+            return True
+
+        server = ctx.message.server
+        channel = ctx.message.channel
+        author = ctx.message.author
+        key = (command, channel.id, frozenset(r.id for r in author.roles))
+        decisions = self._decisions.setdefault(server.id, {})
+        try:
+            return decisions[key]
+        except KeyError:
+            pass
+
+        if len(decisions) >= 10000:
+            decisions.clear()
+        has_perm = self._resolve_permission(ctx, command)
+        decisions[key] = has_perm
+        return has_perm
+
+    def _resolve_permission(self, ctx, command):
         server = ctx.message.server
         channel = ctx.message.channel
         roles = reversed(self._get_ordered_role_list(
@@ -489,6 +517,8 @@ class Permissions:
         return has_perm
 
     def _save_perms(self):
+        # Every change to perms_we_want ends up here
+        self._invalidate()
         dataIO.save_json('data/permissions/perms.json', self.perms_we_want)
 
     async def _set_channel(self, command, server, channel, allow):
@@ -855,6 +885,26 @@ class Permissions:
         await self._lock_server(command, server, False)
         await self.bot.say("Server unlocked {}".format(command))
 
+    async def on_server_role_create(self, role):
+        self._invalidate(role.server)
+
+    async def on_server_role_delete(self, role):
+        self._invalidate(role.server)
+
+    async def on_server_role_update(self, before, after):
+        self._invalidate(after.server)
+
+    async def on_channel_update(self, before, after):
+        if not after.is_private:
+            self._invalidate(after.server)
+
+    async def on_channel_delete(self, channel):
+        if not channel.is_private:
+            self._invalidate(channel.server)
+
+    async def on_server_remove(self, server):
+        self._invalidate(server)
+
     async def command_error(self, error, ctx):
         cmd = ctx.command
         if cmd and cmd.qualified_name.split(" ")[0] == "p":
@@ -1,6 +1,6 @@
 import discord
 from discord.ext import commands
-from .utils.dataIO import fileIO
+from .utils.dataIO import dataIO, fileIO
 import os
 import asyncio
 import time
@@ -70,10 +70,11 @@ class RemindMe:
         logger.info("{} ({}) set a reminder.".format(author.name, author.id))
         await self.bot.say("I will remind you that in {} {}.".format(str(quantity), time_unit + s))
 
-    def _remindme( self, author, future, repeat, text ):
+    def _remindme( self, author, future, repeat, text, save=True ):
         """Accepts: minutes, hours, days, weeks, month"""
         self.reminders.append({"ID" : author, "FUTURE" : future, "REPEAT" : repeat, "TEXT" : text})
-        fileIO("data/remindme/reminders.json", "save", self.reminders)
+        if save:
+            fileIO("data/remindme/reminders.json", "save", self.reminders)
 
     @commands.command(pass_context=True)
     async def forgetme(self, ctx):
@@ -108,9 +109,9 @@ class RemindMe:
             for reminder in to_remove:
                 self.reminders.remove(reminder)
                 if reminder["REPEAT"] > 0:
-                    self._remindme( reminder["ID"], int(time.time()+reminder["REPEAT"]), reminder["REPEAT"], reminder["TEXT"])
+                    self._remindme( reminder["ID"], int(time.time()+reminder["REPEAT"]), reminder["REPEAT"], reminder["TEXT"], save=False)
             if to_remove:
-                fileIO("data/remindme/reminders.json", "save", self.reminders)
+                await dataIO.save_json_async("data/remindme/reminders.json", self.reminders)
             await asyncio.sleep(5)
 
 def check_folders():
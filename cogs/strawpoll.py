@@ -1,8 +1,5 @@
 # Strawpoll functionality by Savestate for Red-DiscordBot
 
-import urllib3
-import certifi
-import json
 import traceback
 import discord
 import asyncio
@@ -10,29 +7,27 @@ import os
 from collections import defaultdict
 from .utils import checks
 from .utils.dataIO import dataIO
+from .utils.async_ import Route, request
+from .utils.sync import ResponseError
 from concurrent.futures import CancelledError
 from html import unescape
 from time import sleep, time as currenttime, strftime
 from datetime import datetime
 from discord.ext import commands
 
-def _get_poll(poll_id):
+STRAWPOLL_API = 'https://strawpoll.me/api/v2/'
+
+async def _get_poll(client, poll_id):
     # https://strawpoll.me/api/v2/polls/{poll_id}
-    https = urllib3.PoolManager(
-        cert_reqs='CERT_REQUIRED',
-        ca_certs=certifi.where())
+    route = Route(STRAWPOLL_API, 'polls/' + str(poll_id))
+    route.timeout = 3.0
+    route.retries = 3
     try:
-        request = https.request( 'GET', 
-            'https://strawpoll.me/api/v2/polls/' + str(poll_id),
-            retries=3, timeout=3.0)
-        json_response = json.loads(request.data.decode('utf-8'))
-    except urllib3.exceptions.HTTPError:
-        return None
-    except json.decoder.JSONDecodeError:
+        return await route.async_query(client=client)
+    except ResponseError:
         return None
-    return json_response
     
-def _post_poll(title, options, multi):
+async def _post_poll(client, title, options, multi):
     # build json request
     data = {
         'title': title,
@@ -40,23 +35,17 @@ def _post_poll(title, options, multi):
         'multi': multi,
         'dupcheck': 'normal',
         'captcha': False }
-    encoded_data = json.dumps(data).encode('utf-8')
-    # urllib3 pool manager in https mode
-    https = urllib3.PoolManager(
-        cert_reqs='CERT_REQUIRED',
-        ca_certs=certifi.where())
+    # Strawpoll explains rejected polls in the body, so any status goes.
+    # Not retried: a POST that timed out may still have made the poll
     try:
-        request = https.request(
-            'POST', 'https://strawpoll.me/api/v2/polls',
-            body=encoded_data, headers={
-                'Content-Type': 'application/json',
-                'Accept-Charset': 'utf-8'
-            },
-            retries=3, timeout=3.0)
-        json_response = json.loads(request.data.decode('utf-8'))
-    except urllib3.exceptions.HTTPError:
+        status, response = await request(
+            client, 'POST', STRAWPOLL_API + 'polls', json=data,
+            headers={'Accept-Charset': 'utf-8'}, timeout=3.0, retries=0)
+    except ResponseError:
         return None
-    return json_response
+    if not isinstance(response, dict):
+        return None
+    return response
 
 def _sleep_time(poll_length):
     if poll_length < 5*60: # 5 minutes
@@ -111,10 +100,11 @@ class _Poll:
         return display_bar
 
     async def update_results(self):
-        data = _get_poll(self.poll_id)
+        data = await _get_poll(self.bot.http_client, self.poll_id)
         if data is None:
             await self.bot.edit_message(self.message, 
                 embed=discord.Embed(title="Error receiving strawpoll data!"))
+            return
         self.poll_title = unescape(data['title'])
         embed=discord.Embed(title=unescape(data['title']), 
             url='https://strawpoll.me/' + str(self.poll_id), 
@@ -347,7 +337,7 @@ class Strawpoll:
         title = poll[0]
         options = poll[1].split(';')
         options[:] = [option for option in options if option.strip()]
-        response = _post_poll(title, options, multi)
+        response = await _post_poll(self.bot.http_client, title, options, multi)
         if not response:
             await self.bot.send_message(ctx.message.channel, 
                 "Uh-oh, no response from Strawpoll received!")
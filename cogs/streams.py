@@ -1,17 +1,18 @@
 from discord.ext import commands
-from .utils.dataIO import dataIO
+from .utils.dataIO import dataIO, writebehind
 from .utils.chat_formatting import escape_mass_mentions
 from .utils import checks
-from collections import defaultdict
+from collections import defaultdict, deque
+from datetime import datetime, timezone
 from string import ascii_letters
 from random import choice
 import discord
 import os
 import re
-import aiohttp
 import asyncio
 import logging
 import json
+import time
 
 
 class StreamsError(Exception):
@@ -34,6 +35,39 @@ class OfflineStream(StreamsError):
     pass
 
 
+class RateLimiter:
+    """Spaces out the requests made to a provider
+
+    At most `rate` requests start every `per` seconds and no more than
+    `concurrency` of them are in flight at once."""
+
+    def __init__(self, rate, per=1.0, concurrency=4):
+        self.interval = per / rate
+        self.requests = 0
+        self.throttled = 0  # Requests that had to wait for their slot
+        self.throttled_time = 0.0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._next_slot = 0.0
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        now = time.monotonic()
+        wait = self._next_slot - now
+        self._next_slot = max(now, self._next_slot) + self.interval
+        self.requests += 1
+        if wait > 0:
+            self.throttled += 1
+            self.throttled_time += wait
+            try:
+                await asyncio.sleep(wait)
+            except:
+                self._semaphore.release()
+                raise
+
+    async def __aexit__(self, *exc_info):
+        self._semaphore.release()
+
+
 class Streams:
     """Streams
 
@@ -48,6 +82,15 @@ class Streams:
         settings = dataIO.load_json("data/streams/settings.json")
         self.settings = defaultdict(dict, settings)
         self.messages_cache = defaultdict(list)
+        self.limiters = {"twitch": RateLimiter(2, concurrency=2),
+                         "hitbox": RateLimiter(5),
+                         "mixer": RateLimiter(5),
+                         "picarto": RateLimiter(5)}
+        self._last_offline = {}  # key -> time.time() it was last seen offline
+        self.alert_latency = deque(maxlen=100)
+        self.last_sweep = 0.0
+        self.last_sweep_checked = 0
+        self._save_streams = False
 
     @commands.command()
     async def hitbox(self, stream: str):
@@ -338,10 +381,37 @@ class Streams:
 
         dataIO.save_json("data/streams/settings.json", self.settings)
 
+    @streamset.command()
+    @checks.is_owner()
+    async def stats(self):
+        """Shows how long stream checks and alerts take"""
+        msg = ("Last check: {} streams in {:.1f}s"
+               "".format(self.last_sweep_checked, self.last_sweep))
+        latencies = sorted(self.alert_latency)
+        if latencies:
+            avg = sum(latencies) / len(latencies)
+            p95 = latencies[min(len(latencies) - 1,
+                                int(len(latencies) * 0.95))]
+            msg += ("\nAlert latency over the last {} alerts:\n"
+                    "Average: {:.1f}s\n"
+                    "95th percentile: {:.1f}s\n"
+                    "Maximum: {:.1f}s".format(len(latencies), avg, p95,
+                                              latencies[-1]))
+        else:
+            msg += "\nNo alerts sent yet."
+        throttled = ["{}: {} of {} requests, {:.1f}s".format(
+                         provider, limiter.throttled, limiter.requests,
+                         limiter.throttled_time)
+                     for provider, limiter in sorted(self.limiters.items())
+                     if limiter.requests]
+        if throttled:
+            msg += "\nRate limited:\n" + "\n".join(throttled)
+        await self.bot.say(msg)
+
     async def hitbox_online(self, stream):
         url = "https://api.hitbox.tv/media/live/" + stream
 
-        async with aiohttp.get(url) as r:
+        async with self.bot.http_client.get(url) as r:
             data = await r.json(encoding='utf-8')
 
         if "livestream" not in data:
@@ -354,16 +424,14 @@ class Streams:
         raise APIError()
 
     async def twitch_online(self, stream):
-        session = aiohttp.ClientSession()
         url = "https://api.twitch.tv/kraken/streams/" + stream
         header = {
             'Client-ID': self.settings.get("TWITCH_TOKEN", ""),
             'Accept': 'application/vnd.twitchtv.v5+json'
         }
 
-        async with session.get(url, headers=header) as r:
+        async with self.bot.http_client.get(url, headers=header) as r:
             data = await r.json(encoding='utf-8')
-        await session.close()
         if r.status == 200:
             if data["stream"] is None:
                 raise OfflineStream()
@@ -378,7 +446,7 @@ class Streams:
     async def mixer_online(self, stream):
         url = "https://mixer.com/api/v1/channels/" + stream
 
-        async with aiohttp.get(url) as r:
+        async with self.bot.http_client.get(url) as r:
             data = await r.json(encoding='utf-8')
         if r.status == 200:
             if data["online"] is True:
@@ -393,7 +461,7 @@ class Streams:
     async def picarto_online(self, stream):
         url = "https://api.picarto.tv/v1/channel/name/" + stream
 
-        async with aiohttp.get(url) as r:
+        async with self.bot.http_client.get(url) as r:
             data = await r.text(encoding='utf-8')
         if r.status == 200:
             data = json.loads(data)
@@ -419,9 +487,8 @@ class Streams:
         results = []
 
         for streams_list in chunks(streams):
-            session = aiohttp.ClientSession()
             url = base_url + ",".join(streams_list)
-            async with session.get(url, headers=header) as r:
+            async with self.bot.http_client.get(url, headers=header) as r:
                 data = await r.json()
             if r.status == 200:
                 results.extend(data["users"])
@@ -429,13 +496,42 @@ class Streams:
                 raise InvalidCredentials()
             else:
                 raise APIError()
-            await session.close()
 
         if not results and raise_if_none:
             raise StreamNotFound()
 
         return results
 
+    async def fetch_twitch_streams(self, *ids):
+        """Returns {channel id: stream data} for the live ones among ids
+
+        Ids are looked up 100 per request"""
+        base_url = "https://api.twitch.tv/kraken/streams/?limit=100&channel="
+        header = {
+            'Client-ID': self.settings.get("TWITCH_TOKEN", ""),
+            'Accept': 'application/vnd.twitchtv.v5+json'
+        }
+
+        async def fetch(ids_list):
+            url = base_url + ",".join(ids_list)
+            async with self.limiters["twitch"]:
+                async with self.bot.http_client.get(url, headers=header) as r:
+                    data = await r.json(encoding='utf-8')
+            if r.status == 200:
+                return data["streams"]
+            elif r.status == 400:
+                raise InvalidCredentials()
+            else:
+                raise APIError()
+
+        chunks = [ids[i:i + 100] for i in range(0, len(ids), 100)]
+        pages = await asyncio.gather(*[fetch(c) for c in chunks])
+        live = {}
+        for page in pages:
+            for stream in page:
+                live[str(stream["channel"]["_id"])] = stream
+        return live
+
     def twitch_embed(self, data):
         channel = data["stream"]["channel"]
         url = channel["url"]
@@ -560,58 +656,152 @@ class Streams:
                   "{}".format(e))
 
         while self == self.bot.get_cog("Streams"):
-            save = False
-
-            streams = ((self.twitch_streams,  self.twitch_online),
-                       (self.hitbox_streams,  self.hitbox_online),
-                       (self.mixer_streams,    self.mixer_online),
-                       (self.picarto_streams, self.picarto_online))
-
-            for streams_list, parser in streams:
-                if parser == self.twitch_online:
-                    _type = "ID"
-                else:
-                    _type = "NAME"
-                for stream in streams_list:
-                    if _type not in stream:
-                        continue
-                    key = (parser, stream[_type])
+            started = time.monotonic()
+            checks = [self.check_twitch_streams(),
+                      self.check_streams(self.hitbox_streams,
+                                         self.hitbox_online, "hitbox"),
+                      self.check_streams(self.mixer_streams,
+                                         self.mixer_online, "mixer"),
+                      self.check_streams(self.picarto_streams,
+                                         self.picarto_online, "picarto")]
+            results = await asyncio.gather(*checks, return_exceptions=True)
+            self.last_sweep = time.monotonic() - started
+            self.last_sweep_checked = sum(r for r in results
+                                          if isinstance(r, int))
+
+            if self._save_streams:
+                self._save_streams = False
+                writebehind.mark_dirty("data/streams/twitch.json", self.twitch_streams)
+                writebehind.mark_dirty("data/streams/hitbox.json", self.hitbox_streams)
+                writebehind.mark_dirty("data/streams/beam.json", self.mixer_streams)
+                writebehind.mark_dirty("data/streams/picarto.json", self.picarto_streams)
+
+            await asyncio.sleep(CHECK_DELAY)
+
+    async def check_twitch_streams(self):
+        """Checks every twitch stream, 100 per API call
+
+        Returns the number of streams checked"""
+        streams = [s for s in self.twitch_streams if "ID" in s]
+        chunks = [streams[i:i + 100] for i in range(0, len(streams), 100)]
+
+        async def check_chunk(chunk):
+            try:
+                live = await self.fetch_twitch_streams(
+                    *[str(s["ID"]) for s in chunk])
+            except:  # We don't want our task to die
+                return 0
+            updates = []
+            for stream in chunk:
+                data = live.get(str(stream["ID"]))
+                embed = None
+                went_live = None
+                if data is not None:
                     try:
-                        embed = await parser(stream[_type])
-                    except OfflineStream:
-                        if stream["ALREADY_ONLINE"]:
-                            stream["ALREADY_ONLINE"] = False
-                            save = True
-                            await self.delete_old_notifications(key)
-                    except:  # We don't want our task to die
+                        embed = self.twitch_embed({"stream": data})
+                    except Exception:
                         continue
-                    else:
-                        if stream["ALREADY_ONLINE"]:
-                            continue
-                        save = True
-                        stream["ALREADY_ONLINE"] = True
-                        messages_sent = []
-                        for channel_id in stream["CHANNELS"]:
-                            channel = self.bot.get_channel(channel_id)
-                            if channel is None:
-                                continue
-                            mention = self.settings.get(channel.server.id, {}).get("MENTION", "")
-                            can_speak = channel.permissions_for(channel.server.me).send_messages
-                            message = mention + " {} is live!".format(stream["NAME"])
-                            if channel and can_speak:
-                                m = await self.bot.send_message(channel, message, embed=embed)
-                                messages_sent.append(m)
-                        self.messages_cache[key] = messages_sent
-
-                    await asyncio.sleep(0.5)
-
-            if save:
-                dataIO.save_json("data/streams/twitch.json", self.twitch_streams)
-                dataIO.save_json("data/streams/hitbox.json", self.hitbox_streams)
-                dataIO.save_json("data/streams/beam.json", self.mixer_streams)
-                dataIO.save_json("data/streams/picarto.json", self.picarto_streams)
+                    went_live = self._parse_twitch_time(data.get("created_at"))
+                key = (self.twitch_online, stream["ID"])
+                updates.append(self.update_stream(key, stream, embed,
+                                                  went_live))
+            await asyncio.gather(*updates, return_exceptions=True)
+            return len(chunk)
 
-            await asyncio.sleep(CHECK_DELAY)
+        checked = await asyncio.gather(*[check_chunk(c) for c in chunks])
+        return sum(checked)
+
+    async def check_streams(self, streams_list, parser, provider):
+        """Checks streams_list concurrently under the provider's limiter
+
+        Returns the number of streams checked"""
+        limiter = self.limiters[provider]
+
+        async def check(stream):
+            key = (parser, stream["NAME"])
+            try:
+                async with limiter:
+                    embed = await parser(stream["NAME"])
+            except OfflineStream:
+                embed = None
+            except:  # We don't want our task to die
+                return 0
+            await self.update_stream(key, stream, embed)
+            return 1
+
+        checked = await asyncio.gather(*[check(s) for s in list(streams_list)
+                                         if "NAME" in s],
+                                       return_exceptions=True)
+        return sum(c for c in checked if isinstance(c, int))
+
+    async def update_stream(self, key, stream, embed, went_live=None):
+        """Sends or deletes the alerts of a stream after a check
+
+        embed is None if the stream is offline"""
+        if embed is None:
+            self._last_offline[key] = time.time()
+            if stream["ALREADY_ONLINE"]:
+                stream["ALREADY_ONLINE"] = False
+                self._save_streams = True
+                await self.delete_old_notifications(key)
+            return
+
+        if stream["ALREADY_ONLINE"]:
+            return
+        self._save_streams = True
+        stream["ALREADY_ONLINE"] = True
+        messages_sent = []
+        for channel_id in stream["CHANNELS"]:
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                continue
+            mention = self.settings.get(channel.server.id, {}).get("MENTION", "")
+            can_speak = channel.permissions_for(channel.server.me).send_messages
+            message = mention + " {} is live!".format(stream["NAME"])
+            if channel and can_speak:
+                try:
+                    m = await self.bot.send_message(channel, message, embed=embed)
+                except discord.DiscordException:
+                    continue
+                messages_sent.append(m)
+        self.messages_cache[key] = messages_sent
+        self._record_latency(key, went_live)
+
+    def _record_latency(self, key, went_live):
+        # Only streams seen offline before can tell how late the alert is.
+        # Without a start time from the API, the last offline check is
+        # the earliest it could have gone live
+        last_offline = self._last_offline.pop(key, None)
+        if last_offline is None:
+            return
+        if went_live is None or went_live < last_offline:
+            went_live = last_offline
+        self.alert_latency.append(max(0.0, time.time() - went_live))
+
+    @staticmethod
+    def _parse_twitch_time(timestamp):
+        try:
+            dt = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ")
+        except (TypeError, ValueError):
+            return None
+        return dt.replace(tzinfo=timezone.utc).timestamp()
+
+    def get_metrics(self):
+        latencies = self.alert_latency
+        metrics = {"streams_checked": self.last_sweep_checked,
+                   "last_sweep_seconds": self.last_sweep,
+                   "alerts": len(latencies),
+                   "avg_alert_latency": (sum(latencies) / len(latencies)
+                                         if latencies else 0.0),
+                   "max_alert_latency": max(latencies) if latencies else 0.0}
+        for provider, limiter in self.limiters.items():
+            metrics[provider + "_requests"] = limiter.requests
+            metrics[provider + "_throttled"] = limiter.throttled
+            metrics[provider + "_throttled_seconds"] = limiter.throttled_time
+        return metrics
+
+    def __unload(self):
+        self.bot.metrics.remove_collector("streams")
 
     async def delete_old_notifications(self, key):
         for message in self.messages_cache[key]:
@@ -650,7 +840,8 @@ class Streams:
         # We might as well delete the invalid / renamed ones
         self.twitch_streams = [s for s in self.twitch_streams if "ID" in s]
 
-        dataIO.save_json("data/streams/twitch.json", self.twitch_streams)
+        await dataIO.save_json_async("data/streams/twitch.json",
+                                     self.twitch_streams)
 
 
 def check_folders():
@@ -687,3 +878,4 @@ def setup(bot):
     loop = asyncio.get_event_loop()
     loop.create_task(n.stream_checker())
     bot.add_cog(n)
+    bot.metrics.add_collector("streams", n.get_metrics)
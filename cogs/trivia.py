@@ -189,6 +189,8 @@ class Trivia:
         return None
 
     async def on_message(self, message):
+        if not self.trivia_sessions:
+            return
         if message.author != self.bot.user:
             session = self.get_trivia_by_channel(message.channel)
             if session:
@@ -1,37 +1,100 @@
+import asyncio
 import io
+import json
 
 try:
     import aiohttp
 except ImportError:
     print("Aiohttp module not installed, async functions not available!")
 
-from . import sync_
+from . import sync as sync_
+from .httpclient import HTTPClient
+
+# Statuses worth trying again, anything else is returned or raised as is
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+
+async def request(client, method, url, *, read="json", timeout=None,
+                  retries=2, retry_delay=1, **kwargs):
+    """Makes a request and returns its status and body
+
+    read is "json", "text" or "bytes". Timeouts, connection errors and
+    5xx/429 responses are retried with exponential backoff. Raises
+    ResponseError once retries run out. client is usually
+    bot.http_client, a temporary one is used if it's None"""
+    own_client = client is None
+    if own_client:
+        client = HTTPClient()
+    try:
+        for attempt in range(retries + 1):
+            if attempt:
+                await asyncio.sleep(retry_delay * 2 ** (attempt - 1))
+            last = attempt == retries
+            try:
+                async with client.request(method, url, timeout=timeout,
+                                          **kwargs) as res:
+                    if res.status in RETRY_STATUSES and not last:
+                        continue
+                    if read == "bytes":
+                        body = await res.read()
+                    else:
+                        body = await res.text()
+                    status = res.status
+            except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                if last:
+                    raise sync_.ResponseError("{} {} failed: {!r}"
+                                              "".format(method, url, e))
+                continue
+            if read == "json":
+                try:
+                    body = json.loads(body)
+                except ValueError:
+                    # Error pages are often HTML, those are left as text
+                    if 200 <= status < 300:
+                        raise sync_.ResponseError("{} {} did not return "
+                                                  "JSON".format(method, url))
+            return status, body
+    finally:
+        if own_client:
+            await client.close()
 
 
 class Route(sync_.Route):
-    async def async_query(self, url_params=None):
-        async with aiohttp.ClientSession() as ses:
-            async with getattr(ses, self.method.lower())(
-                    self.base_url+self.path, headers=self.headers) as res:
-                if 200 <= res.status < 300:
-                    retval = await res.json()
-                    if self.cdn_url is None:
-                        return retval
-                    return Result(**retval, cdn_url=self.cdn_url)
-
-                else:
-                    raise sync_.ResponseError(
-                            "Expected a response code in range 200-299, got {}"
-                            .format(res.status))
+    timeout = None  # The client's default
+    retries = 2
+
+    async def async_query(self, url_params=None, client=None, *,
+                          read="json", **kwargs):
+        """Queries the route, through client (bot.http_client) if passed
+
+        url_params are sent as the query string, other kwargs (json,
+        data...) go to the request"""
+        if url_params is not None:
+            kwargs["params"] = url_params
+        status, body = await request(client, self.method,
+                                     self.base_url+self.path,
+                                     headers=self.headers, read=read,
+                                     timeout=self.timeout,
+                                     retries=self.retries, **kwargs)
+        if 200 <= status < 300:
+            if self.cdn_url is None or read != "json":
+                return body
+            return Result(**body, cdn_url=self.cdn_url)
+
+        else:
+            raise sync_.ResponseError(
+                    "Expected a response code in range 200-299, got {}"
+                    .format(status))
 
 
 class Result(sync_.Result):
-    async def async_download(self):
-        async with aiohttp.ClientSession() as ses:
-            async with ses.get(self.cdn_url+self.cdn_path) as res:
-                if 200 <= res.status < 300:
-                    return io.BytesIO(await res.read())
-                else:
-                    raise sync_.ResponseError(
-                            "Expected a response code in range 200-299, got {}"
-                            .format(res.status))
+    async def async_download(self, client=None):
+        status, body = await request(client, "GET",
+                                     self.cdn_url+self.cdn_path,
+                                     read="bytes")
+        if 200 <= status < 300:
+            return io.BytesIO(body)
+        else:
+            raise sync_.ResponseError(
+                    "Expected a response code in range 200-299, got {}"
+                    .format(status))
@@ -1,24 +1,224 @@
+import asyncio
 import json
 import os
 import logging
+import threading
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
 from random import randint
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 class InvalidFileIO(Exception):
     pass
 
+class UnavailableCodec(Exception):
+    pass
+
+class JSONCodec():
+    """Red's original format: indented JSON with sorted keys"""
+    name = "json"
+
+    def dumps(self, data):
+        return json.dumps(data, indent=4, sort_keys=True,
+                          separators=(',',' : ')).encode("utf-8")
+
+    def loads(self, raw):
+        if orjson is not None:
+            try:
+                return orjson.loads(raw)
+            except orjson.JSONDecodeError:
+                pass  # NaN, huge ints... let the json module try
+        return json.loads(raw.decode("utf-8"))
+
+class CompactJSONCodec(JSONCodec):
+    """Unindented JSON, keys kept in insertion order"""
+    name = "compact"
+
+    def dumps(self, data):
+        return json.dumps(data, separators=(',',':')).encode("utf-8")
+
+class OrjsonCodec(JSONCodec):
+    """Compact JSON encoded by orjson"""
+    name = "orjson"
+
+    def dumps(self, data):
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:  # Something orjson won't take, e.g. huge ints
+            return CompactJSONCodec.dumps(self, data)
+
+def _json_key(key):
+    """What key becomes once it's been through JSON"""
+    if isinstance(key, str):
+        return key
+    if key is True or key is False or key is None:
+        return json.dumps(key)
+    if isinstance(key, (int, float)):
+        return json.dumps(key)
+    raise TypeError("keys must be str, int, float, bool or None, "
+                    "not {}".format(type(key).__name__))
+
+def _json_keys(data):
+    """Copy of data with every dict key turned into a string, like JSON"""
+    if isinstance(data, dict):
+        return {_json_key(k): _json_keys(v) for k, v in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [_json_keys(v) for v in data]
+    return data
+
+class MsgpackCodec():
+    """Binary msgpack. Files keep their .json extension
+
+    Keys are saved as strings, so data loads back the same as it
+    would from a JSON file"""
+    name = "msgpack"
+
+    def dumps(self, data):
+        return msgpack.packb(_json_keys(data), use_bin_type=True)
+
+    def loads(self, raw):
+        if msgpack is None:
+            raise UnavailableCodec("This file is in msgpack format but "
+                                   "the msgpack module is not installed")
+        return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+
+CODECS = {"json": JSONCodec(), "compact": CompactJSONCodec()}
+if orjson is not None:
+    CODECS["orjson"] = OrjsonCodec()
+if msgpack is not None:
+    CODECS["msgpack"] = MsgpackCodec()
+
+# Anything a JSON document can start with. msgpack maps and arrays
+# start with bytes >= 0x80, so there's no ambiguity for Red's files
+_JSON_START = frozenset(b' \t\r\n{["-0123456789tfn')
+
+def detect_codec(raw):
+    """Returns the codec able to read raw"""
+    if not raw or raw[0] in _JSON_START:
+        return CODECS["json"]
+    return CODECS.get("msgpack", MsgpackCodec())
+
 class DataIO():
+    max_workers = 4
+    # How a tmp file is checked before it replaces the original:
+    # "checksum" compares the CRC of what's on disk with what was encoded,
+    # "parse" decodes the whole file again like Red always did
+    integrity = "checksum"
+
     def __init__(self):
         self.logger = logging.getLogger("red")
+        self.codec = CODECS["json"]
+        self._executor = None
+        self._locks = {}
+        self._generation = Counter()
+        # What's on disk, per file. Saves run on the event loop and in
+        # the thread pool, a save older than it is never written
+        self._written = Counter()
+        self._file_locks = {}
+        self._file_locks_lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def set_codec(self, name):
+        """Sets the format new saves are written in
+
+        Files in any other format are still read fine, they get
+        converted the next time they're saved"""
+        try:
+            self.codec = CODECS[name]
+        except KeyError:
+            raise UnavailableCodec("Codec {} is unknown or its module is "
+                                   "not installed".format(name))
 
     def save_json(self, filename, data):
-        """Atomically saves json file"""
+        """Atomically saves json file
+
+        Waits for an async save of the same file that is being written,
+        async saves older than this one are skipped"""
+        generation = self._next_generation(filename)
+        return self._atomic_save(filename, data, generation=generation)
+
+    async def save_json_async(self, filename, data):
+        """Atomically saves json file without blocking the event loop
+
+        The data is copied right away, so it can be changed as soon as
+        this is called. Encoding and disk I/O happen in a thread pool.
+        Saves of the same file are done in order and a save that has
+        been superseded by a newer one before it started is skipped."""
+        snapshot = deepcopy(data)
+        generation = self._next_generation(filename)
+        lock = self._locks.get(filename)
+        if lock is None:
+            lock = self._locks[filename] = asyncio.Lock()
+        async with lock:
+            if generation != self._generation[filename]:
+                return True
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                self.executor, self._atomic_save, filename, snapshot, True,
+                generation)
+
+    def wait_pending(self):
+        """Blocks until every save running in the thread pool is done"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def load_json_async(self, filename):
+        """Loads json file in a thread pool"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, self._read_json,
+                                          filename)
+
+    def _next_generation(self, filename):
+        with self._file_locks_lock:
+            self._generation[filename] += 1
+            return self._generation[filename]
+
+    def _file_lock(self, filename):
+        with self._file_locks_lock:
+            lock = self._file_locks.get(filename)
+            if lock is None:
+                lock = self._file_locks[filename] = threading.Lock()
+            return lock
+
+    def _atomic_save(self, filename, data, fsync=False, generation=None):
+        with self._file_lock(filename):
+            if generation is not None:
+                if generation < self._written[filename]:
+                    return True  # A newer save got there first
+            saved = self._write_file(filename, data, fsync)
+            if saved and generation is not None:
+                self._written[filename] = generation
+            return saved
+
+    def _write_file(self, filename, data, fsync):
         rnd = randint(1000, 9999)
         path, ext = os.path.splitext(filename)
         tmp_file = "{}-{}.tmp".format(path, rnd)
-        self._save_json(tmp_file, data)
+        raw = self._save_json(tmp_file, data, fsync=fsync)
         try:
-            self._read_json(tmp_file)
-        except json.decoder.JSONDecodeError:
+            if self.integrity == "parse":
+                self._read_json(tmp_file)
+            else:
+                self._verify_checksum(tmp_file, zlib.crc32(raw), len(raw))
+        except ValueError:
             self.logger.exception("Attempted to write file {} but JSON "
                                   "integrity check on tmp file has failed. "
                                   "The original file is unaltered."
@@ -27,6 +227,13 @@ class DataIO():
         os.replace(tmp_file, filename)
         return True
 
+    def _verify_checksum(self, filename, crc, size):
+        with open(filename, mode="rb") as f:
+            written = f.read()
+        if len(written) != size or zlib.crc32(written) != crc:
+            raise ValueError("Checksum mismatch: expected {} bytes with CRC "
+                             "{:08x}".format(size, crc))
+
     def load_json(self, filename):
         """Loads json file"""
         return self._read_json(filename)
@@ -38,19 +245,24 @@ class DataIO():
             return True
         except FileNotFoundError:
             return False
-        except json.decoder.JSONDecodeError:
+        except ValueError:
+            return False
+        except UnavailableCodec:
             return False
 
     def _read_json(self, filename):
-        with open(filename, encoding='utf-8', mode="r") as f:
-            data = json.load(f)
-        return data
+        with open(filename, mode="rb") as f:
+            raw = f.read()
+        return detect_codec(raw).loads(raw)
 
-    def _save_json(self, filename, data):
-        with open(filename, encoding='utf-8', mode="w") as f:
-            json.dump(data, f, indent=4,sort_keys=True,
-                separators=(',',' : '))
-        return data
+    def _save_json(self, filename, data, fsync=False):
+        raw = self.codec.dumps(data)
+        with open(filename, mode="wb") as f:
+            f.write(raw)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        return raw
 
     def _legacy_fileio(self, filename, IO, data=None):
         """Old fileIO provided for backwards compatibility"""
@@ -64,9 +276,141 @@ class DataIO():
             raise InvalidFileIO("FileIO was called with invalid"
                 " parameters")
 
+class WriteBehind():
+    """Coalesces saves of the same file into one write per interval
+
+    Cogs that change their data very often can call mark_dirty instead
+    of dataIO.save_json. The data object is kept by reference, so any
+    further change made to it before the next flush ends up in the same
+    write. A final flush happens when the bot shuts down."""
+
+    def __init__(self, io, interval=5):
+        self.io = io
+        self.interval = interval
+        self.logger = logging.getLogger("red")
+        self.stats = Counter()
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self._dirty = {}
+        self._task = None
+
+    @property
+    def pending(self):
+        """Number of files waiting to be written"""
+        return len(self._dirty)
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def mark_dirty(self, filename, data):
+        """Schedules data to be saved to filename on the next flush"""
+        if filename in self._dirty:
+            self.stats["coalesced"] += 1
+        self._dirty[filename] = data
+        self.stats["marked"] += 1
+        if not self.running:
+            # No flusher to rely on (e.g. before the bot started)
+            self.flush(filename)
+
+    def flush(self, filename=None):
+        """Writes pending data to disk
+
+        Flushes every pending file, or only filename if passed.
+        Returns the number of files written"""
+        pending = self._take(filename)
+        start = time.perf_counter()
+        results = []
+        for path, data in pending.items():
+            try:
+                results.append(self.io.save_json(path, data))
+            except Exception:
+                self.logger.exception("Deferred save of {} failed"
+                                      "".format(path))
+                results.append(False)
+        return self._done(pending, results, start)
+
+    async def flush_async(self):
+        """Writes every pending file from the dataIO thread pool"""
+        pending = self._take()
+        start = time.perf_counter()
+        results = []
+        items = list(pending.items())
+        for i, (path, data) in enumerate(items):
+            try:
+                results.append(await self.io.save_json_async(path, data))
+            except asyncio.CancelledError:
+                # Left for the final flush in stop()
+                for path, data in items[i:]:
+                    self._dirty.setdefault(path, data)
+                raise
+            except Exception:
+                self.logger.exception("Deferred save of {} failed"
+                                      "".format(path))
+                results.append(False)
+        return self._done(pending, results, start)
+
+    def _take(self, filename=None):
+        if filename is None:
+            pending, self._dirty = self._dirty, {}
+        elif filename in self._dirty:
+            pending = {filename: self._dirty.pop(filename)}
+        else:
+            pending = {}
+        return pending
+
+    def _done(self, pending, results, start):
+        written = 0
+        for (path, data), saved in zip(pending.items(), results):
+            if saved:
+                written += 1
+            else:
+                self.stats["failed"] += 1
+                # Keep it around unless something newer got marked
+                self._dirty.setdefault(path, data)
+        if pending:
+            latency = time.perf_counter() - start
+            self.last_flush_latency = latency
+            self.max_flush_latency = max(self.max_flush_latency, latency)
+            self.stats["flushes"] += 1
+            self.stats["written"] += written
+        return written
+
+    def start(self, loop):
+        """Starts the background flusher on loop"""
+        if not self.running:
+            self._task = loop.create_task(self._flusher())
+
+    def stop(self):
+        """Stops the background flusher and writes what's left"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.io.wait_pending()
+        return self.flush()
+
+    def get_metrics(self):
+        return {"pending": self.pending,
+                "marked": self.stats["marked"],
+                "coalesced": self.stats["coalesced"],
+                "flushes": self.stats["flushes"],
+                "written": self.stats["written"],
+                "failed": self.stats["failed"],
+                "last_flush_ms": self.last_flush_latency * 1000,
+                "max_flush_ms": self.max_flush_latency * 1000}
+
+    async def _flusher(self):
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                if self._dirty:
+                    await self.flush_async()
+        except asyncio.CancelledError:
+            pass
+
+
 def get_value(filename, key):
-    with open(filename, encoding='utf-8', mode="r") as f:
-        data = json.load(f)
+    data = dataIO.load_json(filename)
     return data[key]
 
 def set_value(filename, key, value):
@@ -76,4 +420,5 @@ def set_value(filename, key, value):
     return True
 
 dataIO = DataIO()
+writebehind = WriteBehind(dataIO)
 fileIO = dataIO._legacy_fileio # backwards compatibility
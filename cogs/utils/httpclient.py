@@ -0,0 +1,148 @@
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+import aiohttp
+
+#
+# One HTTP client for the whole bot, available as bot.http_client.
+# Connections are kept alive and reused across cogs, DNS lookups are
+# cached, each host gets a limited number of requests in flight and
+# every request has a deadline.
+#
+#     async with self.bot.http_client.get(url) as r:
+#         data = await r.json()
+#
+
+
+def _aiohttp_timeout(seconds):
+    """aiohttp's timeout for a request, None when seconds is falsy"""
+    if not seconds:
+        return None
+    if hasattr(aiohttp, "ClientTimeout"):  # aiohttp >= 3.3
+        return aiohttp.ClientTimeout(total=seconds)
+    return seconds
+
+
+class _RequestContext:
+    """The response of a request, released on exit
+
+    The timeout is enforced by aiohttp: it covers connecting, sending
+    and, with aiohttp 3, reading the body. It raises
+    asyncio.TimeoutError"""
+
+    def __init__(self, client, method, url, timeout, kwargs):
+        self.client = client
+        self.method = method
+        self.url = url
+        self.timeout = timeout
+        self.kwargs = kwargs
+        self.host = urlsplit(url).hostname or ""
+        self._response = None
+        self._acquired = False
+
+    async def __aenter__(self):
+        client = self.client
+        client.stats["requests"] += 1
+        client.requests_by_host[self.host] += 1
+        try:
+            await client._host_limit(self.host).acquire()
+            self._acquired = True
+            self._response = await client.session.request(
+                self.method, self.url,
+                timeout=_aiohttp_timeout(self.timeout), **self.kwargs)
+        except BaseException as e:
+            await self.__aexit__(type(e), e, e.__traceback__)
+            raise
+        return self._response
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._response is not None:
+            released = self._response.release()
+            if asyncio.iscoroutine(released) or \
+                    isinstance(released, asyncio.Future):
+                await released
+            self._response = None
+        if self._acquired:
+            self.client._host_limit(self.host).release()
+            self._acquired = False
+
+        if exc_type is not None and \
+                issubclass(exc_type, asyncio.TimeoutError):
+            self.client.stats["timeouts"] += 1
+        elif exc_type is not None and \
+                issubclass(exc_type, aiohttp.ClientError):
+            self.client.stats["errors"] += 1
+        return False
+
+
+class HTTPClient:
+    """Pooled aiohttp session shared by every cog"""
+
+    def __init__(self, loop=None, *, limit=100, limit_per_host=8,
+                 timeout=15):
+        self.loop = loop or asyncio.get_event_loop()
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.logger = logging.getLogger("red")
+        self.stats = Counter()
+        self.requests_by_host = Counter()
+        self._host_limits = defaultdict(
+            lambda: asyncio.Semaphore(self.limit_per_host))
+        self._session = None
+        self._limit = limit
+
+    @property
+    def session(self):
+        """The underlying aiohttp.ClientSession, created on first use"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self._limit,
+                                             use_dns_cache=True,
+                                             loop=self.loop)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  loop=self.loop)
+        return self._session
+
+    @property
+    def closed(self):
+        return self._session is None or self._session.closed
+
+    def _host_limit(self, host):
+        return self._host_limits[host]
+
+    def request(self, method, url, *, timeout=None, **kwargs):
+        """Returns an async context manager giving the response
+
+        timeout defaults to the client's, pass 0 to disable it (e.g.
+        for downloads that can take a while)"""
+        if timeout is None:
+            timeout = self.timeout
+        return _RequestContext(self, method, url, timeout, kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    async def close(self):
+        """Closes every pooled connection"""
+        if self._session is None:
+            return
+        closed = self._session.close()
+        if asyncio.iscoroutine(closed) or isinstance(closed, asyncio.Future):
+            await closed
+        self._session = None
+
+    def get_metrics(self):
+        return {"requests": self.stats["requests"],
+                "timeouts": self.stats["timeouts"],
+                "errors": self.stats["errors"],
+                "hosts": len(self.requests_by_host)}
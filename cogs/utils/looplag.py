@@ -0,0 +1,266 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+#
+# Finds out what blocks the event loop.
+#
+# A sampler sleeps for a fixed interval and records how late it wakes
+# up: that's the loop lag everything else suffers from too. Every
+# callback the loop runs is also timed, and those over the threshold
+# are attributed to the cog (and command, when there is one) whose
+# code they ran. Timing a callback costs two perf_counter calls.
+#
+# Once a callback returns, the code that blocked has usually returned
+# too, so a watchdog thread grabs the loop thread's stack while it's
+# still blocked, as soon as the callback runs past the threshold.
+#
+
+
+def _cog_of(filename):
+    """Returns the cog name of a source file, or None if it's not a cog"""
+    path, name = os.path.split(filename)
+    parts = os.path.normpath(path).split(os.sep)
+    if "cogs" not in parts:
+        return None
+    name = os.path.splitext(name)[0]
+    if parts[-1] == "utils":
+        return "utils." + name
+    return name
+
+
+def _describe(frames):
+    """Returns (cog, command, function) for (code, frame) pairs,
+    innermost first. frame can be None
+
+    The innermost cog frame gets the blame. Code in cogs/utils only
+    runs on behalf of a cog, so it's just what the function names,
+    unless no cog is involved at all"""
+    cog = command = name = detail = None
+    for code, frame in frames:
+        owner = _cog_of(code.co_filename)
+        if owner is not None and cog is None:
+            if not owner.startswith("utils."):
+                cog = owner
+                name = code.co_name
+                if detail is not None:
+                    name = "{} via {}".format(name, detail[1])
+            elif detail is None:
+                detail = (owner, "{}.{}".format(owner[len("utils."):],
+                                                code.co_name))
+        if frame is not None and command is None:
+            ctx = frame.f_locals.get("ctx")
+            cmd = getattr(ctx, "command", None)
+            if cmd is not None:
+                command = getattr(cmd, "qualified_name", None) or cmd.name
+    if cog is None and detail is not None:
+        cog, name = detail[0], detail[1].split(".", 1)[1]
+    return cog, command, name
+
+
+def describe_callback(handle):
+    """Returns (cog, command, function) for what handle ran
+
+    cog and command are None when they can't be told"""
+    callback = handle._callback
+    task = getattr(callback, "__self__", None)
+    if not isinstance(task, asyncio.Task):
+        cog = _cog_of(getattr(getattr(callback, "__code__", None),
+                              "co_filename", ""))
+        name = getattr(callback, "__qualname__", repr(callback))
+        return cog, None, name
+
+    coro = task.get_coro() if hasattr(task, "get_coro") else task._coro
+    name = getattr(coro, "__qualname__", repr(coro))
+    chain = []
+    # Down the chain of awaits
+    while coro is not None:
+        code = getattr(coro, "cr_code", None) or getattr(coro, "gi_code",
+                                                         None)
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame",
+                                                           None)
+        if code is not None:
+            chain.append((code, frame))
+        coro = getattr(coro, "cr_await", None) or \
+            getattr(coro, "gi_yieldfrom", None)
+    cog, command, function = _describe(reversed(chain))
+    return cog, command, function or name
+
+
+def describe_stack(frames):
+    """Returns (cog, command, function) for a stack, innermost first
+
+    cog and command are None when they can't be told"""
+    cog, command, name = _describe((frame.f_code, frame)
+                                   for frame in frames)
+    if name is None and frames:
+        code = frames[0].f_code
+        name = "{} ({})".format(code.co_name,
+                                os.path.basename(code.co_filename))
+    return cog, command, name
+
+
+class LoopMonitor:
+    """Samples event loop lag and records slow callbacks
+
+    Summaries go to the "red.metrics" logger every log_interval
+    seconds, and every slow callback as it happens"""
+
+    def __init__(self, loop, *, interval=0.25, threshold=0.05,
+                 log_interval=60):
+        self.loop = loop
+        self.interval = interval
+        self.threshold = threshold
+        self.log_interval = log_interval
+        self.logger = logging.getLogger("red.metrics")
+        self.lags = deque(maxlen=int(60 / interval))  # The last minute
+        self.max_lag = 0.0
+        self.slow_callbacks = deque(maxlen=20)  # (when, seconds, where)
+        self.blocked_time = Counter()  # where -> seconds spent blocking
+        self.blocked_calls = Counter()
+        self.stats = Counter()
+        self._task = None
+        self._original_run = None
+        self._period_blocked = Counter()
+        self._thread_id = None  # The loop's, known once the sampler runs
+        self._current = None  # (start, handle) of the running callback
+        self._stack = None  # (the same, frames) taken by the watchdog
+        self._watchdog = None
+        self._stopping = threading.Event()
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._install()
+        self._task = self.loop.create_task(self._sampler())
+        self._stopping.clear()
+        self._watchdog = threading.Thread(target=self._watch, daemon=True,
+                                          name="loop-lag-watchdog")
+        self._watchdog.start()
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._stopping.set()
+        self._watchdog = None
+        self._uninstall()
+
+    def _install(self):
+        if self._original_run is not None:
+            return
+        original = self._original_run = asyncio.events.Handle._run
+        perf_counter = time.perf_counter
+        monitor = self
+        loop = self.loop
+
+        def _run(handle):
+            if handle._loop is not loop:
+                return original(handle)
+            current = monitor._current = (perf_counter(), handle)
+            try:
+                original(handle)
+            finally:
+                monitor._current = None
+            elapsed = perf_counter() - current[0]
+            if elapsed >= monitor.threshold:
+                monitor._slow_callback(handle, elapsed, current)
+
+        asyncio.events.Handle._run = _run
+
+    def _uninstall(self):
+        if self._original_run is not None:
+            asyncio.events.Handle._run = self._original_run
+            self._original_run = None
+
+    def _watch(self):
+        """Takes the loop thread's stack when a callback runs too long"""
+        while not self._stopping.wait(self.threshold / 2):
+            current = self._current
+            if current is None or self._thread_id is None:
+                continue
+            if time.perf_counter() - current[0] < self.threshold:
+                continue
+            stack = self._stack
+            if stack is not None and stack[0] is current:
+                continue  # Already got this one
+            frame = sys._current_frames().get(self._thread_id)
+            frames = []
+            while frame is not None:
+                frames.append(frame)
+                frame = frame.f_back
+            self._stack = (current, frames)
+
+    def _slow_callback(self, handle, elapsed, current):
+        stack, self._stack = self._stack, None
+        try:
+            if stack is not None and stack[0] is current:
+                cog, command, name = describe_stack(stack[1])
+            else:  # Too short for the watchdog to catch it
+                cog, command, name = describe_callback(handle)
+        except Exception:  # Never break the loop over a statistic
+            cog, command, name = None, None, repr(handle)
+        where = self.format_where(cog, command, name)
+        self.stats["slow_callbacks"] += 1
+        self.blocked_time[where] += elapsed
+        self.blocked_calls[where] += 1
+        self._period_blocked[where] += elapsed
+        self.slow_callbacks.append((time.time(), elapsed, where))
+        self.logger.warning("Event loop blocked for {:.0f}ms by {}"
+                            "".format(elapsed * 1000, where))
+
+    @staticmethod
+    def format_where(cog, command, name):
+        if cog is None:
+            return name
+        if command is not None:
+            return "{} ({}, in {})".format(cog, command, name)
+        return "{} ({})".format(cog, name)
+
+    async def _sampler(self):
+        self._thread_id = threading.get_ident()
+        last_log = self.loop.time()
+        try:
+            while True:
+                expected = self.loop.time() + self.interval
+                await asyncio.sleep(self.interval)
+                lag = max(0.0, self.loop.time() - expected)
+                self.lags.append(lag)
+                self.max_lag = max(self.max_lag, lag)
+                self.stats["samples"] += 1
+                if self.loop.time() - last_log >= self.log_interval:
+                    last_log = self.loop.time()
+                    self._log_summary()
+        except asyncio.CancelledError:
+            pass
+
+    def _log_summary(self):
+        summary = self.get_metrics()
+        summary["blocked_ms"] = {where: round(seconds * 1000)
+                                 for where, seconds
+                                 in self._period_blocked.most_common(5)}
+        self._period_blocked.clear()
+        self.logger.info(json.dumps(summary, sort_keys=True))
+
+    def get_metrics(self):
+        lags = sorted(self.lags)
+        if lags:
+            avg = sum(lags) / len(lags)
+            p95 = lags[min(len(lags) - 1, int(len(lags) * 0.95))]
+            recent_max = lags[-1]
+        else:
+            avg = p95 = recent_max = 0.0
+        return {"lag_avg_ms": avg * 1000,
+                "lag_p95_ms": p95 * 1000,
+                "lag_max_ms": recent_max * 1000,
+                "lag_max_ever_ms": self.max_lag * 1000,
+                "slow_callbacks": self.stats["slow_callbacks"]}
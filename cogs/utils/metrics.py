@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import os
+from collections import Counter
+
+#
+# Per command and per listener metrics, exported in Prometheus' text
+# format. The bot keeps one registry as bot.metrics: it writes it to
+# data/red/metrics.prom every minute (for node_exporter's textfile
+# collector) and can serve it over HTTP on a local port.
+#
+
+# Upper bounds in seconds, +Inf is implied
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q quantile"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n") \
+                     .replace('"', '\\"')
+
+
+def _labels(**labels):
+    return "{" + ",".join('{}="{}"'.format(k, _escape(v))
+                          for k, v in sorted(labels.items())) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Counts and times commands and cog listeners"""
+
+    def __init__(self):
+        self.logger = logging.getLogger("red")
+        self.commands = {}  # (cog, command): Histogram
+        self.command_errors = Counter()  # (cog, command, kind)
+        self.listeners = {}  # (cog, event): Histogram
+        self.counters = {}  # name: Counter, exported as <name>_total
+        self._collectors = {}  # name: callable returning {key: number}
+        self._writer = None
+        self._server = None
+
+    def observe_command(self, cog, command, seconds):
+        key = (cog or "", command)
+        histogram = self.commands.get(key)
+        if histogram is None:
+            histogram = self.commands[key] = Histogram()
+        histogram.observe(seconds)
+
+    def command_error(self, cog, command, kind):
+        self.command_errors[(cog or "", command, kind)] += 1
+
+    def observe_listener(self, cog, event, seconds):
+        key = (cog or "", event)
+        histogram = self.listeners.get(key)
+        if histogram is None:
+            histogram = self.listeners[key] = Histogram()
+        histogram.observe(seconds)
+
+    def add_counter(self, name, counter):
+        """Exports every key of counter as red_<name>_total{key=...}"""
+        self.counters[name] = counter
+
+    def add_collector(self, name, func):
+        """Exports what func returns as red_<name>_<key> gauges"""
+        self._collectors[name] = func
+
+    def remove_collector(self, name):
+        self._collectors.pop(name, None)
+
+    def render(self):
+        """Returns every metric in Prometheus' text format"""
+        lines = []
+        self._render_histograms(
+            lines, "red_command_duration_seconds",
+            "Time taken by commands, from invocation to completion",
+            self.commands, ("cog", "command"))
+        lines.append("# HELP red_command_errors_total Failed commands")
+        lines.append("# TYPE red_command_errors_total counter")
+        for (cog, command, kind), n in sorted(self.command_errors.items()):
+            lines.append("red_command_errors_total{} {}".format(
+                _labels(cog=cog, command=command, kind=kind), n))
+        self._render_histograms(
+            lines, "red_listener_duration_seconds",
+            "Time taken by cog event listeners, e.g. on_message",
+            self.listeners, ("cog", "event"))
+
+        for name, counter in sorted(self.counters.items()):
+            metric = "red_{}_total".format(name)
+            lines.append("# TYPE {} counter".format(metric))
+            for key, n in sorted(counter.items()):
+                lines.append("{}{} {}".format(metric, _labels(name=key), n))
+
+        for name, func in sorted(self._collectors.items()):
+            try:
+                values = func()
+            except Exception:
+                self.logger.exception("Metrics collector {} failed"
+                                      "".format(name))
+                continue
+            for key, value in sorted(values.items()):
+                if not isinstance(value, (int, float)):
+                    continue
+                metric = "red_{}_{}".format(name, key)
+                lines.append("# TYPE {} gauge".format(metric))
+                lines.append("{} {}".format(metric, _number(value)))
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histograms(lines, metric, help, histograms, label_names):
+        lines.append("# HELP {} {}".format(metric, help))
+        lines.append("# TYPE {} histogram".format(metric))
+        for key, histogram in sorted(histograms.items()):
+            labels = dict(zip(label_names, key))
+            cumulative = 0
+            for bound, n in zip(BUCKETS, histogram.counts):
+                cumulative += n
+                lines.append("{}_bucket{} {}".format(
+                    metric, _labels(le=_number(bound), **labels),
+                    cumulative))
+            lines.append("{}_bucket{} {}".format(
+                metric, _labels(le="+Inf", **labels), histogram.count))
+            lines.append("{}_sum{} {}".format(metric, _labels(**labels),
+                                              _number(histogram.sum)))
+            lines.append("{}_count{} {}".format(metric, _labels(**labels),
+                                                histogram.count))
+
+    def write(self, path):
+        """Atomically writes the metrics to path"""
+        self._write_text(path, self.render())
+
+    def start(self, loop, path="data/red/metrics.prom", interval=60):
+        """Writes the metrics to path every interval seconds"""
+        if self._writer is None or self._writer.done():
+            self._writer = loop.create_task(self._write_every(loop, path,
+                                                              interval))
+
+    async def _write_every(self, loop, path, interval):
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                text = self.render()
+                try:
+                    await loop.run_in_executor(None, self._write_text,
+                                               path, text)
+                except OSError:
+                    self.logger.exception("Couldn't write metrics to {}"
+                                          "".format(path))
+        except asyncio.CancelledError:
+            pass
+
+    @staticmethod
+    def _write_text(path, text):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    @property
+    def serving(self):
+        return self._server is not None
+
+    async def start_server(self, port, host="127.0.0.1"):
+        """Serves the metrics over HTTP at http://host:port/metrics"""
+        await self.stop_server()
+        self._server = await asyncio.start_server(self._handle, host, port)
+
+    async def stop_server(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            parts = request.decode("latin-1").split()
+            # The rest of the request doesn't matter
+            while (await asyncio.wait_for(reader.readline(), 5)) \
+                    not in (b"\r\n", b"\n", b""):
+                pass
+            if len(parts) >= 2 and parts[0] == "GET" and \
+                    parts[1].split("?")[0] in ("/", "/metrics"):
+                status = "200 OK"
+                body = self.render().encode("utf-8")
+            else:
+                status = "404 Not Found"
+                body = b"Try /metrics\n"
+            writer.write("HTTP/1.0 {}\r\n"
+                         "Content-Type: text/plain; version=0.0.4\r\n"
+                         "Content-Length: {}\r\n"
+                         "\r\n".format(status, len(body)).encode("latin-1"))
+            writer.write(body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def stop(self):
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
@@ -19,11 +19,15 @@ class Settings:
             "PASSWORD": None,
             "OWNER": None,
             "PREFIXES": [],
+            "STORAGE_DRIVER": "json",
+            "DATA_FORMAT": "json",
+            "METRICS_PORT": None,
             "default": {"ADMIN_ROLE": "Transistor",
                         "MOD_ROLE": "Process",
                         "PREFIXES": []}
                         }
         self._memory_only = False
+        self._prefix_cache = {}
 
         if not dataIO.is_valid_json(self.path):
             self.bot_settings = deepcopy(self.default_settings)
@@ -192,6 +196,32 @@ class Settings:
     def prefixes(self, value):
         assert isinstance(value, list)
         self.bot_settings["PREFIXES"] = value
+        self._prefix_cache.clear()
+
+    @property
+    def storage_driver(self):
+        return self.bot_settings.get("STORAGE_DRIVER", "json")
+
+    @storage_driver.setter
+    def storage_driver(self, value):
+        self.bot_settings["STORAGE_DRIVER"] = value
+
+    @property
+    def data_format(self):
+        return self.bot_settings.get("DATA_FORMAT", "json")
+
+    @data_format.setter
+    def data_format(self, value):
+        self.bot_settings["DATA_FORMAT"] = value
+
+    @property
+    def metrics_port(self):
+        """Local port serving Prometheus metrics, None if disabled"""
+        return self.bot_settings.get("METRICS_PORT")
+
+    @metrics_port.setter
+    def metrics_port(self, value):
+        self.bot_settings["METRICS_PORT"] = value
 
     @property
     def default_admin(self):
@@ -279,6 +309,7 @@ class Settings:
         if server.id not in self.bot_settings:
             self.add_server(server.id)
         self.bot_settings[server.id]["PREFIXES"] = prefixes
+        self._prefix_cache.clear()
         self.save_settings()
 
     def get_prefixes(self, server):
@@ -286,6 +317,28 @@ class Settings:
         p = self.get_server_prefixes(server)
         return p if p else self.prefixes
 
+    def match_prefix(self, server, content):
+        """Returns the server's prefix content starts with, or None
+
+        Prefixes are tried in the same order as get_prefixes, but only
+        those starting with the same character as content"""
+        if not content:
+            return None
+        sid = server.id if server is not None else None
+        try:
+            matcher = self._prefix_cache[sid]
+        except KeyError:
+            matcher = {}
+            for p in self.get_prefixes(server):
+                if p:
+                    matcher[p[0]] = matcher.get(p[0], ()) + (p,)
+            self._prefix_cache[sid] = matcher
+        for p in matcher.get(content[0], ()):
+            if content.startswith(p):
+                return p
+        return None
+
     def add_server(self, sid):
         self.bot_settings[sid] = self.bot_settings["default"].copy()
+        self._prefix_cache.clear()
         self.save_settings()
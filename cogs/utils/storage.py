@@ -0,0 +1,409 @@
+import json
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+from copy import deepcopy
+
+from .dataIO import dataIO, writebehind
+
+#
+# Keyed storage for cog data.
+#
+# A Config is one document (e.g. economy/bank) holding values of a single
+# scope. The scope decides how many ids address a value:
+#
+#   GLOBAL  -> key                  SERVER  -> server id
+#   CHANNEL -> channel id           USER    -> user id
+#   MEMBER  -> server id, member id
+#
+# The JSON driver keeps the same nested layout Red always used, so
+# data/economy/bank.json is a valid MEMBER document as it is. The SQLite
+# driver stores one row per value, so a write only touches what changed.
+#
+
+GLOBAL = "GLOBAL"
+SERVER = "SERVER"
+CHANNEL = "CHANNEL"
+USER = "USER"
+MEMBER = "MEMBER"
+
+SCOPES = {GLOBAL: 1, SERVER: 1, CHANNEL: 1, USER: 1, MEMBER: 2}
+
+DATA_PATH = "data"
+SQLITE_PATH = "data/red/storage.sqlite"
+
+# Documents kept through Config and their scope. Only these are moved
+# between the JSON files and SQLite when the driver is switched, every
+# other file in data/ is still read and written by its cog directly
+KNOWN_DOCUMENTS = {
+    "economy/bank": MEMBER,
+}
+
+log = logging.getLogger("red.storage")
+
+
+class StorageError(Exception):
+    pass
+
+
+class InvalidScope(StorageError):
+    pass
+
+
+class JSONDriver:
+    """Stores every document as data/<cog>/<name>.json
+
+    Saves are handed to the write-behind store, so bursts of writes
+    to the same document end up in a single file write."""
+
+    name = "json"
+
+    def __init__(self, data_path=DATA_PATH):
+        self.data_path = data_path
+        self._documents = {}
+        self._transaction = 0
+        self._dirty = set()
+
+    def _path(self, document):
+        return os.path.join(self.data_path, document + ".json")
+
+    def _load(self, document):
+        try:
+            return self._documents[document]
+        except KeyError:
+            pass
+        path = self._path(document)
+        if dataIO.is_valid_json(path):
+            data = dataIO.load_json(path)
+        else:
+            data = {}
+        self._documents[document] = data
+        return data
+
+    def _save(self, document):
+        if self._transaction:
+            self._dirty.add(document)
+        else:
+            path = self._path(document)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            writebehind.mark_dirty(path, self._documents[document])
+
+    def get(self, document, ids):
+        node = self._load(document)
+        for i in ids:
+            if not isinstance(node, dict) or i not in node:
+                return None
+            node = node[i]
+        return deepcopy(node)
+
+    def set(self, document, ids, value):
+        node = self._load(document)
+        for i in ids[:-1]:
+            node = node.setdefault(i, {})
+        node[ids[-1]] = deepcopy(value)
+        self._save(document)
+
+    def delete(self, document, ids):
+        node = self._load(document)
+        for i in ids[:-1]:
+            node = node.get(i)
+            if node is None:
+                return
+        if node.pop(ids[-1], None) is not None:
+            self._save(document)
+
+    def all(self, document, ids):
+        node = self.get(document, ids)
+        return node if isinstance(node, dict) else {}
+
+    def clear(self, document, ids):
+        if ids:
+            self.delete(document, ids)
+        else:
+            self._load(document).clear()
+            self._save(document)
+
+    @contextmanager
+    def transaction(self):
+        self._transaction += 1
+        try:
+            yield
+        finally:
+            self._transaction -= 1
+            if not self._transaction:
+                dirty, self._dirty = self._dirty, set()
+                for document in dirty:
+                    self._save(document)
+
+    def close(self):
+        for document in self._documents:
+            writebehind.flush(self._path(document))
+
+
+class SQLiteDriver:
+    """Stores every value as its own row in a single SQLite database"""
+
+    name = "sqlite"
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS data ("
+                          "document TEXT NOT NULL, "
+                          "id1 TEXT NOT NULL, "
+                          "id2 TEXT NOT NULL DEFAULT '', "
+                          "value TEXT NOT NULL, "
+                          "PRIMARY KEY (document, id1, id2))")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta ("
+                          "key TEXT PRIMARY KEY, value TEXT)")
+        self._transaction = 0
+
+    @staticmethod
+    def _keys(ids):
+        id1 = ids[0] if len(ids) > 0 else None
+        id2 = ids[1] if len(ids) > 1 else None
+        return id1, id2
+
+    def get(self, document, ids):
+        if len(ids) == 1:
+            # Could be a whole MEMBER server, that's what all() is for
+            row = self.conn.execute(
+                "SELECT value FROM data WHERE document=? AND id1=? AND id2=''",
+                (document, ids[0])).fetchone()
+        else:
+            row = self.conn.execute(
+                "SELECT value FROM data WHERE document=? AND id1=? AND id2=?",
+                (document, ids[0], ids[1])).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, document, ids, value):
+        id1, id2 = self._keys(ids)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO data (document, id1, id2, value) "
+            "VALUES (?, ?, ?, ?)",
+            (document, id1, id2 or "", json.dumps(value)))
+
+    def delete(self, document, ids):
+        id1, id2 = self._keys(ids)
+        self.conn.execute(
+            "DELETE FROM data WHERE document=? AND id1=? AND id2=?",
+            (document, id1, id2 or ""))
+
+    def all(self, document, ids):
+        if ids:
+            rows = self.conn.execute(
+                "SELECT id2, value FROM data WHERE document=? AND id1=? "
+                "AND id2!=''", (document, ids[0]))
+            return {k: json.loads(v) for k, v in rows}
+        ret = {}
+        rows = self.conn.execute(
+            "SELECT id1, id2, value FROM data WHERE document=?", (document,))
+        for id1, id2, value in rows:
+            if id2:
+                ret.setdefault(id1, {})[id2] = json.loads(value)
+            else:
+                ret[id1] = json.loads(value)
+        return ret
+
+    def clear(self, document, ids):
+        if ids:
+            self.conn.execute("DELETE FROM data WHERE document=? AND id1=?",
+                              (document, ids[0]))
+        else:
+            self.conn.execute("DELETE FROM data WHERE document=?",
+                              (document,))
+
+    @contextmanager
+    def transaction(self):
+        if self._transaction:
+            self._transaction += 1
+            try:
+                yield
+            finally:
+                self._transaction -= 1
+            return
+        self._transaction += 1
+        self.conn.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        else:
+            self.conn.execute("COMMIT")
+        finally:
+            self._transaction -= 1
+
+    def get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key=?",
+                                (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) "
+                          "VALUES (?, ?)", (key, value))
+
+    def delete_meta(self, key):
+        self.conn.execute("DELETE FROM meta WHERE key=?", (key,))
+
+    def close(self):
+        self.conn.close()
+
+
+DRIVERS = {"json": JSONDriver, "sqlite": SQLiteDriver}
+
+_driver = None
+
+
+def get_driver():
+    """Returns the storage driver shared by all cogs
+
+    The driver is picked from Red's settings, JSON being the default"""
+    global _driver
+    if _driver is None:
+        try:
+            from __main__ import settings
+            name = settings.storage_driver
+        except (ImportError, AttributeError):
+            name = "json"
+        if name not in DRIVERS:
+            raise StorageError("Unknown storage driver {}".format(name))
+        if name == "json" and os.path.isfile(SQLITE_PATH):
+            _export_stale_sqlite()
+        _driver = DRIVERS[name]()
+        if isinstance(_driver, SQLiteDriver):
+            if _driver.get_meta("json_imported") is None:
+                import_json(_driver)
+    return _driver
+
+
+def _export_stale_sqlite():
+    """Writes SQLite's data back to JSON after switching to the JSON driver
+
+    Once imported, the JSON files stop being updated: without this
+    the bot would go back to whatever they held before the switch"""
+    sqlite = SQLiteDriver()
+    try:
+        if sqlite.get_meta("json_imported") is None:
+            return
+        log.warning("Switched back to the JSON driver: the JSON files are "
+                    "older than {}, overwriting them with its data"
+                    "".format(SQLITE_PATH))
+        export_json(sqlite)
+        # The JSON files are the newest copy again, switching back to
+        # SQLite has to import them anew
+        sqlite.delete_meta("json_imported")
+    finally:
+        sqlite.close()
+
+
+def import_json(driver, data_path=DATA_PATH):
+    """Imports the known documents' JSON files into driver
+
+    Meant to be run once when switching to the SQLite driver.
+    Returns the number of documents imported"""
+    imported = 0
+    with driver.transaction():
+        for document, scope in sorted(KNOWN_DOCUMENTS.items()):
+            path = os.path.join(data_path, document + ".json")
+            if not os.path.isfile(path):
+                continue
+            try:
+                data = dataIO.load_json(path)
+            except Exception:
+                log.warning("Skipping {}: not valid JSON".format(path))
+                continue
+            if not isinstance(data, dict):
+                log.warning("Skipping {}: not a {} document"
+                            "".format(path, scope))
+                continue
+            driver.clear(document, ())
+            for key, value in data.items():
+                if SCOPES[scope] == 2 and isinstance(value, dict):
+                    for subkey, subvalue in value.items():
+                        driver.set(document, (key, subkey), subvalue)
+                else:
+                    driver.set(document, (key,), value)
+            imported += 1
+        driver.set_meta("json_imported", "1")
+    log.info("Imported {} JSON documents into {}"
+             "".format(imported, driver.name))
+    return imported
+
+
+def export_json(driver, data_path=DATA_PATH):
+    """Writes the known documents held by driver to their JSON files
+
+    Returns the number of documents exported"""
+    exported = 0
+    for document in sorted(KNOWN_DOCUMENTS):
+        # Empty ones too, or a wiped document would come back from JSON
+        data = driver.all(document, ())
+        path = os.path.join(data_path, document + ".json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        dataIO.save_json(path, data)
+        exported += 1
+    log.info("Exported {} documents from {} to JSON"
+             "".format(exported, driver.name))
+    return exported
+
+
+class Config:
+    """Keyed access to a cog's document
+
+    Config("economy", "bank", MEMBER).get(server.id, member.id)
+
+    Values are plain JSON types. What get returns is a copy: changes
+    have to be written back with set."""
+
+    def __init__(self, cog_name, name, scope=GLOBAL, driver=None):
+        if scope not in SCOPES:
+            raise InvalidScope("Unknown scope {}".format(scope))
+        self.document = "{}/{}".format(cog_name, name)
+        self.scope = scope
+        self._driver = driver
+
+    @property
+    def driver(self):
+        if self._driver is None:
+            self._driver = get_driver()
+        return self._driver
+
+    def _check_ids(self, ids):
+        if len(ids) != SCOPES[self.scope]:
+            raise InvalidScope("{} scope takes {} id(s), got {}"
+                               "".format(self.scope, SCOPES[self.scope],
+                                         len(ids)))
+        return tuple(str(i) for i in ids)
+
+    def get(self, *ids, default=None):
+        value = self.driver.get(self.document, self._check_ids(ids))
+        return default if value is None else value
+
+    def set(self, *ids, value):
+        self.driver.set(self.document, self._check_ids(ids), value)
+
+    def delete(self, *ids):
+        self.driver.delete(self.document, self._check_ids(ids))
+
+    def all(self, *ids):
+        """Returns every value of the document, or of a MEMBER scope
+        server if its id is passed"""
+        if len(ids) >= SCOPES[self.scope]:
+            raise InvalidScope("Too many ids for all()")
+        return self.driver.all(self.document, tuple(str(i) for i in ids))
+
+    def clear(self, *ids):
+        """Deletes every value of the document, or of a MEMBER scope
+        server if its id is passed"""
+        if len(ids) >= SCOPES[self.scope]:
+            raise InvalidScope("Too many ids for clear()")
+        self.driver.clear(self.document, tuple(str(i) for i in ids))
+
+    def transaction(self):
+        """Context manager grouping writes into one atomic unit"""
+        return self.driver.transaction()
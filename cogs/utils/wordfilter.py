@@ -0,0 +1,99 @@
+import re
+
+#
+# Every server's filtered words are compiled into a single regex shaped
+# like a trie (common prefixes are shared), so a message is scanned once
+# no matter how many words are filtered.
+#
+
+LEET_TABLE = str.maketrans({"0": "o", "1": "i", "3": "e", "4": "a",
+                            "5": "s", "7": "t", "@": "a", "$": "s",
+                            "!": "i", "|": "l", "+": "t"})
+
+
+def normalize_leet(text):
+    return text.translate(LEET_TABLE)
+
+
+def trie_pattern(words):
+    """Builds a regex matching any of words, sharing common prefixes"""
+    trie = {}
+    for word in words:
+        if not word:
+            continue
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = None  # A word ends here
+    return _node_pattern(trie)
+
+
+def _node_pattern(node):
+    alternatives = []
+    leaves = []
+    for ch in sorted(k for k in node if k):
+        child = node[ch]
+        if list(child) == [""]:
+            leaves.append(re.escape(ch))
+        else:
+            alternatives.append(re.escape(ch) + _node_pattern(child))
+    if len(leaves) == 1:
+        alternatives.append(leaves[0])
+    elif leaves:
+        alternatives.append("[" + "".join(leaves) + "]")
+
+    if not alternatives:
+        return ""
+    if len(alternatives) == 1:
+        pattern = alternatives[0]
+    else:
+        pattern = "(?:" + "|".join(alternatives) + ")"
+    if "" in node:
+        pattern = "(?:" + pattern + ")?"
+    return pattern
+
+
+class WordFilter:
+    """Compiled view of Mod's per server filter lists
+
+    Patterns are built lazily and only the edited server's one is
+    thrown away when its list changes."""
+
+    def __init__(self, words):
+        self.words = words  # {server_id: [word, ...]}, owned by Mod
+        self._compiled = {}
+
+    def invalidate(self, server_id):
+        for key in [k for k in self._compiled if k[0] == server_id]:
+            del self._compiled[key]
+
+    def _get_regex(self, server_id, word_boundary, leetspeak):
+        key = (server_id, word_boundary, leetspeak)
+        try:
+            return self._compiled[key]
+        except KeyError:
+            pass
+        words = self.words.get(server_id)
+        if not words:
+            regex = None
+        else:
+            if leetspeak:
+                words = [normalize_leet(w) for w in words]
+            pattern = trie_pattern(words)
+            if word_boundary:
+                pattern = r"(?<!\w)" + pattern + r"(?!\w)"
+            regex = re.compile(pattern) if pattern else None
+        self._compiled[key] = regex
+        return regex
+
+    def search(self, server_id, content, *, word_boundary=False,
+               leetspeak=False):
+        """Returns the filtered text found in content, or None"""
+        regex = self._get_regex(server_id, word_boundary, leetspeak)
+        if regex is None:
+            return None
+        content = content.lower()
+        if leetspeak:
+            content = normalize_leet(content)
+        match = regex.search(content)
+        return match.group(0) if match else None
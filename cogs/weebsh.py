@@ -3,20 +3,18 @@
 #
 # Authored by Swann (github.com/swannobi)
 #
-# Route class heavily based on martmists' original work on the ram.moe wrapper
-#
 # Last updated Sept 25, 2017
 
 import discord
 from discord.ext import commands
-import aiohttp
 import io
-import requests
 import sys
 import os
 import random
 from .utils import checks
 from .utils.dataIO import dataIO
+from .utils.async_ import Route
+from .utils.sync import ResponseError
 from __main__ import send_cmd_help
 
 # This list intentionally left blank.
@@ -42,24 +40,37 @@ class WeebSh:
         self.headers = {"Authorization":"Bearer "+str(self.api_key),"Content-Type":"application/json"}
         # List of NSFW channels to enable NSFW content
         self.NSFW_channels = self.settings['NSFW_CHANNELS'] 
+        self.types = []
+        self.nsfw_types = []
+        self.tags = []
+        self.nsfw_tags = []
+        self.info = {}
         # Dynamically load valid types when cog is loaded
+        self.bot.loop.create_task(self._load_api_info())
+
+    async def _load_api_info(self):
         try:
-            self.types = self._get( self.api_url, self.types_uri, self.headers ).sync_query()["types"]
-            self.nsfw_types = self._get( self.api_url, self.types_uri+"?nsfw=true", self.headers ).sync_query()["types"]
+            self.types = (await self._get( self.api_url, self.types_uri, self.headers ))["types"]
+            self.nsfw_types = (await self._get( self.api_url, self.types_uri+"?nsfw=true", self.headers ))["types"]
             # Workaround for dynamic commands by weeb.sh type. Necessary because 
             #   self attributes are outside the scope of the discord.ext.commands decorator.
-            TYPES.extend(self.types)
+            TYPES.extend(t for t in self.types if t not in TYPES)
             # Tags are currently support experimentally. They are still relatively new to the API.
-            self.tags = self._get( self.api_url, self.tags_uri, self.headers ).sync_query()["tags"]
-            self.nsfw_tags = self._get( self.api_url, self.tags_uri+"?nsfw=true", self.headers ).sync_query()["tags"]
+            self.tags = (await self._get( self.api_url, self.tags_uri, self.headers ))["tags"]
+            self.nsfw_tags = (await self._get( self.api_url, self.tags_uri+"?nsfw=true", self.headers ))["tags"]
             # Get the current API information as of the time this cog was loaded.
-            self.info = self._get( self.api_url, self.base_uri, self.headers ).sync_query()
-        except:
+            self.info = await self._get( self.api_url, self.base_uri, self.headers )
+        except (ResponseError, KeyError):
             print("There was an issue invoking the API. API Key is probably not set!")
+        # The cog has been added by now, so the aliases of [p]image
+        # that weren't known back then are registered by hand
+        for alias in TYPES:
+            self.bot.commands.setdefault(alias, self.image)
 
-    # Inner method to create the request object. Invoke it with .sync_query()
+    # Inner method to query the API through the bot's HTTP client
     def _get(self, api, uri, http_headers):
-        return Route(base_url=api,path=uri,headers=http_headers)
+        route = Route(base_url=api,path=uri,headers=http_headers)
+        return route.async_query(client=self.bot.http_client)
 
     # Responsible for invoking the request object and creating an Embed to post in the channel.
     # Uses embed.description instead of embed.title because apparently titles don't get 
@@ -71,7 +82,7 @@ class WeebSh:
             return
         path = self.random_uri + "?type=" + imgtype + "&nsfw=" + nsfw
         try:
-            result = self._get(self.api_url, path, self.headers).sync_query()
+            result = await self._get(self.api_url, path, self.headers)
             # Form the embed
             data = discord.Embed()
             if description:
@@ -143,29 +154,6 @@ class WeebSh:
         # Re-initialize the cog. This reloads the aliases for [p]image.
         self.__init__(self.bot)
 
-# Handles request routing
-class Route:
-    def __init__(self, base_url, path, headers=None, method="GET"):
-        self.base_url = base_url
-        self.path = path
-        self.headers = headers
-        self.method = method
-
-    # Introspection: call the requests.get(url, headers) method
-    def sync_query(self, url_params=None):
-        result = getattr( requests, self.method.lower() )(
-                self.base_url+self.path, headers=self.headers)
-        if 200 <= result.status_code < 300:
-            return result.json()
-        else:
-            raise ResponseError("Got an unsuccessful response code: {}".format(result.status_code))
-
-    def __call__(self, url_params=None):
-        return self.sync_query(url_params)
-
-class ResponseError(BaseException):
-    pass
-
 def check_folder():
     if not os.path.exists("data/weeb"):
         print("Creating data/weeb folder...")
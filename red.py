@@ -7,6 +7,7 @@ import logging.handlers
 import traceback
 import datetime
 import subprocess
+import time
 
 try:
     from discord.ext import commands
@@ -19,9 +20,12 @@ except ImportError:
     sys.exit(1)
 
 from cogs.utils.settings import Settings
-from cogs.utils.dataIO import dataIO
+from cogs.utils.dataIO import dataIO, writebehind, UnavailableCodec
+from cogs.utils.httpclient import HTTPClient
+from cogs.utils.looplag import LoopMonitor
+from cogs.utils.metrics import MetricsRegistry
 from cogs.utils.chat_formatting import inline
-from collections import Counter
+from collections import Counter, OrderedDict
 from io import TextIOWrapper
 
 #
@@ -40,6 +44,33 @@ from io import TextIOWrapper
 description = "Red - A multifunction Discord bot by Twentysix"
 
 
+class ParsedMessage:
+    """What Red knows about a message before any listener looks at it
+
+    Built once per message by Bot.parse_message and shared by the core
+    on_message and the cogs' listeners. Messages without a prefix can be
+    rejected by checking prefix alone."""
+
+    __slots__ = ("bot", "message", "prefix", "invoked_with", "_allowed")
+
+    def __init__(self, bot, message):
+        self.bot = bot
+        self.message = message
+        self.prefix = bot.match_prefix(message.server, message.content)
+        if self.prefix is None:
+            self.invoked_with = None
+        else:
+            self.invoked_with = message.content[len(self.prefix):].split(" ", 1)[0]
+        self._allowed = None
+
+    @property
+    def allowed(self):
+        """Bot.user_allowed, computed at most once"""
+        if self._allowed is None:
+            self._allowed = self.bot.user_allowed(self.message)
+        return self._allowed
+
+
 class Bot(commands.Bot):
     def __init__(self, *args, **kwargs):
 
@@ -55,6 +86,8 @@ class Bot(commands.Bot):
             return bot.settings.get_prefixes(message.server)
 
         self.counter = Counter()
+        self._parsed_messages = OrderedDict()
+        self._staff_roles = {}
         self.uptime = datetime.datetime.utcnow()  # Refreshed before login
         self._message_modifiers = []
         self.settings = Settings()
@@ -70,6 +103,21 @@ class Bot(commands.Bot):
             if self.settings.self_bot:
                 kwargs['pm_help'] = False
         super().__init__(*args, command_prefix=prefix_manager, **kwargs)
+        try:
+            dataIO.set_codec(self.settings.data_format)
+        except UnavailableCodec as e:
+            self.logger.warning("{}. Saving as json.".format(e))
+        writebehind.start(self.loop)
+        self.http_client = HTTPClient(self.loop)
+        self.loop_monitor = LoopMonitor(self.loop)
+        self.loop_monitor.start()
+        self.metrics = MetricsRegistry()
+        self._command_starts = OrderedDict()  # message id: perf_counter()
+        self.metrics.add_counter("events", self.counter)
+        self.metrics.add_collector("writebehind", writebehind.get_metrics)
+        self.metrics.add_collector("http", self.http_client.get_metrics)
+        self.metrics.add_collector("loop", self.loop_monitor.get_metrics)
+        self.metrics.start(self.loop)
 
     async def send_message(self, *args, **kwargs):
         if self._message_modifiers:
@@ -91,12 +139,43 @@ class Bot(commands.Bot):
 
         return await super().send_message(*args, **kwargs)
 
+    def dispatch(self, event, *args, **kwargs):
+        # process_commands dispatches "command" right before invoking it
+        # and "command_completion" or "command_error" right after, from
+        # the same coroutine: that's where commands get timed
+        if event == "command":
+            ctx = args[1]
+            self._command_starts[ctx.message.id] = time.perf_counter()
+            while len(self._command_starts) > 1000:  # Never completed
+                self._command_starts.popitem(last=False)
+        elif event in ("command_completion", "command_error"):
+            ctx = args[1]
+            start = self._command_starts.pop(ctx.message.id, None)
+            if start is not None and ctx.command is not None:
+                invoked = ctx.invoked_subcommand or ctx.command
+                self.metrics.observe_command(
+                    getattr(ctx.command, "cog_name", None),
+                    invoked.qualified_name, time.perf_counter() - start)
+        super().dispatch(event, *args, **kwargs)
+
+    async def _run_extra(self, coro, event_name, *args, **kwargs):
+        # Cog listeners (on_message and friends) are run through here
+        start = time.perf_counter()
+        try:
+            await super()._run_extra(coro, event_name, *args, **kwargs)
+        finally:
+            cog = getattr(coro, "__self__", None)
+            cog = type(cog).__name__ if cog is not None else coro.__module__
+            self.metrics.observe_listener(cog, event_name,
+                                          time.perf_counter() - start)
+
     async def shutdown(self, *, restart=False):
         """Gracefully quits Red with exit code 0
 
         If restart is True, the exit code will be 26 instead
         The launcher automatically restarts Red when that happens"""
         self._shutdown_mode = not restart
+        writebehind.stop()
         await self.logout()
 
     def add_message_modifier(self, func):
@@ -140,6 +219,40 @@ class Bot(commands.Bot):
             for page in pages:
                 await self.send_message(ctx.message.channel, page)
 
+    def match_prefix(self, server, content):
+        """Returns the prefix content starts with, or None"""
+        return self.settings.match_prefix(server, content)
+
+    def parse_message(self, message):
+        """Returns the ParsedMessage for message
+
+        The result is cached, so every listener handling the same
+        message shares the work"""
+        try:
+            return self._parsed_messages[message.id]
+        except KeyError:
+            pass
+        parsed = ParsedMessage(self, message)
+        self._parsed_messages[message.id] = parsed
+        if len(self._parsed_messages) > 256:
+            self._parsed_messages.popitem(last=False)
+        return parsed
+
+    def _get_staff_roles(self, server):
+        """IDs of the server's roles named like its admin or mod role"""
+        names = (self.settings.get_server_admin(server),
+                 self.settings.get_server_mod(server))
+        cached = self._staff_roles.get(server.id)
+        if cached is not None and cached[0] == names:
+            return cached[1]
+        ids = frozenset(r.id for r in server.roles if r.name in names)
+        self._staff_roles[server.id] = (names, ids)
+        return ids
+
+    def _invalidate_staff_roles(self, role, *args):
+        # Role names might not match the admin / mod names anymore
+        self._staff_roles.pop(role.server.id, None)
+
     def user_allowed(self, message):
         author = message.author
 
@@ -163,23 +276,15 @@ class Bot(commands.Bot):
                 return False
 
         if not message.channel.is_private:
-            server = message.server
-            names = (self.settings.get_server_admin(
-                server), self.settings.get_server_mod(server))
-            results = map(
-                lambda name: discord.utils.get(author.roles, name=name),
-                names)
-            for r in results:
-                if r is not None:
-                    return True
+            staff_roles = self._get_staff_roles(message.server)
+            if staff_roles:
+                for r in author.roles:
+                    if r.id in staff_roles:
+                        return True
 
         if mod_cog is not None:
-            if not message.channel.is_private:
-                if message.server.id in mod_cog.ignore_list["SERVERS"]:
-                    return False
-
-                if message.channel.id in mod_cog.ignore_list["CHANNELS"]:
-                    return False
+            if mod_cog.is_ignored(message):
+                return False
 
         return True
 
@@ -331,6 +436,10 @@ def initialize(bot_class=Bot, formatter_class=Formatter):
 
         await bot.get_cog('Owner').disable_commands()
 
+    bot.add_listener(bot._invalidate_staff_roles, "on_server_role_create")
+    bot.add_listener(bot._invalidate_staff_roles, "on_server_role_delete")
+    bot.add_listener(bot._invalidate_staff_roles, "on_server_role_update")
+
     @bot.event
     async def on_resumed():
         bot.counter["session_resumed"] += 1
@@ -342,12 +451,20 @@ def initialize(bot_class=Bot, formatter_class=Formatter):
     @bot.event
     async def on_message(message):
         bot.counter["messages_read"] += 1
-        if bot.user_allowed(message):
+        parsed = bot.parse_message(message)
+        # Without a prefix there's no command to process
+        if parsed.prefix is not None and parsed.allowed:
             await bot.process_commands(message)
 
     @bot.event
     async def on_command_error(error, ctx):
         channel = ctx.message.channel
+        if ctx.command is not None:
+            command = ctx.invoked_subcommand or ctx.command
+            # Errors raised by the command itself come wrapped
+            kind = type(getattr(error, "original", error)).__name__
+            bot.metrics.command_error(getattr(ctx.command, "cog_name", None),
+                                      command.qualified_name, kind)
         if isinstance(error, commands.MissingRequiredArgument):
             await bot.send_cmd_help(ctx)
         elif isinstance(error, commands.BadArgument):
@@ -492,6 +609,18 @@ def set_logger(bot):
     logger.addHandler(fhandler)
     logger.addHandler(stdout_handler)
 
+    # Loop lag summaries and slow callbacks, see cogs/utils/looplag.py
+    metrics_logger = logging.getLogger("red.metrics")
+    metrics_logger.setLevel(logging.INFO)
+    metrics_logger.propagate = False
+    mhandler = logging.handlers.RotatingFileHandler(
+        filename='data/red/metrics.log', encoding='utf-8', mode='a',
+        maxBytes=10**6, backupCount=3)
+    mhandler.setFormatter(logging.Formatter(
+        '%(asctime)s %(levelname)s: %(message)s',
+        datefmt="[%d/%m/%Y %H:%M:%S]"))
+    metrics_logger.addHandler(mhandler)
+
     dpy_logger = logging.getLogger("discord")
     if bot.settings.debug:
         dpy_logger.setLevel(logging.DEBUG)
@@ -591,6 +720,13 @@ def main(bot):
         bot._shutdown_mode = True
         exit(0)
 
+    if bot.settings.metrics_port:
+        try:
+            yield from bot.metrics.start_server(bot.settings.metrics_port)
+        except OSError as e:
+            bot.logger.warning("Couldn't serve metrics on port {}: {}"
+                               "".format(bot.settings.metrics_port, e))
+
     print("Logging into Discord...")
     bot.uptime = datetime.datetime.utcnow()
 
@@ -634,6 +770,11 @@ if __name__ == '__main__':
                              exc_info=e)
         loop.run_until_complete(bot.logout())
     finally:
+        bot.metrics.stop()
+        loop.run_until_complete(bot.metrics.stop_server())
+        bot.loop_monitor.stop()
+        writebehind.stop()
+        loop.run_until_complete(bot.http_client.close())
         loop.close()
         if bot._shutdown_mode is True:
             exit(0)